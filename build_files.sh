@@ -11,4 +11,6 @@ echo "Migrating database..."
 python manage.py migrate --noinput
 
 echo "Collecting static files..."
-python manage.py collectstatic --noinput
\ No newline at end of file
+python manage.py collectstatic --noinput
+echo "Generating API schema..."
+python manage.py generate_schema
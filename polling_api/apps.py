@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class PollingApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'polling_api'
+
+    def ready(self):
+        from django.conf import settings
+        from . import checks, middleware
+        from .authentication import connect_signals
+        connect_signals()
+        if settings.METRICS_ENABLED:
+            middleware.connect_signals()
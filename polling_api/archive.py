@@ -0,0 +1,64 @@
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from . import counters, rollups
+from .cache import results_cache
+from .models import Poll, Vote, VoteArchive
+
+
+def get_archivable_polls(retention_days=None):
+    """
+    Returns the polls expired for longer than the retention period that still
+    have raw votes to archive
+    """
+    if retention_days is None:
+        retention_days = settings.VOTE_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    has_votes = Exists(Vote.objects.filter(poll=OuterRef('pk')))
+    return Poll.objects.filter(Q(archived_at__isnull=True) | has_votes, expire_date__lt=cutoff).order_by('id')
+
+def archive_poll(poll, chunk_size=None):
+    """
+    Rolls the poll's raw votes up into per-option, per-day VoteArchive rows,
+    then deletes the raw votes in chunks of `chunk_size`, each in its own
+    transaction so no lock is held for long. Only votes already counted into
+    the analytics rollups are deleted, so those are caught up first. Safe to
+    rerun if interrupted. Returns the number of raw votes deleted.
+    """
+    if chunk_size is None:
+        chunk_size = settings.VOTE_ARCHIVE_CHUNK_SIZE
+
+    if poll.results_snapshot is None:
+        counters.finalize(poll)
+
+    with transaction.atomic():
+        # Lock the poll so two archivers can't both roll up its votes
+        poll = Poll.objects.select_for_update().get(pk=poll.pk)
+        if poll.archived_at is None:
+            rows = (
+                Vote.objects.filter(poll=poll)
+                .annotate(day=TruncDate('voted_at', tzinfo=dt_timezone.utc))
+                .values('option_id', 'day')
+                .annotate(votes=Count('id'))
+            )
+            VoteArchive.objects.bulk_create([
+                VoteArchive(poll=poll, option_id=row['option_id'], day=row['day'], votes=row['votes'])
+                for row in rows
+            ])
+            poll.archived_at = timezone.now()
+            poll.save(update_fields=['archived_at'])
+            # Lets clients cache the poll for longer, now that it can't change
+            results_cache.invalidate(poll.id)
+
+    rollups.catch_up(poll=poll)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(Vote.objects.filter(poll=poll, rolled_up=True).values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            deleted += Vote.objects.filter(id__in=ids).delete()[0]
+    return deleted
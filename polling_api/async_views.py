@@ -0,0 +1,164 @@
+from asgiref.sync import sync_to_async
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from . import conditional, readers, replicas, voters
+from .cache import results_cache
+from .models import Poll
+from .serializers import VoteSerializer
+from .utils import get_ip_hash
+from .views import PollViewSet
+
+
+class AsyncDispatchMixin:
+    """
+    Dispatches viewset actions written as coroutines natively, and runs the
+    remaining sync actions in a thread.
+
+    Authentication, permissions and throttling are the same sync DRF checks,
+    run in a thread before the action.
+    """
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        return markcoroutinefunction(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncPollViewSet(AsyncDispatchMixin, PollViewSet):
+    """
+    API endpoints for Polls CRUD, with async list, retrieve, vote and results
+    """
+    async def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        rows = self.get_list_rows(queryset)
+        page = await sync_to_async(self.paginate_queryset)(rows)
+        if page is None:
+            return Response(await readers.aserialize_polls([row async for row in rows]))
+        if replicas.get_replica() is not None or not conditional.is_enabled():
+            return self.get_paginated_response(await readers.aserialize_polls(page))
+
+        versions = await results_cache.aget_versions([row['id'] for row in page])
+        etag = conditional.get_list_validator(request, versions)
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            response = self.get_paginated_response(await readers.aserialize_polls(page))
+        return conditional.add_validators(response, etag)
+
+    async def retrieve(self, request, *args, **kwargs):
+        async def compute():
+            try:
+                row = await readers.get_poll_rows(self.get_queryset()).aget(pk=kwargs['pk'])
+            except Poll.DoesNotExist:
+                raise Http404('No Poll matches the given query.')
+            return (await readers.aserialize_polls([row]))[0]
+
+        return await self.aget_cached_response('poll', int(kwargs['pk']), compute)
+
+    async def aget_cached_response(self, kind, poll_id, compute):
+        """
+        Async variant of `get_cached_response`, awaiting the coroutine function `compute` on a miss
+        """
+        version = await results_cache.aget_version(poll_id, exists=Poll.objects.filter(pk=poll_id).aexists)
+        if version is None:
+            raise Http404('No Poll matches the given query.')
+        etag = conditional.get_validator(self.request, kind, poll_id, version)
+        response = conditional.not_modified(self.request, etag)
+        if response is None:
+            with replicas.primary():
+                data = await results_cache.aget_or_set(kind, poll_id, compute, version=version)
+            response = Response(data)
+        else:
+            data = await results_cache.apeek(kind, poll_id, version)
+
+        async def is_archived():
+            with replicas.primary():
+                return await results_cache.aget_or_set(
+                    'archived', poll_id, Poll.objects.filter(pk=poll_id, archived_at__isnull=False).aexists,
+                    version=version,
+                )
+
+        max_age = await conditional.aget_max_age(data, is_archived)
+        return conditional.add_validators(response, etag, max_age)
+
+    @action(detail=True, methods=['POST'])
+    async def vote(self, request, pk=None):
+        """
+        API endpoint for voting in a poll
+        """
+        user = request.user
+        voter_id = None
+        if not user or not user.is_authenticated or user.is_anonymous:
+            user = None
+            request.data['ip_hash'] = get_ip_hash(request.META['REMOTE_ADDR'])
+
+            if settings.ANONYMOUS_VOTER_TOKENS:
+                session_id = voters.get_voter_id(request)
+                if not session_id:
+                    session_id = voter_id = voters.new_voter_id(request)
+            else:
+                session_id = request.session.session_key
+                if not session_id:
+                    await request.session.acreate()
+                    session_id = request.session.session_key
+            request.data['session_id'] = session_id
+
+        serializer = VoteSerializer(data=request.data, context={'poll_id': int(pk), 'user': user})
+        if serializer.is_valid():
+            if settings.VOTE_INGEST_MODE == 'buffered':
+                await sync_to_async(serializer.enqueue)()
+                response = Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+            else:
+                await sync_to_async(serializer.save)()
+                response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        else:
+            response = Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if voter_id:
+            voters.set_voter_token(response, voter_id)
+        return response
+
+    @action(detail=True, methods=['GET'])
+    async def results(self, request, pk=None):
+        """
+        API endpoint for viewing poll results
+        """
+        async def compute():
+            try:
+                row = await readers.get_results_rows(Poll.objects.all()).aget(pk=pk)
+            except Poll.DoesNotExist:
+                raise Http404('No Poll matches the given query.')
+            return await readers.aserialize_results(row)
+
+        return await self.aget_cached_response('results', int(pk), compute)
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# User fields requests read, for permissions, throttles and ownership
+# checks. Others, like the password hash, stay out of the cache and are
+# loaded from the database if something reads them.
+CACHED_FIELDS = ['username', 'is_active', 'is_staff', 'is_superuser']
+
+
+def get_revoke_claim(password):
+    """
+    Returns the claim tokens issued for a user with the `password` hash carry
+    when CHECK_REVOKE_TOKEN is on, or None
+    """
+    if api_settings.CHECK_REVOKE_TOKEN:
+        return get_md5_hash_password(password)
+    return None
+
+def get_cache_key(user_id, revoke_claim=None):
+    # Tokens issued before a password change map to another entry, which is
+    # only ever stored after JWTAuthentication checked the claim
+    return f'jwt-user:{user_id}:{revoke_claim or ""}'
+
+def get_cache():
+    return caches[settings.JWT_USER_CACHE_ALIAS]
+
+def get_cached_fields(user_model):
+    # In the model's field order, as Model.from_db expects
+    names = {api_settings.USER_ID_FIELD, *CACHED_FIELDS}
+    return [field.attname for field in user_model._meta.concrete_fields if field.attname in names]
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps the fields requests need of the users it
+    loads in the cache for JWT_USER_CACHE_TIMEOUT seconds, keyed by the
+    token's user id and revoke claims, so requests with a valid access token
+    don't query the user table. Saving or deleting a user evicts it.
+    Behaves like JWTAuthentication while JWT_USER_CACHE_TIMEOUT is 0.
+    """
+    def get_user(self, validated_token):
+        timeout = settings.JWT_USER_CACHE_TIMEOUT
+        if not timeout:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        revoke_claim = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) if api_settings.CHECK_REVOKE_TOKEN else None
+        key = get_cache_key(user_id, revoke_claim)
+        fields = get_cached_fields(self.user_model)
+        values = get_cache().get(key)
+        if values is None:
+            user = super().get_user(validated_token)
+            get_cache().set(key, [getattr(user, name) for name in fields], timeout)
+            return user
+
+        # Fields left out are deferred, so saving the user only writes the cached ones
+        user = self.user_model.from_db(None, fields, values)
+        # The check JWTAuthentication makes on freshly loaded users
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+def remember_revoke_claim(sender, instance, update_fields=None, **kwargs):
+    """
+    Notes the revoke claim of a user's tokens before a password change, for
+    `invalidate_user` to evict their entry too
+    """
+    if not settings.JWT_USER_CACHE_TIMEOUT or not api_settings.CHECK_REVOKE_TOKEN or instance.pk is None:
+        return
+    if update_fields is not None and 'password' not in update_fields:
+        return
+    password = sender._default_manager.filter(pk=instance.pk).values_list('password', flat=True).first()
+    if password is not None and password != instance.password:
+        instance._previous_revoke_claim = get_revoke_claim(password)
+
+def invalidate_user(sender, instance, **kwargs):
+    """
+    Evicts a saved or deleted user from the cache, covering profile updates,
+    password resets and deactivation from anywhere that saves the user
+    """
+    if settings.JWT_USER_CACHE_TIMEOUT:
+        user_id = getattr(instance, api_settings.USER_ID_FIELD)
+        claims = {get_revoke_claim(instance.password), instance.__dict__.pop('_previous_revoke_claim', None)}
+        keys = [get_cache_key(user_id, claim) for claim in claims]
+        # After the commit, or a request in between could cache the old row again
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+def connect_signals():
+    user_model = get_user_model()
+    pre_save.connect(remember_revoke_claim, sender=user_model, dispatch_uid='polling_api.remember_revoke_claim')
+    post_save.connect(invalidate_user, sender=user_model, dispatch_uid='polling_api.invalidate_user')
+    post_delete.connect(invalidate_user, sender=user_model, dispatch_uid='polling_api.invalidate_user')
@@ -0,0 +1,168 @@
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import serializers, tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from .cache import MISSING, LRUCache, is_shared, runs_several_processes
+
+GENERATION_KEY = 'jwt-blacklist:generation'
+
+
+class BloomFilter:
+    """
+    Set membership with no false negatives and a `false_positive_rate`
+    chance of false positives, in about 1.2 bytes per item at 1%
+    """
+    def __init__(self, capacity, false_positive_rate=0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class TokenBlacklist:
+    """
+    Answers "is this refresh token blacklisted?" mostly from memory.
+
+    A Bloom filter holds the jtis of every unexpired blacklisted token, so
+    tokens it has never seen are let through without a query. The rare jtis
+    it flags by mistake are checked against the database once, then
+    remembered in an LRU of known-good jtis.
+
+    The filter is built from the table on first use, and picks up tokens
+    blacklisted since (by any process) every JWT_BLACKLIST_SYNC_INTERVAL
+    seconds, or straight away when the shared cache says another process
+    blacklisted one. Without a shared cache, several processes would keep
+    accepting a token another one just blacklisted, so every check goes to
+    the database instead.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._known_good = LRUCache(settings.JWT_BLACKLIST_KNOWN_GOOD_SIZE)
+        self._last_id = 0
+        self._synced_at = 0
+        self._generation = None
+        self.hits = 0
+        self.queries = 0
+
+    @property
+    def cache(self):
+        return caches[settings.JWT_BLACKLIST_CACHE_ALIAS]
+
+    @property
+    def enabled(self):
+        return is_shared(settings.JWT_BLACKLIST_CACHE_ALIAS) or not runs_several_processes()
+
+    def contains(self, jti):
+        if not self.enabled:
+            self.queries += 1
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+        self.sync()
+        if jti not in self._filter:
+            self.hits += 1
+            return False
+        if self._known_good.get(jti) is not MISSING:
+            self.hits += 1
+            return False
+
+        self.queries += 1
+        if BlacklistedToken.objects.filter(token__jti=jti).exists():
+            return True
+        self._known_good.set(jti, True, api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+        return False
+
+    def add(self, jti):
+        """
+        Records a token this process just blacklisted, and tells the other
+        processes to sync
+        """
+        if not self.enabled:
+            return
+        self.sync()
+        with self._lock:
+            self._filter.add(jti)
+            self._known_good.delete(jti)
+        try:
+            self.cache.incr(GENERATION_KEY)
+        except ValueError:
+            self.cache.add(GENERATION_KEY, 1, None)
+
+    def sync(self):
+        generation = self.cache.get(GENERATION_KEY)
+        stale = time.monotonic() - self._synced_at >= settings.JWT_BLACKLIST_SYNC_INTERVAL
+        if self._filter is not None and generation == self._generation and not stale:
+            return
+
+        with self._lock:
+            if self._filter is None:
+                self.rebuild()
+            else:
+                self.load(BlacklistedToken.objects.filter(id__gt=self._last_id))
+            self._generation = generation
+            self._synced_at = time.monotonic()
+
+    def rebuild(self):
+        blacklisted = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        capacity = max(settings.JWT_BLACKLIST_CAPACITY, blacklisted.count() * 2)
+        self._filter = BloomFilter(capacity)
+        self._last_id = 0
+        self.load(blacklisted)
+
+    def load(self, blacklisted):
+        for blacklisted_id, jti in blacklisted.order_by('id').values_list('id', 'token__jti').iterator():
+            self._filter.add(jti)
+            self._known_good.delete(jti)
+            self._last_id = max(self._last_id, blacklisted_id)
+        if self._filter.count > self._filter.capacity:
+            # Too full to keep false positives rare; start again at twice the size
+            self.rebuild()
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._known_good.clear()
+
+
+token_blacklist = TokenBlacklist()
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh token whose blacklist checks go through `token_blacklist`
+    """
+    def check_blacklist(self):
+        if token_blacklist.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        token_blacklist.add(self.payload[api_settings.JTI_CLAIM])
+        return result
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
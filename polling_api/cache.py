@@ -0,0 +1,308 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+MISSING = object()
+
+# Cache backends whose entries only the process that stored them can see
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared(alias):
+    """
+    Returns whether every process of the API sees the entries of the cache `alias`
+    """
+    return settings.CACHES[alias]['BACKEND'] not in PER_PROCESS_CACHES
+
+def runs_several_processes():
+    """
+    Returns whether the API may be served by more than one process at a time
+    """
+    return settings.SERVERLESS or settings.WEB_CONCURRENCY > 1
+
+
+class LRUCache:
+    """
+    Small thread-safe in-process LRU cache with a per-entry TTL
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = MISSING
+
+
+class ResultsCache:
+    """
+    Caches serialized poll payloads keyed by poll id and poll version.
+
+    Lookups go through an in-process LRU, then the Django cache. Bumping a
+    poll's version (see `invalidate`) orphans every payload cached for it.
+    Concurrent misses on the same key in a process are coalesced so the
+    payload is computed once.
+    """
+    def __init__(self):
+        self._local = None
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    @property
+    def backend(self):
+        return caches[settings.RESULTS_CACHE_ALIAS]
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LRUCache(settings.RESULTS_CACHE_LOCAL_SIZE)
+        return self._local
+
+    def _version_key(self, poll_id):
+        return f'polls:{poll_id}:version'
+
+    def get_version(self, poll_id, exists=None):
+        """
+        Returns the poll's current version, the time in nanoseconds of its last
+        change. A missing version is created, unless `exists` is given and says
+        the poll doesn't exist, in which case None is returned.
+        """
+        key = self._version_key(poll_id)
+        version = self.backend.get(key)
+        if version is None:
+            if exists is not None and not exists():
+                return None
+            version = time.time_ns()
+            self.backend.add(key, version, settings.RESULTS_CACHE_VERSION_TIMEOUT)
+            version = self.backend.get(key, version)
+        return version
+
+    def get_versions(self, poll_ids):
+        """
+        Returns a dict of poll id to version, in the order of `poll_ids`, fetched in one cache round trip
+        """
+        keys = {self._version_key(poll_id): poll_id for poll_id in poll_ids}
+        found = self.backend.get_many(keys)
+        versions = {}
+        for key, poll_id in keys.items():
+            version = found.get(key)
+            versions[poll_id] = self.get_version(poll_id) if version is None else version
+        return versions
+
+    def invalidate(self, poll_id):
+        """
+        Bumps the poll's version once the current transaction commits
+        """
+        def bump():
+            self.backend.set(self._version_key(poll_id), time.time_ns(), settings.RESULTS_CACHE_VERSION_TIMEOUT)
+            self.record('invalidations')
+        transaction.on_commit(bump)
+
+    def peek(self, kind, poll_id, version):
+        """
+        Returns the cached `kind` payload for the poll at `version`, or MISSING
+        """
+        key = f'polls:{poll_id}:{kind}:{version}'
+        value = self.local.get(key)
+        if value is MISSING:
+            value = self.backend.get(key, MISSING)
+        return value
+
+    def get_or_set(self, kind, poll_id, compute, version=None):
+        """
+        Returns the cached `kind` payload for the poll, calling `compute` on a miss.
+        Pass `version` to read the payload of a version fetched earlier.
+        """
+        if version is None:
+            version = self.get_version(poll_id)
+        key = f'polls:{poll_id}:{kind}:{version}'
+
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.record('hits', 'local_hits')
+            return value
+
+        value = self.backend.get(key, MISSING)
+        if value is not MISSING:
+            self.record('hits')
+            self.local.set(key, value, settings.RESULTS_CACHE_TIMEOUT)
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.event.wait(settings.RESULTS_CACHE_TIMEOUT)
+            if flight.value is not MISSING:
+                self.record('coalesced')
+                return flight.value
+            # The leader failed; compute our own copy
+            return compute()
+
+        self.record('misses')
+        try:
+            value = compute()
+            self.backend.set(key, value, settings.RESULTS_CACHE_TIMEOUT)
+            self.local.set(key, value, settings.RESULTS_CACHE_TIMEOUT)
+            flight.value = value
+        finally:
+            flight.event.set()
+            with self._lock:
+                del self._flights[key]
+        return value
+
+    async def aget_version(self, poll_id, exists=None):
+        """
+        Async variant of `get_version`, awaiting the coroutine function `exists`
+        """
+        key = self._version_key(poll_id)
+        version = await self.backend.aget(key)
+        if version is None:
+            if exists is not None and not await exists():
+                return None
+            version = time.time_ns()
+            await self.backend.aadd(key, version, settings.RESULTS_CACHE_VERSION_TIMEOUT)
+            version = await self.backend.aget(key, version)
+        return version
+
+    async def aget_versions(self, poll_ids):
+        """
+        Async variant of `get_versions`
+        """
+        keys = {self._version_key(poll_id): poll_id for poll_id in poll_ids}
+        found = await self.backend.aget_many(keys)
+        versions = {}
+        for key, poll_id in keys.items():
+            version = found.get(key)
+            versions[poll_id] = await self.aget_version(poll_id) if version is None else version
+        return versions
+
+    async def apeek(self, kind, poll_id, version):
+        """
+        Async variant of `peek`
+        """
+        key = f'polls:{poll_id}:{kind}:{version}'
+        value = self.local.get(key)
+        if value is MISSING:
+            value = await self.backend.aget(key, MISSING)
+        return value
+
+    async def aget_or_set(self, kind, poll_id, compute, version=None):
+        """
+        Async variant of `get_or_set`, awaiting the coroutine function `compute` on a miss
+        """
+        if version is None:
+            version = await self.aget_version(poll_id)
+        key = f'polls:{poll_id}:{kind}:{version}'
+
+        value = self.local.get(key)
+        if value is not MISSING:
+            self.record('hits', 'local_hits')
+            return value
+
+        value = await self.backend.aget(key, MISSING)
+        if value is not MISSING:
+            self.record('hits')
+            self.local.set(key, value, settings.RESULTS_CACHE_TIMEOUT)
+            return value
+
+        loop = asyncio.get_running_loop()
+        flight = self._async_flights.get((loop, key))
+        if flight is not None:
+            self.record('coalesced')
+            return await asyncio.shield(flight)
+
+        flight = self._async_flights[(loop, key)] = loop.create_future()
+        self.record('misses')
+        try:
+            value = await compute()
+            await self.backend.aset(key, value, settings.RESULTS_CACHE_TIMEOUT)
+            self.local.set(key, value, settings.RESULTS_CACHE_TIMEOUT)
+            flight.set_result(value)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            flight.exception()
+            raise
+        finally:
+            del self._async_flights[(loop, key)]
+        return value
+
+    def record(self, *counters):
+        """
+        Adds one to each of the named stats counters, e.g. 'hits'
+        """
+        with self._stats_lock:
+            for counter in counters:
+                setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'hits': self.hits,
+                'local_hits': self.local_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'invalidations': self.invalidations,
+                'local_size': len(self.local),
+                'local_maxsize': self.local.maxsize,
+                'local_evictions': self.local.evictions,
+            }
+
+
+results_cache = ResultsCache()
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core import checks
+from .cache import is_shared, runs_several_processes
+
+
+def describe_processes():
+    if settings.SERVERLESS:
+        return 'the API runs on a serverless platform, where every instance is a separate process'
+    return f'WEB_CONCURRENCY is {settings.WEB_CONCURRENCY}'
+
+
+@checks.register(checks.Tags.caches)
+def check_results_cache(app_configs, **kwargs):
+    errors = []
+    if settings.RESULTS_CACHE_VERSION_TIMEOUT <= settings.RESULTS_CACHE_TIMEOUT:
+        errors.append(checks.Warning(
+            'RESULTS_CACHE_VERSION_TIMEOUT is not longer than RESULTS_CACHE_TIMEOUT.',
+            hint='Expired poll versions orphan the payloads cached under them; raise RESULTS_CACHE_VERSION_TIMEOUT.',
+            id='polling_api.W002',
+        ))
+    if not is_shared(settings.RESULTS_CACHE_ALIAS) and runs_several_processes():
+        # Poll ETags are built from these versions too, so a client revalidating
+        # against another process would get a 304 for stale results
+        errors.append(checks.Error(
+            f'The results cache ({settings.RESULTS_CACHE_ALIAS!r}) is per process, but {describe_processes()}: '
+            'a vote only changes the cached results and ETags of the process that took it.',
+            hint='Point CACHE_URL at a cache shared by every process, such as Redis or Memcached.',
+            id='polling_api.E001',
+        ))
+    return errors
+
+
+@checks.register()
+def check_vote_ingest(app_configs, **kwargs):
+    if settings.VOTE_INGEST_MODE == 'buffered' and settings.SERVERLESS:
+        return [checks.Warning(
+            'Buffered votes are saved by a background thread, which a serverless platform freezes '
+            'between requests and may shut down without flushing, losing acknowledged votes.',
+            hint="Use VOTE_INGEST_MODE='sync' on serverless platforms.",
+            id='polling_api.W003',
+        )]
+    return []
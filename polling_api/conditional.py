@@ -0,0 +1,79 @@
+import hashlib
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from .cache import MISSING, is_shared, runs_several_processes
+from .models import Poll
+
+# Responses carry no Last-Modified: versions change several times a second,
+# and a one-second date would call a page current after a vote landing in
+# the same second.
+
+
+def is_enabled():
+    """
+    Returns whether responses carry ETags. They're built from the versions in
+    the results cache, so processes that each keep their own cache would hand
+    out ETags the others can't check.
+    """
+    return is_shared(settings.RESULTS_CACHE_ALIAS) or not runs_several_processes()
+
+def get_validator(request, kind, poll_id, version):
+    """
+    Returns the strong ETag of a poll's `kind` payload at `version`, in the
+    renderer negotiated for the request, or None if ETags are off
+    """
+    if not is_enabled():
+        return None
+    return f'"{kind}-{poll_id}-{version}-{request.accepted_renderer.format}"'
+
+def get_list_validator(request, versions):
+    """
+    Returns the strong ETag of a page of polls, given a dict of poll id to
+    version for the polls on the page
+    """
+    digest = hashlib.sha256(request.get_full_path().encode())
+    digest.update(request.accepted_renderer.format.encode())
+    for poll_id, version in versions.items():
+        digest.update(f'{poll_id}:{version};'.encode())
+    return f'"list-{digest.hexdigest()[:32]}"'
+
+def is_closed(data):
+    return data is not MISSING and Poll(expire_date=parse_datetime(data['expire_date'])).is_closed()
+
+def get_max_age(data, is_archived):
+    """
+    Returns how many seconds the payload of a poll may be cached, or None
+    while it can still change: closed polls can be edited and reopened until
+    they are archived. `is_archived` is only called for closed polls.
+    """
+    if not is_closed(data) or not is_archived():
+        return None
+    return settings.CLOSED_POLL_MAX_AGE
+
+async def aget_max_age(data, is_archived):
+    """
+    Async variant of `get_max_age`, awaiting the coroutine function `is_archived`
+    """
+    if not is_closed(data) or not await is_archived():
+        return None
+    return settings.CLOSED_POLL_MAX_AGE
+
+def not_modified(request, etag):
+    """
+    Returns a 304 (or 412) response if the request's conditional headers
+    match the ETag, or None if the full response should be sent
+    """
+    if etag is None:
+        return None
+    return get_conditional_response(request, etag=etag)
+
+def add_validators(response, etag, max_age=None):
+    if etag is not None:
+        response['ETag'] = etag
+    if max_age is None:
+        # Allow storing, but make clients revalidate before reusing it
+        response['Cache-Control'] = 'no-cache'
+    else:
+        response['Cache-Control'] = f'public, max-age={max_age}'
+    return response
@@ -0,0 +1,144 @@
+import random
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from .models import Option, Poll, Vote, VoteArchive, VoteCounter
+
+
+def get_shard_count():
+    return max(1, getattr(settings, 'VOTE_COUNTER_SHARDS', 1))
+
+def increment(poll_id, option_id, amount=1):
+    """
+    Adds `amount` votes to a random shard of the option's counter.
+    Must run inside the transaction that inserts the votes.
+    """
+    shard = random.randrange(get_shard_count())
+    counters = VoteCounter.objects.filter(option_id=option_id, shard=shard)
+    if counters.update(votes=F('votes') + amount):
+        return
+
+    try:
+        with transaction.atomic():
+            VoteCounter.objects.create(poll_id=poll_id, option_id=option_id, shard=shard, votes=amount)
+    except IntegrityError:
+        # Another voter created the shard first
+        counters.update(votes=F('votes') + amount)
+
+def get_option_counts(poll):
+    """
+    Returns a dict of option id to vote count, summed over all shards
+    """
+    if not hasattr(poll, '_option_counts'):
+        rows = VoteCounter.objects.filter(poll=poll).values('option_id').annotate(votes=Sum('votes'))
+        poll._option_counts = {row['option_id']: row['votes'] for row in rows}
+    return poll._option_counts
+
+def get_results(poll):
+    """
+    Returns a list of options and their vote counts
+    """
+    if poll.results_snapshot is not None:
+        return poll.results_snapshot['results']
+    counts = get_option_counts(poll)
+    options = sorted(poll.options.all(), key=lambda opt: opt.id)
+    return [{'id': opt.id, 'text': opt.text, 'votes': counts.get(opt.id, 0)} for opt in options]
+
+async def aget_option_counts(poll_id):
+    """
+    Async variant of `get_option_counts` for a poll id
+    """
+    rows = VoteCounter.objects.filter(poll_id=poll_id).values('option_id').annotate(votes=Sum('votes'))
+    return {row['option_id']: row['votes'] async for row in rows}
+
+async def aget_results(poll_id):
+    """
+    Async variant of `get_results` for a poll id
+    """
+    counts = await aget_option_counts(poll_id)
+    options = Option.objects.filter(poll_id=poll_id).order_by('id').values('id', 'text')
+    return [{'id': opt['id'], 'text': opt['text'], 'votes': counts.get(opt['id'], 0)} async for opt in options]
+
+def get_total_votes(poll):
+    if poll.results_snapshot is not None:
+        return poll.results_snapshot['total_votes']
+    return sum(get_option_counts(poll).values())
+
+def finalize(poll):
+    """
+    Freezes the results of a closed poll into its results snapshot, counted
+    from the Vote table. Does nothing if another process got there first.
+    """
+    counts = count_votes(poll)
+    options = Option.objects.filter(poll=poll).order_by('id').values('id', 'text')
+    results = [{'id': opt['id'], 'text': opt['text'], 'votes': counts.get(opt['id'], 0)} for opt in options]
+    snapshot = {'results': results, 'total_votes': sum(counts.values())}
+
+    finalized_at = timezone.now()
+    if Poll.objects.filter(pk=poll.pk, results_snapshot__isnull=True).update(
+        results_snapshot=snapshot, finalized_at=finalized_at,
+    ):
+        poll.results_snapshot = snapshot
+        poll.finalized_at = finalized_at
+    else:
+        poll.refresh_from_db(fields=['results_snapshot', 'finalized_at'])
+    return poll.results_snapshot
+
+def finalize_if_closed(poll):
+    """
+    Finalizes the poll on the first read after it has closed
+    """
+    if poll.results_snapshot is None and poll.is_closed():
+        finalize(poll)
+
+def count_votes(poll):
+    """
+    Counts the poll's votes per option straight from the Vote table, or from
+    the daily totals once its votes have been archived
+    """
+    if poll.archived_at is not None:
+        # Raw votes may still be mid-deletion; the archive already holds all of them
+        rows = VoteArchive.objects.filter(poll=poll).values('option_id').annotate(votes=Sum('votes'))
+    else:
+        rows = Vote.objects.filter(poll=poll).values('option_id').annotate(votes=Count('id'))
+    return {row['option_id']: row['votes'] for row in rows}
+
+def reconcile(poll, fix=True):
+    """
+    Compares the poll's counters with its Vote rows and, if `fix` is set,
+    rewrites any drifted counters from the Vote table.
+    Returns a dict of option id to (counted, actual) for every drifted option.
+    """
+    with transaction.atomic():
+        # Lock the poll's counters so votes landing mid-rebuild wait for us
+        list(VoteCounter.objects.select_for_update().filter(poll=poll).values_list('id', flat=True))
+
+        actual = count_votes(poll)
+        rows = VoteCounter.objects.filter(poll=poll).values('option_id').annotate(votes=Sum('votes'))
+        counted = {row['option_id']: row['votes'] for row in rows}
+
+        drift = {}
+        for option_id in set(actual) | set(counted):
+            if actual.get(option_id, 0) != counted.get(option_id, 0):
+                drift[option_id] = (counted.get(option_id, 0), actual.get(option_id, 0))
+
+        if fix and drift:
+            VoteCounter.objects.filter(poll=poll, option_id__in=drift).delete()
+            VoteCounter.objects.bulk_create([
+                VoteCounter(poll=poll, option_id=option_id, shard=0, votes=actual[option_id])
+                for option_id in drift if actual.get(option_id)
+            ])
+    return drift
+
+def reconcile_all(polls=None, fix=True):
+    """
+    Reconciles the counters of the given polls (all polls by default).
+    Yields (poll, drift) for every poll that had drifted.
+    """
+    if polls is None:
+        polls = Poll.objects.all()
+    for poll in polls.iterator():
+        drift = reconcile(poll, fix=fix)
+        if drift:
+            yield poll, drift
@@ -0,0 +1,117 @@
+import csv
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from . import counters
+from .models import Vote, VoteArchive
+
+VOTE_COLUMNS = ['poll_id', 'option_id', 'option', 'vote_id', 'voted_at', 'voted_by', 'votes']
+RESULT_COLUMNS = ['poll_id', 'poll', 'option_id', 'option', 'votes']
+
+# Rows are gathered into chunks of about this many bytes before being sent
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def vote_rows(polls):
+    """
+    Yields one row per vote of the given polls, then one row per option and day
+    for polls whose votes have been archived (with the day as `voted_at` and
+    the day's total as `votes`). Reads the database through a server-side
+    cursor, so memory use doesn't grow with the number of votes.
+    """
+    poll_ids = polls.values('id')
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+
+    votes = (
+        Vote.objects.filter(poll_id__in=poll_ids, poll__archived_at__isnull=True)
+        .order_by('poll_id', 'id')
+        .values_list('poll_id', 'option_id', 'option__text', 'id', 'voted_at', 'voted_by_id')
+    )
+    for poll_id, option_id, option, vote_id, voted_at, voted_by in votes.iterator(chunk_size=chunk_size):
+        yield {
+            'poll_id': poll_id, 'option_id': option_id, 'option': option, 'vote_id': vote_id,
+            'voted_at': voted_at, 'voted_by': voted_by, 'votes': 1,
+        }
+
+    archives = (
+        VoteArchive.objects.filter(poll_id__in=poll_ids)
+        .order_by('poll_id', 'day', 'option_id')
+        .values_list('poll_id', 'option_id', 'option__text', 'day', 'votes')
+    )
+    for poll_id, option_id, option, day, total in archives.iterator(chunk_size=chunk_size):
+        yield {
+            'poll_id': poll_id, 'option_id': option_id, 'option': option, 'vote_id': None,
+            'voted_at': day, 'voted_by': None, 'votes': total,
+        }
+
+def result_rows(polls):
+    """
+    Yields one row per option of the given polls with its vote count, read
+    from the results snapshot of closed polls
+    """
+    polls = polls.order_by('id').prefetch_related('options')
+    for poll in polls.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        for result in counters.get_results(poll):
+            yield {
+                'poll_id': poll.id, 'poll': poll.title, 'option_id': result['id'],
+                'option': result['text'], 'votes': result['votes'],
+            }
+
+def stream_csv(columns, rows):
+    buffer = _Echo()
+    writer = csv.writer(buffer)
+    chunk = [writer.writerow(columns)]
+    size = 0
+    for row in rows:
+        line = writer.writerow([_csv_value(row[column]) for column in columns])
+        chunk.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+def stream_ndjson(rows):
+    encoder = DjangoJSONEncoder()
+    chunk = []
+    size = 0
+    for row in rows:
+        line = encoder.encode(row) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+async def aiterate(chunks):
+    """
+    Async iterator over the chunks of `stream_csv` or `stream_ndjson`,
+    advancing them in the thread the sync ORM runs in
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """
+    File-like object handing back what csv.writer writes to it
+    """
+    def write(self, value):
+        return value
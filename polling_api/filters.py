@@ -1,6 +1,7 @@
 from django_filters import rest_framework as filters
 from django.utils import timezone
 from .models import Poll
+from .search import search_polls
 
 class PollFilter(filters.FilterSet):
     """
@@ -9,6 +10,7 @@ class PollFilter(filters.FilterSet):
     title = filters.CharFilter(lookup_expr='icontains')
     created_by = filters.NumberFilter(field_name='created_by__id')
     is_ongoing = filters.BooleanFilter(method='filter_ongoing')
+    search = filters.CharFilter(method='filter_search')
     
     class Meta:
         model = Poll
@@ -17,4 +19,7 @@ class PollFilter(filters.FilterSet):
     def filter_ongoing(self, queryset, name, value):
         if value:
             return queryset.filter(expire_date__gte=timezone.now())
-        return queryset.filter(expire_date__lt=timezone.now())
\ No newline at end of file
+        return queryset.filter(expire_date__lt=timezone.now())
+
+    def filter_search(self, queryset, name, value):
+        return search_polls(queryset, value)
\ No newline at end of file
@@ -0,0 +1,260 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from . import counters, pubsub, rollups
+from .cache import LRUCache, MISSING, results_cache
+from .models import Option, Poll, Vote
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class VoteRejected(Exception):
+    pass
+
+
+class BufferFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many votes are waiting to be saved, try again shortly.'
+    default_code = 'buffer_full'
+
+
+def voter_key(vote):
+    if vote.voted_by_id:
+        return (vote.poll_id, 'user', vote.voted_by_id)
+    return (vote.poll_id, 'anonymous', vote.ip_hash, vote.session_id)
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for votes.
+
+    `submit` checks a vote against cached poll metadata and queues it; a
+    background thread inserts queued votes in bulk once `batch_size` votes
+    are waiting or the oldest has waited `max_age` seconds. The unique
+    constraints on Vote still decide which votes are kept. Between batches
+    the thread also brings the vote rollups up to date.
+    """
+    def __init__(self, max_size, batch_size, max_age, meta_timeout):
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.meta_timeout = meta_timeout
+        self.saved = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._meta = LRUCache(1024)
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def get_poll_meta(self, poll_id):
+        """
+        Returns the poll's expiry date and option ids, cached for `meta_timeout` seconds
+        """
+        meta = self._meta.get(poll_id)
+        if meta is MISSING:
+            expire_date = Poll.objects.filter(pk=poll_id).values_list('expire_date', flat=True).first()
+            if expire_date is None:
+                raise Http404('No Poll matches the given query.')
+            option_ids = frozenset(Option.objects.filter(poll_id=poll_id).values_list('id', flat=True))
+            meta = (expire_date, option_ids)
+            self._meta.set(poll_id, meta, self.meta_timeout)
+        return meta
+
+    def submit(self, vote):
+        """
+        Queues an unsaved vote, raising VoteRejected if it is invalid or
+        BufferFull if the queue has no room
+        """
+        expire_date, option_ids = self.get_poll_meta(vote.poll_id)
+        if expire_date < timezone.now():
+            raise VoteRejected("This poll has already expired")
+        if vote.option_id not in option_ids:
+            raise VoteRejected("This option is not part of the poll")
+
+        key = voter_key(vote)
+        with self._lock:
+            if key in self._pending:
+                raise VoteRejected("You have already voted in this poll")
+            try:
+                self._queue.put_nowait(vote)
+            except queue.Full:
+                raise BufferFull()
+            self._pending.add(key)
+        self.start()
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+                    self._thread.start()
+
+    def _take_batch(self):
+        batch = []
+        vote = self._queue.get()
+        deadline = time.monotonic() + self.max_age
+        while vote is not _STOP:
+            batch.append(vote)
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                break
+            try:
+                vote = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        else:
+            self._stopping.set()
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take_batch()
+            if batch:
+                close_old_connections()
+                self.save(batch)
+                rollups.maybe_catch_up()
+        connection.close()
+
+    def drain(self):
+        """
+        Saves everything still queued in the calling thread
+        """
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.save(batch)
+
+    def close(self, timeout=5):
+        """
+        Stops the flusher thread and saves whatever is left in the queue
+        """
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            self._stopping.set()
+        self._thread.join(timeout)
+        self.drain()
+
+    def save(self, batch):
+        """
+        Flushes a batch of acknowledged votes, retrying it VOTE_BUFFER_RETRIES
+        times on errors such as a dropped connection. Logs each vote if the
+        batch still can't be saved, since those are lost.
+        """
+        try:
+            for attempt in range(settings.VOTE_BUFFER_RETRIES + 1):
+                try:
+                    self.flush(batch)
+                    return
+                except Exception:
+                    if attempt == settings.VOTE_BUFFER_RETRIES:
+                        break
+                    logger.warning('Failed to save a batch of %d votes, retrying', len(batch), exc_info=True)
+                    if not connection.in_atomic_block:
+                        # Reconnect in case the connection is what failed
+                        connection.close()
+                    time.sleep(settings.VOTE_BUFFER_RETRY_DELAY * 2 ** attempt)
+
+            logger.exception('Failed to save a batch of %d votes, losing them', len(batch))
+            for vote in batch:
+                logger.error(
+                    'Lost vote: poll %s, option %s, voted at %s by %s', vote.poll_id, vote.option_id,
+                    vote.voted_at.isoformat(), f'user {vote.voted_by_id}' if vote.voted_by_id else 'an anonymous voter',
+                )
+            self.dropped += len(batch)
+        finally:
+            with self._lock:
+                self._pending.difference_update(voter_key(v) for v in batch)
+
+    def flush(self, batch):
+        """
+        Saves a batch of votes in one transaction, dropping any the database
+        would reject
+        """
+        with transaction.atomic():
+            # Votes cast since the filter ran can still conflict, so only
+            # what was actually inserted is counted
+            inserted = Vote.objects.insert_new(self._filter_valid(batch))
+
+            deltas = defaultdict(dict)
+            for (poll_id, option_id), amount in Counter(inserted).items():
+                counters.increment(poll_id, option_id, amount)
+                deltas[poll_id][option_id] = amount
+            for poll_id, poll_deltas in deltas.items():
+                results_cache.invalidate(poll_id)
+                pubsub.publish_votes(poll_id, poll_deltas)
+        self.saved += len(inserted)
+        self.dropped += len(batch) - len(inserted)
+        self.batches += 1
+
+    def _filter_valid(self, batch):
+        """
+        Drops votes whose option was removed or moved since they were queued,
+        votes cast after their poll expired (it may have been edited), and
+        repeat votes, in two queries for the whole batch
+        """
+        options = {
+            option_id: (poll_id, expire_date)
+            for option_id, poll_id, expire_date in Option.objects.filter(id__in={v.option_id for v in batch})
+            .values_list('id', 'poll_id', 'poll__expire_date')
+        }
+        # Compared with when each vote was cast, not now: votes acknowledged
+        # just before the poll closed still count
+        votes = [
+            v for v in batch
+            if v.option_id in options and options[v.option_id][0] == v.poll_id and v.voted_at <= options[v.option_id][1]
+        ]
+
+        voters = Q()
+        for poll_id in {v.poll_id for v in votes}:
+            users = {v.voted_by_id for v in votes if v.poll_id == poll_id and v.voted_by_id}
+            sessions = {v.session_id for v in votes if v.poll_id == poll_id and not v.voted_by_id}
+            voters |= Q(poll_id=poll_id) & (Q(voted_by_id__in=users) | Q(session_id__in=sessions))
+        existing = set()
+        if votes:
+            for poll_id, voted_by_id, ip_hash, session_id in Vote.objects.filter(voters).values_list(
+                'poll_id', 'voted_by_id', 'ip_hash', 'session_id'
+            ):
+                if voted_by_id:
+                    existing.add((poll_id, 'user', voted_by_id))
+                else:
+                    existing.add((poll_id, 'anonymous', ip_hash, session_id))
+
+        unique = {}
+        for vote in votes:
+            key = voter_key(vote)
+            if key not in existing and key not in unique:
+                unique[key] = vote
+        return list(unique.values())
+
+
+vote_buffer = VoteBuffer(
+    max_size=settings.VOTE_BUFFER_SIZE,
+    batch_size=settings.VOTE_BUFFER_BATCH_SIZE,
+    max_age=settings.VOTE_BUFFER_MAX_AGE,
+    meta_timeout=settings.VOTE_BUFFER_META_TIMEOUT,
+)
+atexit.register(vote_buffer.close)
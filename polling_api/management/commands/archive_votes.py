@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from polling_api.archive import archive_poll, get_archivable_polls
+
+
+class Command(BaseCommand):
+    help = (
+        'Rolls the raw votes of polls expired for longer than the retention period up into '
+        'daily per-option totals, then deletes the raw votes in chunks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days', type=int, default=settings.VOTE_RETENTION_DAYS,
+            help='Only archive polls expired for longer than this',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.VOTE_ARCHIVE_CHUNK_SIZE,
+            help='Raw votes deleted per transaction',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List the polls that would be archived')
+
+    def handle(self, *args, **options):
+        polls = get_archivable_polls(options['retention_days'])
+        if options['dry_run']:
+            for poll in polls:
+                self.stdout.write(f'Poll {poll.id} expired {poll.expire_date:%Y-%m-%d}')
+            return
+
+        archived = deleted = 0
+        for poll in polls.iterator():
+            deleted += archive_poll(poll, options['chunk_size'])
+            archived += 1
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} poll(s), deleting {deleted} raw vote(s)'))
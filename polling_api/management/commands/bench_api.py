@@ -0,0 +1,194 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+from polling_api.metrics import get_pool_stats
+from polling_api.models import Option, Poll, VoteCounter
+from .seed_polls import PASSWORD, USERNAME_PREFIX
+
+SCENARIOS = ['list', 'retrieve', 'results', 'vote', 'login', 'refresh']
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives the poll and auth endpoints in-process against the configured database and '
+        'reports throughput, latency percentiles and queries per request. Run seed_polls first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS, help='Endpoints to drive')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests sent first per scenario')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for picking polls, options and users')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('Send at least 2 requests per scenario')
+
+        self.rng = random.Random(options['seed'])
+        self.load_dataset()
+
+        results = {}
+        for index, scenario in enumerate(options['scenarios']):
+            make_request = getattr(self, f'request_{scenario}')
+            self.run(index, make_request, options['warmup'])
+            results[scenario] = self.summarize(*self.run(index, make_request, options['requests']))
+
+        report = {
+            'commit': self.get_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'settings': {
+                'ASYNC_VIEWS': settings.ASYNC_VIEWS,
+                'VOTE_INGEST_MODE': settings.VOTE_INGEST_MODE,
+                'ANONYMOUS_VOTER_TOKENS': settings.ANONYMOUS_VOTER_TOKENS,
+                'METRICS_ENABLED': settings.METRICS_ENABLED,
+                'CACHE_BACKEND': settings.CACHES['default']['BACKEND'],
+                'CONN_MAX_AGE': connection.settings_dict['CONN_MAX_AGE'],
+                'DB_POOL': connection.settings_dict['OPTIONS'].get('pool') or None,
+            },
+            'dataset': {'polls': len(self.polls), 'users': len(self.users)},
+            'scenarios': results,
+        }
+        self.print_report(report, self.load_baseline(options['compare']))
+        for alias, stats in get_pool_stats().items():
+            self.stdout.write(
+                f'Pool {alias}: {stats.get("connections_num", 0)} connections opened, '
+                f'{stats.get("requests_num", 0)} checkouts, {stats.get("requests_queued", 0)} waited '
+                f'{stats.get("requests_wait_ms", 0)} ms in total'
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote results to {options["output"]}'))
+
+    def load_dataset(self):
+        self.polls = list(Poll.objects.order_by('id').values_list('id', 'expire_date'))
+        self.users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('id', 'username'))
+        if not self.polls or not self.users:
+            raise CommandError('Seed a dataset first with python manage.py seed_polls')
+
+        # Pick polls in proportion to their votes so hot polls get most of the traffic
+        totals = dict(VoteCounter.objects.values_list('poll_id').annotate(total=Sum('votes')))
+        self.weights = [totals.get(poll_id, 0) + 1 for poll_id, _ in self.polls]
+
+        now = timezone.now()
+        ongoing = {poll_id for poll_id, expire_date in self.polls if expire_date > now}
+        self.options = {}
+        for option_id, poll_id in Option.objects.filter(poll_id__in=ongoing).values_list('id', 'poll_id'):
+            self.options.setdefault(poll_id, []).append(option_id)
+        self.ongoing = [(poll_id, weight) for (poll_id, _), weight in zip(self.polls, self.weights) if poll_id in self.options]
+
+    def pick_poll(self):
+        return self.rng.choices(self.polls, weights=self.weights)[0][0]
+
+    def request_list(self, client):
+        return client.get('/api/polls/')
+
+    def request_retrieve(self, client):
+        return client.get(f'/api/polls/{self.pick_poll()}/')
+
+    def request_results(self, client):
+        return client.get(f'/api/polls/{self.pick_poll()}/results/')
+
+    def request_vote(self, client):
+        if not self.ongoing:
+            raise CommandError('The dataset has no ongoing polls to vote in')
+        poll_ids, weights = zip(*self.ongoing)
+        poll_id = self.rng.choices(poll_ids, weights=weights)[0]
+        option_id = self.rng.choice(self.options[poll_id])
+        return client.post(f'/api/polls/{poll_id}/vote/', {'option': option_id}, content_type='application/json')
+
+    def request_login(self, client):
+        _, username = self.rng.choice(self.users)
+        return client.post(
+            '/api/auth/login/', {'username': username, 'password': PASSWORD}, content_type='application/json'
+        )
+
+    def request_refresh(self, client):
+        user_id, _ = self.rng.choice(self.users)
+        refresh = str(RefreshToken.for_user(User(id=user_id)))
+        return client.post('/api/auth/token/refresh/', {'refresh': refresh}, content_type='application/json')
+
+    def run(self, index, make_request, requests):
+        """
+        Sends `requests` requests as separate anonymous clients, each from its own
+        address so throttles don't kick in. Returns the total time, per-request
+        latencies, per-request query counts and response status counts.
+        """
+        latencies = []
+        queries = []
+        statuses = Counter()
+        total = 0
+        for i in range(requests):
+            client = Client(HTTP_HOST='localhost', REMOTE_ADDR=f'10.{index}.{i // 250 % 250}.{i % 250}')
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as captured:
+                response = make_request(client)
+            # What the WSGI handler does once the response is sent, and the test
+            # client skips: close the connection or return it to the pool, unless
+            # CONN_MAX_AGE keeps it. Connecting is part of each request's latency.
+            close_old_connections()
+            elapsed = time.perf_counter() - start
+            total += elapsed
+            latencies.append(elapsed)
+            queries.append(len(captured))
+            statuses[response.status_code] += 1
+        return total, latencies, queries, statuses
+
+    def summarize(self, total, latencies, queries, statuses):
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        return {
+            'requests': len(latencies),
+            'throughput': len(latencies) / total,
+            'mean_ms': statistics.fmean(latencies) * 1000,
+            'p50_ms': percentiles[49] * 1000,
+            'p95_ms': percentiles[94] * 1000,
+            'p99_ms': percentiles[98] * 1000,
+            'queries_per_request': statistics.fmean(queries),
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        }
+
+    def get_commit(self):
+        try:
+            result = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            )
+        except OSError:
+            return None
+        return result.stdout.strip() or None
+
+    def load_baseline(self, path):
+        if not path:
+            return {}
+        with open(path) as f:
+            return json.load(f).get('scenarios', {})
+
+    def print_report(self, report, baseline):
+        self.stdout.write(
+            f'{"scenario":<10} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}  statuses'
+        )
+        for scenario, result in report['scenarios'].items():
+            line = (
+                f'{scenario:<10} {result["throughput"]:>9.1f} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                f'{result["p99_ms"]:>8.2f} {result["queries_per_request"]:>8.1f}  {result["statuses"]}'
+            )
+            if scenario in baseline:
+                before = baseline[scenario]
+                change = result['throughput'] / before['throughput'] - 1
+                line += f'  ({change:+.0%} req/s, p95 {before["p95_ms"]:.2f} -> {result["p95_ms"]:.2f} ms)'
+            self.stdout.write(line)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.test import Client
+from polling_api.models import Poll
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares how many concurrent requests one process serves through the WSGI '
+        'path with a fixed thread pool and through the ASGI path with ASYNC_VIEWS=True'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/polls/', help='Endpoint to request')
+        parser.add_argument('--requests', type=int, default=200, help='Requests sent to each path')
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads of the WSGI path')
+        parser.add_argument('--concurrency', type=int, default=50, help='In-flight requests on the ASGI path')
+        parser.add_argument(
+            '--db-latency', type=float, default=20,
+            help='Milliseconds added to every query to simulate a network round trip to the database',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.ASYNC_VIEWS:
+            raise CommandError('Run with ASYNC_VIEWS=True so the ASGI path uses the async views')
+        if not Poll.objects.exists():
+            raise CommandError('Seed some polls first')
+
+        latency = options['db_latency'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        connection_created.connect(add_latency)
+        try:
+            wsgi = self.run_wsgi(options['path'], options['requests'], options['threads'])
+            asgi = asyncio.run(self.run_asgi(options['path'], options['requests'], options['concurrency']))
+        finally:
+            connection_created.disconnect(add_latency)
+
+        for name, (elapsed, statuses) in (('wsgi', wsgi), ('asgi', asgi)):
+            self.stdout.write(
+                f'{name}: {options["requests"] / elapsed:,.1f} req/s, {elapsed:.2f}s, statuses {dict(statuses)}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'asgi/wsgi throughput: {wsgi[0] / asgi[0]:.1f}x'))
+
+    def run_wsgi(self, path, requests, threads):
+        def fetch(i):
+            client = Client(HTTP_HOST='localhost', REMOTE_ADDR=f'10.0.{i // 250}.{i % 250}')
+            return client.get(path).status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            statuses = list(pool.map(fetch, range(requests)))
+        return time.perf_counter() - start, Counter(statuses)
+
+    async def run_asgi(self, path, requests, concurrency):
+        application = get_asgi_application()
+        semaphore = asyncio.Semaphore(concurrency)
+        base_path, _, query = path.partition('?')
+
+        async def fetch(i):
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': base_path,
+                'raw_path': base_path.encode(),
+                'query_string': query.encode(),
+                'headers': [(b'host', b'localhost')],
+                'client': (f'10.1.{i // 250}.{i % 250}', 50000),
+                'server': ('localhost', 80),
+            }
+            async with semaphore:
+                communicator = ApplicationCommunicator(application, scope)
+                await communicator.send_input({'type': 'http.request', 'body': b''})
+                start = await communicator.receive_output(timeout=60)
+                while True:
+                    message = await communicator.receive_output(timeout=60)
+                    if not message.get('more_body'):
+                        break
+                await communicator.wait()
+                return start['status']
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(fetch(i) for i in range(requests)))
+        return time.perf_counter() - start, Counter(statuses)
+
@@ -0,0 +1,60 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from polling_api.metrics import Registry
+from polling_api import middleware
+
+
+class Command(BaseCommand):
+    help = 'Measures the time MetricsMiddleware adds to each request, without the view or database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help='Requests timed per run')
+
+    def handle(self, *args, **options):
+        if not settings.METRICS_ENABLED:
+            raise CommandError('Run with METRICS_ENABLED=True')
+
+        requests = options['requests']
+        factory = RequestFactory()
+        request = factory.get('/api/polls/1/results/')
+        payload = {'id': 1, 'title': 'Benchmark', 'results': [{'id': i, 'text': f'Option {i}', 'votes': i} for i in range(4)]}
+
+        def view(request):
+            return HttpResponse()
+        view.actions = {'get': 'results'}
+
+        def get_response(request):
+            response = Response(payload)
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = 'application/json'
+            response.renderer_context = {}
+            if metrics is not None:
+                metrics.process_view(request, view, (), {})
+                response = metrics.process_template_response(request, response)
+            return response.render()
+
+        # Record into a throwaway registry so the benchmark doesn't show up in /api/metrics
+        live_registry = middleware.registry
+        middleware.registry = Registry()
+        try:
+            metrics = None
+            bare = self.run(get_response, request, requests)
+            metrics = middleware.MetricsMiddleware(get_response)
+            instrumented = self.run(metrics, request, requests)
+        finally:
+            middleware.registry = live_registry
+
+        self.stdout.write(f'without middleware: {bare:.1f} us/request')
+        self.stdout.write(f'with middleware: {instrumented:.1f} us/request')
+        self.stdout.write(self.style.SUCCESS(f'overhead: {instrumented - bare:.1f} us/request'))
+
+    def run(self, handler, request, requests):
+        start = time.perf_counter()
+        for _ in range(requests):
+            handler(request)
+        return (time.perf_counter() - start) / requests * 1e6
@@ -0,0 +1,82 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from polling_api import counters, readers
+from polling_api.models import Poll
+from polling_api.serializers import PollResultsSerializer, PollSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Checks that the fast read path renders the same bytes as PollSerializer and '
+        'PollResultsSerializer, then times both. Seed the polls first, e.g. '
+        '"seed_polls --polls 10000".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--polls', type=int, default=10000, help='Polls listed per run')
+        parser.add_argument('--lookups', type=int, default=500, help='Polls retrieved one at a time per run')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path; the fastest counts')
+        parser.add_argument('--check-only', action='store_true', help='Only compare the outputs')
+
+    def handle(self, *args, **options):
+        queryset = Poll.objects.prefetch_related('options').defer('results_snapshot').order_by('expire_date', 'id')
+        queryset = queryset[:options['polls']]
+        ids = list(queryset.values_list('id', flat=True))
+        if not ids:
+            raise CommandError('No polls to serialize; run seed_polls first')
+        lookup_ids = ids[:options['lookups']]
+
+        def serializer_list():
+            return PollSerializer(queryset, many=True).data
+
+        def fast_list():
+            return readers.serialize_polls(list(readers.get_poll_rows(queryset)))
+
+        def serializer_retrieve():
+            return [PollSerializer(queryset.model.objects.prefetch_related('options').get(pk=pk)).data for pk in lookup_ids]
+
+        def fast_retrieve():
+            return [readers.serialize_polls([readers.get_poll_rows(Poll.objects.all()).get(pk=pk)])[0] for pk in lookup_ids]
+
+        def serializer_results():
+            payloads = []
+            for pk in lookup_ids:
+                poll = Poll.objects.prefetch_related('options').get(pk=pk)
+                counters.finalize_if_closed(poll)
+                payloads.append(PollResultsSerializer(poll).data)
+            return payloads
+
+        def fast_results():
+            return [readers.serialize_results(readers.get_results_rows(Poll.objects.all()).get(pk=pk)) for pk in lookup_ids]
+
+        scenarios = [
+            (f'list ({len(ids)} polls)', serializer_list, fast_list),
+            (f'retrieve ({len(lookup_ids)} polls)', serializer_retrieve, fast_retrieve),
+            (f'results ({len(lookup_ids)} polls)', serializer_results, fast_results),
+        ]
+
+        renderer = JSONRenderer()
+        for name, slow, fast in scenarios:
+            if renderer.render(slow()) != renderer.render(fast()):
+                raise CommandError(f'{name}: the fast read path renders differently from the serializer')
+        self.stdout.write(self.style.SUCCESS('Fast read path output matches the serializers'))
+        if options['check_only']:
+            return
+
+        for name, slow, fast in scenarios:
+            slow_time = self.run(slow, options['repeat'])
+            fast_time = self.run(fast, options['repeat'])
+            self.stdout.write(
+                f'{name}: serializer {slow_time * 1000:.1f} ms, fast {fast_time * 1000:.1f} ms, '
+                f'{slow_time / fast_time:.1f}x'
+            )
+
+    def run(self, serialize, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            serialize()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,60 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from rest_framework import throttling
+from polling_api.throttles import SlidingWindowRateThrottle
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the cost of one throttle check at increasing rates, for DRF's "
+        'timestamp-list throttle and the sliding window counter throttle'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rates', type=int, nargs='+', default=[10, 100, 1000, 10000],
+            help='Requests per hour allowed by each run',
+        )
+        parser.add_argument('--checks', type=int, default=2000, help='Throttle checks timed per run')
+
+    def handle(self, *args, **options):
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        engines = (
+            ('timestamp list', throttling.SimpleRateThrottle),
+            ('sliding window', SlidingWindowRateThrottle),
+        )
+        self.stdout.write(f'{"rate/hour":>10} ' + ' '.join(f'{name:>16}' for name, _ in engines))
+
+        for rate in options['rates']:
+            key = f'bench_throttles:{rate}'
+            window = int(time.time() // 3600)
+            keys = [key] + [f'{key}:{window + offset}' for offset in (-1, 0, 1)]
+
+            timings = []
+            for name, base in engines:
+                throttle_class = type('BenchThrottle', (base,), {
+                    'rate': f'{rate}/hour',
+                    'cache': cache,
+                    'get_cache_key': lambda self, request, view: key,
+                })
+                cache.delete_many(keys)
+                try:
+                    timings.append(self.run(throttle_class, rate, options['checks']))
+                finally:
+                    cache.delete_many(keys)
+            self.stdout.write(f'{rate:>10} ' + ' '.join(f'{micros:>13.1f} us' for micros in timings))
+
+    def run(self, throttle_class, rate, checks):
+        """
+        Fills the throttle to just under its limit, then returns the mean
+        microseconds per check over `checks` checks at that fill level
+        """
+        for _ in range(rate - 1):
+            throttle_class().allow_request(None, None)
+
+        start = time.perf_counter()
+        for _ in range(checks):
+            throttle_class().allow_request(None, None)
+        return (time.perf_counter() - start) / checks * 1e6
@@ -0,0 +1,63 @@
+import time
+import uuid
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from polling_api.ingest import VoteBuffer
+from polling_api.models import Option, Poll
+from polling_api.serializers import VoteSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares per-vote and buffered vote ingestion throughput against the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=2000, help='Votes cast by each mode')
+        parser.add_argument('--options', type=int, default=4, help='Options in the benchmark poll')
+        parser.add_argument('--batch-size', type=int, default=500, help='Batch size of the buffered mode')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_vote_ingest')
+        poll = Poll.objects.create(
+            title='Vote ingestion benchmark',
+            created_by=user,
+            expire_date=timezone.now() + timedelta(hours=1),
+        )
+        option_ids = [Option.objects.create(poll=poll, text=f'Option {i}').id for i in range(options['options'])]
+
+        try:
+            votes = options['votes']
+            sync = self.run_sync(poll, option_ids, votes)
+            buffered = self.run_buffered(poll, option_ids, votes, options['batch_size'])
+        finally:
+            poll.delete()
+
+        self.stdout.write(f'per-vote: {votes / sync:,.0f} votes/s ({sync:.2f}s for {votes} votes)')
+        self.stdout.write(f'buffered: {votes / buffered:,.0f} votes/s ({buffered:.2f}s for {votes} votes)')
+        self.stdout.write(self.style.SUCCESS(f'speedup: {sync / buffered:.1f}x'))
+
+    def ballots(self, option_ids, votes):
+        for i in range(votes):
+            yield {'option': option_ids[i % len(option_ids)], 'ip_hash': 'bench', 'session_id': uuid.uuid4().hex}
+
+    def run_sync(self, poll, option_ids, votes):
+        start = time.perf_counter()
+        for ballot in self.ballots(option_ids, votes):
+            serializer = VoteSerializer(data=ballot, context={'poll_id': poll.id, 'user': None})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return time.perf_counter() - start
+
+    def run_buffered(self, poll, option_ids, votes, batch_size):
+        buffer = VoteBuffer(max_size=votes + 1, batch_size=batch_size, max_age=0.5, meta_timeout=60)
+        start = time.perf_counter()
+        for ballot in self.ballots(option_ids, votes):
+            serializer = VoteSerializer(data=ballot, context={'poll_id': poll.id, 'user': None})
+            serializer.is_valid(raise_exception=True)
+            serializer.enqueue(buffer)
+        buffer.close(timeout=60)
+        elapsed = time.perf_counter() - start
+        if buffer.saved != votes:
+            self.stderr.write(f'buffered mode saved {buffer.saved} of {votes} votes')
+        return elapsed
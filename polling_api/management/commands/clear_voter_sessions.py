@@ -0,0 +1,37 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes the empty sessions created only to tell anonymous voters apart. '
+        'Run once ANONYMOUS_VOTER_TOKENS is on; sessions holding any data, like logins, are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions read and deleted per query')
+        parser.add_argument('--dry-run', action='store_true', help='Count the sessions without deleting them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        deleted = 0
+        last_key = ''
+        while True:
+            # Walk the table by primary key so deletions don't shift the batches
+            batch = list(
+                Session.objects.filter(session_key__gt=last_key)
+                .order_by('session_key')[:batch_size]
+            )
+            if not batch:
+                break
+            last_key = batch[-1].session_key
+
+            empty = [session.session_key for session in batch if not session.get_decoded()]
+            if empty and not options['dry_run']:
+                Session.objects.filter(session_key__in=empty).delete()
+            deleted += len(empty)
+
+        if options['dry_run']:
+            self.stdout.write(f'{deleted} empty voter session(s) would be deleted')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} empty voter session(s)'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from polling_api import counters
+from polling_api.models import Poll
+
+
+class Command(BaseCommand):
+    help = 'Freezes the results of every closed poll that has no results snapshot yet'
+
+    def handle(self, *args, **options):
+        finalized = 0
+        for poll in Poll.objects.filter(results_snapshot__isnull=True).order_by('expire_date').iterator():
+            if not poll.is_closed():
+                # Ordered by expiry, so every poll left is still open
+                break
+            counters.finalize(poll)
+            finalized += 1
+        self.stdout.write(self.style.SUCCESS(f'Finalized {finalized} closed poll(s)'))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from polling_site.schema import generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Writes the OpenAPI document to OPENAPI_SCHEMA_FILE, so servers load it instead of generating it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.OPENAPI_SCHEMA_FILE, help='File to write')
+
+    def handle(self, *args, **options):
+        content = generate_schema()
+        with open(options['output'], 'wb') as f:
+            f.write(content)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(content)} bytes to {options["output"]}'))
@@ -0,0 +1,87 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: what a serverless cold start does before it can
+# answer, minus the database. Prints the elapsed milliseconds.
+COLD_START = '''
+import time
+start = time.perf_counter()
+from polling_site.wsgi import application
+from django.urls import resolve
+resolve({path!r})
+print(round((time.perf_counter() - start) * 1000, 1))
+'''
+
+IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures a cold start (importing the WSGI app and loading the URLconf) in fresh '
+        'interpreters, and reports which packages the import time goes to'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/polls/', help='URL resolved after startup')
+        parser.add_argument('--runs', type=int, default=5, help='Cold starts measured; the fastest counts')
+        parser.add_argument('--top', type=int, default=20, help='Packages listed')
+        parser.add_argument(
+            '--max-ms', type=float, default=settings.STARTUP_TIME_BUDGET,
+            help='Fail if the fastest cold start takes longer than this',
+        )
+        parser.add_argument('--modules', action='store_true', help='List single modules instead of packages')
+
+    def handle(self, *args, **options):
+        script = COLD_START.format(path=options['path'])
+        times = []
+        for _ in range(options['runs']):
+            elapsed, _ = self.start(script)
+            times.append(elapsed)
+        _, imports = self.start(script, importtime=True)
+
+        self.stdout.write(f"{'self ms':>9} {'modules':>8}  {'module' if options['modules'] else 'package'}")
+        totals = defaultdict(lambda: [0, 0])
+        for module, self_us in imports:
+            key = module if options['modules'] else module.split('.')[0]
+            totals[key][0] += self_us
+            totals[key][1] += 1
+        for key, (self_us, count) in sorted(totals.items(), key=lambda item: -item[1][0])[:options['top']]:
+            self.stdout.write(f'{self_us / 1000:9.1f} {count:8}  {key}')
+        self.stdout.write(f'{sum(self_us for _, self_us in imports) / 1000:9.1f} {len(imports):8}  total imports')
+
+        best = min(times)
+        self.stdout.write(
+            f'Cold start: {best:.1f} ms fastest, {sorted(times)[len(times) // 2]:.1f} ms median '
+            f'over {len(times)} runs (LEAN_STARTUP={settings.LEAN_STARTUP})'
+        )
+        if options['max_ms'] and best > options['max_ms']:
+            raise CommandError(f'Cold start took {best:.1f} ms, over the {options["max_ms"]:.0f} ms budget')
+
+    def start(self, script, importtime=False):
+        """
+        Runs `script` in a new interpreter with this process's environment,
+        returning its elapsed milliseconds and, with `importtime`, a list of
+        (module, self microseconds) pairs
+        """
+        command = [sys.executable]
+        if importtime:
+            command += ['-X', 'importtime']
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'polling_site.settings')}
+        result = subprocess.run(
+            command + ['-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME.match(line)
+            if match:
+                imports.append((match[4], int(match[1])))
+        return json.loads(result.stdout.strip().splitlines()[-1]), imports
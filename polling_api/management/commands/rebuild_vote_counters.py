@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from polling_api import counters
+from polling_api.models import Poll
+
+
+class Command(BaseCommand):
+    help = 'Reconciles the sharded vote counters with the Vote table and rebuilds any that have drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_ids', nargs='*', type=int, help='Only reconcile these polls')
+        parser.add_argument('--check', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        polls = Poll.objects.all()
+        if options['poll_ids']:
+            polls = polls.filter(id__in=options['poll_ids'])
+
+        fix = not options['check']
+        drifted = 0
+        for poll, drift in counters.reconcile_all(polls, fix=fix):
+            drifted += 1
+            for option_id, (counted, actual) in sorted(drift.items()):
+                self.stdout.write(f'Poll {poll.id}, option {option_id}: counted {counted}, actual {actual}')
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All vote counters are in sync'))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt vote counters for {drifted} poll(s)'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{drifted} poll(s) have drifted vote counters'))
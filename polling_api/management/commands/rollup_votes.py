@@ -0,0 +1,29 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from polling_api import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Counts votes not rolled up yet into the per-minute, hour and day rollups '
+        'that back the analytics endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.VOTE_ROLLUP_BATCH_SIZE,
+            help='Votes rolled up per transaction',
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='Keep running, catching up every this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            rolled_up = rollups.catch_up(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rolled up {rolled_up} vote(s)'))
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,128 @@
+import random
+import uuid
+from collections import Counter
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from polling_api.models import Option, Poll, Vote, VoteCounter
+from polling_api.utils import get_ip_hash
+
+USERNAME_PREFIX = 'seed_user_'
+PASSWORD = 'seed-password'
+TOPICS = [
+    'Programming language', 'Text editor', 'Coffee', 'Tea', 'Framework', 'Database',
+    'Operating system', 'Season', 'Sport', 'Pizza topping', 'Film genre', 'Holiday destination',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a reproducible dataset of users, polls, options and votes, with votes '
+        'skewed toward a few hot polls. Seeded users log in with the password "seed-password".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Users to create')
+        parser.add_argument('--polls', type=int, default=200, help='Polls to create')
+        parser.add_argument('--options', type=int, default=4, help='Options per poll')
+        parser.add_argument('--votes', type=int, default=10000, help='Votes to cast')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent of the votes per poll; 0 spreads votes evenly, higher values favour hot polls',
+        )
+        parser.add_argument('--expired', type=float, default=0.2, help='Fraction of polls that have expired')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, so runs produce the same data')
+        parser.add_argument('--flush', action='store_true', help='Delete previously seeded data first')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        if options['flush']:
+            # Polls, options, votes and counters cascade from their creators
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} previously seeded rows')
+
+        with transaction.atomic():
+            users = self.seed_users(options['users'], batch_size)
+            polls = self.seed_polls(rng, users, options['polls'], options['expired'], batch_size)
+            options_by_poll = self.seed_options(polls, options['options'], batch_size)
+            votes = self.seed_votes(rng, users, polls, options_by_poll, options['votes'], options['skew'], batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(users)} users, {len(polls)} polls with {options["options"]} options each and {votes} votes'
+        ))
+
+    def seed_users(self, count, batch_size):
+        start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+        # Hash once; PBKDF2 per user would dominate the seeding time
+        password = make_password(PASSWORD)
+        users = [User(username=f'{USERNAME_PREFIX}{start + i}', password=password) for i in range(count)]
+        return User.objects.bulk_create(users, batch_size=batch_size)
+
+    def seed_polls(self, rng, users, count, expired, batch_size):
+        now = timezone.now()
+        polls = []
+        for i in range(count):
+            if rng.random() < expired:
+                expire_date = now - timedelta(days=rng.uniform(1, 90))
+            else:
+                expire_date = now + timedelta(days=rng.uniform(1, 90))
+            polls.append(Poll(
+                title=f'Seeded poll {i}: {rng.choice(TOPICS)}',
+                description=f'Which {rng.choice(TOPICS).lower()} do you prefer?',
+                created_by=rng.choice(users),
+                expire_date=expire_date,
+            ))
+        return Poll.objects.bulk_create(polls, batch_size=batch_size)
+
+    def seed_options(self, polls, count, batch_size):
+        options = Option.objects.bulk_create(
+            [Option(poll=poll, text=f'Option {i + 1}') for poll in polls for i in range(count)],
+            batch_size=batch_size,
+        )
+        options_by_poll = {}
+        for option in options:
+            options_by_poll.setdefault(option.poll_id, []).append(option)
+        return options_by_poll
+
+    def seed_votes(self, rng, users, polls, options_by_poll, count, skew, batch_size):
+        # The nth hottest poll gets votes in proportion to 1 / n^skew
+        weights = [1 / (rank + 1) ** skew for rank in range(len(polls))]
+        voted = set()
+        votes = []
+        voted_at = []
+        tally = Counter()
+        now = timezone.now()
+
+        for poll in rng.choices(polls, weights=weights, k=count):
+            # Earlier options are more popular too
+            options = options_by_poll[poll.id]
+            option = rng.choices(options, weights=range(len(options), 0, -1))[0]
+
+            user = rng.choice(users)
+            if (poll.id, user.id) in voted:
+                vote = Vote(poll=poll, option=option, ip_hash=get_ip_hash(f'10.{rng.randrange(256)}.0.1'),
+                            session_id=uuid.UUID(int=rng.getrandbits(128)).hex)
+            else:
+                voted.add((poll.id, user.id))
+                vote = Vote(poll=poll, option=option, voted_by=user)
+            votes.append(vote)
+            voted_at.append(min(poll.expire_date, now) - timedelta(minutes=rng.uniform(1, 60 * 24)))
+            tally[poll.id, option.id] += 1
+
+        Vote.objects.bulk_create(votes, batch_size=batch_size)
+        # voted_at is auto_now, so spread the timestamps out afterwards
+        for vote, timestamp in zip(votes, voted_at):
+            vote.voted_at = timestamp
+        Vote.objects.bulk_update(votes, ['voted_at'], batch_size=batch_size)
+        VoteCounter.objects.bulk_create(
+            [VoteCounter(poll_id=poll_id, option_id=option_id, shard=0, votes=total)
+             for (poll_id, option_id), total in tally.items()],
+            batch_size=batch_size,
+        )
+        return len(votes)
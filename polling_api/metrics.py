@@ -0,0 +1,166 @@
+import threading
+from bisect import bisect_left
+from django.db import connections
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    """
+    Prometheus-style histogram. Observations only bump one bucket, buckets
+    are made cumulative when rendered.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield format_number(bound), cumulative
+        yield '+Inf', self.count
+
+
+class Registry:
+    """
+    In-process store of request metrics, labelled by view and DRF action.
+    Each worker process keeps its own; Prometheus sums them when scraping.
+    """
+    HISTOGRAMS = {
+        'polling_request_duration_seconds': ('Time spent handling the request', DURATION_BUCKETS),
+        'polling_db_queries': ('SQL queries run per request', QUERY_BUCKETS),
+        'polling_db_duration_seconds': ('Time spent in SQL queries per request', DURATION_BUCKETS),
+        'polling_render_duration_seconds': ('Time spent rendering the response body', DURATION_BUCKETS),
+        'polling_response_size_bytes': ('Size of the response body', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.histograms = {name: {} for name in self.HISTOGRAMS}
+
+    def record(self, view, action, method, status, observations):
+        """
+        Counts a request and adds `observations`, a dict of histogram name to
+        value, to the histograms of its view and action
+        """
+        labels = (view, action)
+        with self._lock:
+            key = (view, action, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in observations.items():
+                histogram = self.histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self.histograms[name][labels] = Histogram(self.HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            for histograms in self.histograms.values():
+                histograms.clear()
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = [
+                '# HELP polling_requests_total Requests handled',
+                '# TYPE polling_requests_total counter',
+            ]
+            for (view, action, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'polling_requests_total{{view="{view}",action="{action}",method="{method}",status="{status}"}} {count}'
+                )
+
+            for name, (description, _) in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (view, action), histogram in sorted(self.histograms[name].items()):
+                    labels = f'view="{view}",action="{action}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {format_number(histogram.sum)}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Metric name, type, help and the function reading it from psycopg pool stats
+POOL_METRICS = (
+    ('polling_db_pool_connections', 'gauge', 'Connections open in the pool', lambda stats: stats['pool_size']),
+    ('polling_db_pool_available', 'gauge', 'Idle connections in the pool', lambda stats: stats['pool_available']),
+    (
+        'polling_db_pool_checked_out', 'gauge', 'Connections lent out to requests',
+        lambda stats: stats['pool_size'] - stats['pool_available'],
+    ),
+    ('polling_db_pool_waiting', 'gauge', 'Requests waiting for a connection', lambda stats: stats['requests_waiting']),
+    ('polling_db_pool_requests_total', 'counter', 'Connections asked of the pool', lambda stats: stats.get('requests_num', 0)),
+    (
+        'polling_db_pool_queued_total', 'counter', 'Requests that had to wait for a connection',
+        lambda stats: stats.get('requests_queued', 0),
+    ),
+    (
+        'polling_db_pool_wait_seconds_total', 'counter', 'Time requests spent waiting for a connection',
+        lambda stats: stats.get('requests_wait_ms', 0) / 1000,
+    ),
+    (
+        'polling_db_pool_timeouts_total', 'counter', 'Requests that gave up waiting for a connection',
+        lambda stats: stats.get('requests_errors', 0),
+    ),
+    (
+        'polling_db_pool_connects_total', 'counter', 'Connections the pool opened',
+        lambda stats: stats.get('connections_num', 0),
+    ),
+    (
+        'polling_db_pool_connect_seconds_total', 'counter', 'Time spent opening connections',
+        lambda stats: stats.get('connections_ms', 0) / 1000,
+    ),
+)
+
+
+def get_pool_stats():
+    """
+    Returns the psycopg pool stats of each database alias using a pool
+    (see DB_POOL), without resetting them
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def render_pool_metrics():
+    """
+    Returns the connection pool metrics of this process in the Prometheus
+    text exposition format, or nothing without a pool
+    """
+    stats = get_pool_stats()
+    if not stats:
+        return ''
+    lines = []
+    for name, kind, description, read in POOL_METRICS:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for alias, pool_stats in sorted(stats.items()):
+            lines.append(f'{name}{{database="{alias}"}} {format_number(read(pool_stats))}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
@@ -0,0 +1,137 @@
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.utils.functional import LazyObject, empty
+from .metrics import registry
+
+# Stats of the request being handled. A context variable rather than one
+# wrapper per request on each connection: under ASGI the queries run in
+# worker threads, on other connections than the middleware sees.
+_current_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """
+    Query count and time, and render time, of one request
+    """
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0
+        self.render_started = None
+        self.render_time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def start_render(self, response):
+        self.render_started = time.perf_counter()
+
+    def end_render(self, response):
+        self.render_time = time.perf_counter() - self.render_started
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+def track_queries(sender, connection, **kwargs):
+    # Connections keep their wrappers when they reconnect
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+def connect_signals():
+    connection_created.connect(track_queries, dispatch_uid='polling_api.middleware.track_queries')
+
+
+class MetricsMiddleware:
+    """
+    Records each request's duration, query count, database time, render time
+    and response size in the metrics registry, labelled by view and DRF action.
+    Staff users also get them in a Server-Timing header.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        stats = request._metrics = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        stats = request._metrics = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = view_func
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook returns
+        stats = getattr(request, '_metrics', None)
+        if stats is not None:
+            stats.start_render(response)
+            response.add_post_render_callback(stats.end_render)
+        return response
+
+    def finish(self, request, response, stats, duration):
+        view, action = self.get_labels(request)
+        observations = {
+            'polling_request_duration_seconds': duration,
+            'polling_db_queries': stats.queries,
+            'polling_db_duration_seconds': stats.db_time,
+            'polling_render_duration_seconds': stats.render_time,
+        }
+        if not response.streaming:
+            observations['polling_response_size_bytes'] = len(response.content)
+        registry.record(view, action, request.method, response.status_code, observations)
+
+        user = getattr(request, 'user', None)
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            # No view looked at the user; don't load it from the session just for this
+            user = None
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = (
+                f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", '
+                f'render;dur={stats.render_time * 1000:.2f}, '
+                f'total;dur={duration * 1000:.2f}'
+            )
+        return response
+
+    def get_labels(self, request):
+        view_func = getattr(request, '_metrics_view', None)
+        if view_func is None:
+            return 'unmatched', ''
+        # Viewsets map each HTTP method to an action, e.g. {'post': 'vote'}
+        actions = getattr(view_func, 'actions', None) or {}
+        return view_func.__name__, actions.get(request.method.lower(), '')
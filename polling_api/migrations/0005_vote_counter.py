@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_vote_counters(apps, schema_editor):
+    Vote = apps.get_model('polling_api', 'Vote')
+    VoteCounter = apps.get_model('polling_api', 'VoteCounter')
+    db_alias = schema_editor.connection.alias
+
+    counts = Vote.objects.using(db_alias).values('poll_id', 'option_id').annotate(votes=Count('id'))
+    VoteCounter.objects.using(db_alias).bulk_create(
+        [VoteCounter(poll_id=row['poll_id'], option_id=row['option_id'], shard=0, votes=row['votes']) for row in counts],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0004_alter_vote_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteCounter',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('votes', models.PositiveIntegerField(default=0)),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_counters', to='polling_api.option')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_counters', to='polling_api.poll')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('option', 'shard'), name='unique_vote_counter_shard')],
+            },
+        ),
+        migrations.RunPython(backfill_vote_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """
+    Keeps the first vote of every voter in a poll so the unique constraints can be created
+    """
+    Vote = apps.get_model('polling_api', 'Vote')
+    VoteCounter = apps.get_model('polling_api', 'VoteCounter')
+    db_alias = schema_editor.connection.alias
+    votes = Vote.objects.using(db_alias)
+
+    voters = [
+        (('poll_id', 'voted_by_id'), votes.filter(voted_by__isnull=False)),
+        (('poll_id', 'ip_hash', 'session_id'), votes.filter(voted_by__isnull=True, ip_hash__isnull=False, session_id__isnull=False)),
+    ]
+    duplicate_ids = []
+    affected_polls = set()
+    for keys, queryset in voters:
+        groups = queryset.values(*keys).annotate(first_id=Min('id'), count=Count('id')).filter(count__gt=1)
+        for group in groups:
+            first_id = group.pop('first_id')
+            group.pop('count')
+            duplicate_ids.extend(queryset.filter(**group).exclude(id=first_id).values_list('id', flat=True))
+            affected_polls.add(group['poll_id'])
+
+    for start in range(0, len(duplicate_ids), 500):
+        votes.filter(id__in=duplicate_ids[start:start + 500]).delete()
+
+    # Recount the affected polls, since their counters included the removed votes
+    for poll_id in affected_polls:
+        VoteCounter.objects.using(db_alias).filter(poll_id=poll_id).delete()
+        counts = votes.filter(poll_id=poll_id).values('option_id').annotate(votes=Count('id'))
+        VoteCounter.objects.using(db_alias).bulk_create(
+            [VoteCounter(poll_id=poll_id, option_id=row['option_id'], shard=0, votes=row['votes']) for row in counts]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0005_vote_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(condition=models.Q(('voted_by__isnull', False)), fields=('poll', 'voted_by'), name='unique_user_vote_per_poll'),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(condition=models.Q(('voted_by__isnull', True)), fields=('poll', 'ip_hash', 'session_id'), name='unique_anonymous_vote_per_poll'),
+        ),
+    ]
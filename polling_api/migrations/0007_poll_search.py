@@ -0,0 +1,76 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:38
+
+from django.db import migrations
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+# Creating pg_trgm needs a superuser, or on PostgreSQL 13+ a role allowed to
+# create objects in the database; fail with instructions rather than a bare error
+CREATE_TRIGRAM_EXTENSION = """DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE EXTENSION pg_trgm;
+    END IF;
+EXCEPTION WHEN insufficient_privilege OR feature_not_supported OR undefined_file THEN
+    RAISE EXCEPTION USING
+        MESSAGE = 'Poll search needs the pg_trgm extension, which could not be created: ' || SQLERRM,
+        HINT = 'Have a superuser run CREATE EXTENSION pg_trgm in this database, then migrate again.';
+END $$"""
+
+POSTGRES_FORWARD = [
+    CREATE_TRIGRAM_EXTENSION,
+    f'CREATE INDEX polling_api_poll_search_idx ON polling_api_poll USING GIN (({POSTGRES_VECTOR}))',
+    'CREATE INDEX polling_api_poll_title_trgm_idx ON polling_api_poll USING GIN (title gin_trgm_ops)',
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS polling_api_poll_title_trgm_idx',
+    'DROP INDEX IF EXISTS polling_api_poll_search_idx',
+]
+
+# External-content FTS5 table kept in sync with polling_api_poll by triggers
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE polling_api_poll_fts USING fts5(title, description, content='polling_api_poll', content_rowid='id')",
+    """CREATE TRIGGER polling_api_poll_fts_insert AFTER INSERT ON polling_api_poll BEGIN
+        INSERT INTO polling_api_poll_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER polling_api_poll_fts_delete AFTER DELETE ON polling_api_poll BEGIN
+        INSERT INTO polling_api_poll_fts(polling_api_poll_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER polling_api_poll_fts_update AFTER UPDATE ON polling_api_poll BEGIN
+        INSERT INTO polling_api_poll_fts(polling_api_poll_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO polling_api_poll_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    "INSERT INTO polling_api_poll_fts(polling_api_poll_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS polling_api_poll_fts_update',
+    'DROP TRIGGER IF EXISTS polling_api_poll_fts_delete',
+    'DROP TRIGGER IF EXISTS polling_api_poll_fts_insert',
+    'DROP TABLE IF EXISTS polling_api_poll_fts',
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0006_vote_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
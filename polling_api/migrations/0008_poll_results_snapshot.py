@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0007_poll_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='finalized_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='poll',
+            name='results_snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0008_poll_results_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='VoteArchive',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('votes', models.PositiveIntegerField()),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_archives', to='polling_api.option')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_archives', to='polling_api.poll')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('option', 'day'), name='unique_vote_archive_day')],
+            },
+        ),
+    ]
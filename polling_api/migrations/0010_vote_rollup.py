@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-18 05:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0009_vote_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteRollupMark',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('last_vote_id', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteRollup',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=6)),
+                ('bucket', models.DateTimeField()),
+                ('votes', models.PositiveIntegerField(default=0)),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_rollups', to='polling_api.option')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vote_rollups', to='polling_api.poll')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['poll', 'granularity', 'bucket'], name='polling_api_poll_id_017a40_idx')],
+                'constraints': [models.UniqueConstraint(fields=('option', 'granularity', 'bucket'), name='unique_vote_rollup_bucket')],
+            },
+        ),
+    ]
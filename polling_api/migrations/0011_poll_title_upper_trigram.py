@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:40
+
+from django.db import migrations
+
+# Indexes the expression the `title` filter (icontains) compares,
+# UPPER(title) LIKE UPPER(...), so substring filters and search share one
+# trigram index instead of scanning the table
+POSTGRES_FORWARD = [
+    'DROP INDEX IF EXISTS polling_api_poll_title_trgm_idx',
+    'CREATE INDEX polling_api_poll_title_upper_trgm_idx ON polling_api_poll USING GIN ((UPPER(title)) gin_trgm_ops)',
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS polling_api_poll_title_upper_trgm_idx',
+    'CREATE INDEX polling_api_poll_title_trgm_idx ON polling_api_poll USING GIN (title gin_trgm_ops)',
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0010_vote_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(POSTGRES_FORWARD), run_on_postgres(POSTGRES_REVERSE)),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+
+def flag_votes_past_the_mark(apps, schema_editor):
+    # Votes up to the old high-water mark are already counted into the rollups
+    Vote = apps.get_model('polling_api', 'Vote')
+    VoteRollupMark = apps.get_model('polling_api', 'VoteRollupMark')
+    db_alias = schema_editor.connection.alias
+
+    mark = VoteRollupMark.objects.using(db_alias).filter(pk=1).first()
+    Vote.objects.using(db_alias).filter(id__gt=mark.last_vote_id if mark else 0).update(rolled_up=False)
+
+
+def move_the_mark_to_the_flags(apps, schema_editor):
+    Vote = apps.get_model('polling_api', 'Vote')
+    VoteRollupMark = apps.get_model('polling_api', 'VoteRollupMark')
+    db_alias = schema_editor.connection.alias
+
+    votes = Vote.objects.using(db_alias)
+    first_pending = votes.filter(rolled_up=False).aggregate(id=Min('id'))['id']
+    last_vote_id = first_pending - 1 if first_pending else votes.aggregate(id=Max('id'))['id'] or 0
+    VoteRollupMark.objects.using(db_alias).filter(pk=1).update(last_vote_id=last_vote_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polling_api', '0011_poll_title_upper_trigram'),
+    ]
+
+    operations = [
+        # Existing rows take the column default without a table rewrite, so
+        # start them as rolled up and only update the votes past the mark
+        migrations.AddField(
+            model_name='vote',
+            name='rolled_up',
+            field=models.BooleanField(db_default=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='rolled_up',
+            field=models.BooleanField(db_default=False, editable=False),
+        ),
+        migrations.RunPython(flag_votes_past_the_mark, move_the_mark_to_the_flags),
+        migrations.RemoveField(
+            model_name='voterollupmark',
+            name='last_vote_id',
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='vote_not_rolled_up_idx'),
+        ),
+    ]
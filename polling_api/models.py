@@ -1,4 +1,7 @@
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, models
+from django.utils import timezone
 
 class Poll(models.Model):
     id = models.AutoField(primary_key=True)
@@ -7,6 +10,11 @@ class Poll(models.Model):
     created_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, editable=False)
     pub_date = models.DateTimeField(auto_now=True, editable=False)
     expire_date = models.DateTimeField()
+    # Final per-option counts and total, written once the poll has closed
+    results_snapshot = models.JSONField(null=True, blank=True, editable=False)
+    finalized_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Set once the poll's votes have been rolled up into VoteArchive rows
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         indexes = [
@@ -19,6 +27,12 @@ class Poll(models.Model):
     def __str__(self):
         return self.title
 
+    def is_closed(self):
+        """
+        Whether no more votes can land, allowing for votes still in flight at expiry
+        """
+        return self.expire_date + timedelta(seconds=settings.RESULTS_FINALIZE_DELAY) <= timezone.now()
+
 class Option(models.Model):
     id = models.AutoField(primary_key=True)
     poll = models.ForeignKey(Poll, related_name='options', on_delete=models.CASCADE)
@@ -27,6 +41,70 @@ class Option(models.Model):
     def __str__(self):
         return self.text
 
+class VoteManager(models.Manager):
+    def cast(self, poll_id, option_id, voted_by=None, ip_hash=None, session_id=None, voted_at=None):
+        """
+        Inserts a vote in a single statement, provided the option belongs to the
+        poll, the poll has not expired and no constraint flags it as a repeat vote.
+        Returns the new vote, or None if any of those checks rejected it.
+        """
+        voted_at = voted_at or timezone.now()
+        qn = connection.ops.quote_name
+        adapt = connection.ops.adapt_datetimefield_value
+        vote_table = qn(self.model._meta.db_table)
+        option_table = qn(Option._meta.db_table)
+        poll_table = qn(Poll._meta.db_table)
+
+        sql = (
+            f'INSERT INTO {vote_table} (poll_id, option_id, voted_at, voted_by_id, ip_hash, session_id) '
+            f'SELECT {option_table}.poll_id, {option_table}.id, %s, %s, %s, %s '
+            f'FROM {option_table} INNER JOIN {poll_table} ON {poll_table}.id = {option_table}.poll_id '
+            f'WHERE {option_table}.id = %s AND {option_table}.poll_id = %s AND {poll_table}.expire_date >= %s '
+            f'ON CONFLICT DO NOTHING RETURNING id'
+        )
+        params = [
+            adapt(voted_at), voted_by.pk if voted_by else None, ip_hash, session_id,
+            option_id, poll_id, adapt(voted_at),
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        return self.model(
+            id=row[0], poll_id=poll_id, option_id=option_id, voted_at=voted_at,
+            voted_by=voted_by, ip_hash=ip_hash, session_id=session_id,
+        )
+
+    def insert_new(self, votes, batch_size=500):
+        """
+        Inserts `votes`, skipping any a unique constraint rejects, e.g. because
+        the voter voted in the meantime. Returns the (poll id, option id) of
+        each vote inserted.
+        """
+        qn = connection.ops.quote_name
+        adapt = connection.ops.adapt_datetimefield_value
+        vote_table = qn(self.model._meta.db_table)
+        inserted = []
+        with connection.cursor() as cursor:
+            for start in range(0, len(votes), batch_size):
+                chunk = votes[start:start + batch_size]
+                values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(chunk))
+                params = []
+                for vote in chunk:
+                    params += [
+                        vote.poll_id, vote.option_id, adapt(vote.voted_at),
+                        vote.voted_by_id, vote.ip_hash, vote.session_id,
+                    ]
+                cursor.execute(
+                    f'INSERT INTO {vote_table} (poll_id, option_id, voted_at, voted_by_id, ip_hash, session_id) '
+                    f'VALUES {values} ON CONFLICT DO NOTHING RETURNING poll_id, option_id',
+                    params,
+                )
+                inserted += cursor.fetchall()
+        return inserted
+
 class Vote(models.Model):
     id = models.AutoField(primary_key=True)
     poll = models.ForeignKey(Poll, related_name='votes', on_delete=models.CASCADE)
@@ -35,6 +113,101 @@ class Vote(models.Model):
     voted_by = models.ForeignKey('auth.User', on_delete=models.CASCADE, null=True)
     ip_hash = models.CharField(max_length=255, null=True)
     session_id = models.CharField(max_length=255, null=True)
+    # Counted into the vote rollups yet (see rollups.catch_up)
+    rolled_up = models.BooleanField(db_default=False, editable=False)
+
+    objects = VoteManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(rolled_up=False), name='vote_not_rolled_up_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['poll', 'voted_by'],
+                condition=models.Q(voted_by__isnull=False),
+                name='unique_user_vote_per_poll',
+            ),
+            models.UniqueConstraint(
+                fields=['poll', 'ip_hash', 'session_id'],
+                condition=models.Q(voted_by__isnull=True),
+                name='unique_anonymous_vote_per_poll',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.voted_by} voted for {self.option} in {self.poll}"
+
+class VoteCounter(models.Model):
+    """
+    Denormalized vote count for an option, split across shards so concurrent
+    voters on the same option don't contend for a single row lock
+    """
+    id = models.AutoField(primary_key=True)
+    poll = models.ForeignKey(Poll, related_name='vote_counters', on_delete=models.CASCADE)
+    option = models.ForeignKey(Option, related_name='vote_counters', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['option', 'shard'], name='unique_vote_counter_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.option} (shard {self.shard}): {self.votes}"
+
+class VoteArchive(models.Model):
+    """
+    Votes an option got on one day, kept once the raw votes of a long-closed
+    poll have been deleted
+    """
+    id = models.AutoField(primary_key=True)
+    poll = models.ForeignKey(Poll, related_name='vote_archives', on_delete=models.CASCADE)
+    option = models.ForeignKey(Option, related_name='vote_archives', on_delete=models.CASCADE)
+    day = models.DateField()
+    votes = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['option', 'day'], name='unique_vote_archive_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.option} on {self.day}: {self.votes}"
+
+class VoteRollup(models.Model):
+    """
+    Votes an option got in one minute, hour or day, kept up to date from the
+    Vote table by `rollups.catch_up` so vote histograms never scan raw votes
+    """
+    GRANULARITIES = [('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')]
+
+    id = models.AutoField(primary_key=True)
+    poll = models.ForeignKey(Poll, related_name='vote_rollups', on_delete=models.CASCADE)
+    option = models.ForeignKey(Option, related_name='vote_rollups', on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=6, choices=GRANULARITIES)
+    # Start of the bucket, in UTC
+    bucket = models.DateTimeField()
+    votes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['option', 'granularity', 'bucket'], name='unique_vote_rollup_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['poll', 'granularity', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.option} ({self.granularity} of {self.bucket}): {self.votes}"
+
+class VoteRollupMark(models.Model):
+    """
+    Single row locked while votes are rolled up, recording when that last happened
+    """
+    id = models.AutoField(primary_key=True)
+    updated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"{self.voted_by} voted for {self.option} in {self.poll}"
\ No newline at end of file
+        return f"Votes rolled up at {self.updated_at}"
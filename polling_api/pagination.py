@@ -0,0 +1,28 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on indexed columns instead of using OFFSET
+    """
+    page_size = settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+class PollPagination(KeysetPagination):
+    """
+    Pagination class for Polls, soonest to expire first
+    """
+    ordering = ('expire_date', 'id')
+
+    def get_ordering(self, request, queryset, view):
+        # Search results come most relevant first
+        if 'search_rank' in queryset.query.annotations:
+            return ('-search_rank', 'id')
+        return super().get_ordering(request, queryset, view)
+
+class UserPagination(KeysetPagination):
+    """
+    Pagination class for Users
+    """
+    ordering = ('id',)
@@ -18,4 +18,12 @@ class IsSelfOrAdmin(permissions.BasePermission):
     Custom permission to only allow users to edit themselves.
     """
     def has_object_permission(self, request, view, obj):
-        return obj == request.user or request.user.is_staff
\ No newline at end of file
+        return obj == request.user or request.user.is_staff
+
+class CanViewPollData(permissions.BasePermission):
+    """
+    Custom permission to only allow the creator of a poll to export its votes
+    or read its analytics.
+    """
+    def has_object_permission(self, request, view, obj):
+        return obj.created_by == request.user or request.user.is_staff
@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+RESET = 'reset'
+
+
+class Subscription:
+    """
+    Queue of (event_id, kind, data) events for one subscriber of a poll
+    """
+    def __init__(self, broker, poll_id, max_pending):
+        self.broker = broker
+        self.poll_id = poll_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up; make the client start over from a snapshot
+            self.overflowed = True
+
+    async def get(self):
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return (self.broker.last_event_id(self.poll_id), RESET, None)
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class PollHistory:
+    """
+    Recent events of one poll
+    """
+    def __init__(self):
+        self.events = deque()
+        self.last_id = None
+        # Oldest event id clients can resume from: the poll's first id, then
+        # the id of the newest event dropped from `events`
+        self.resumable_from = None
+
+
+class InProcessBroker:
+    """
+    Fans poll events out to the subscribers in this process.
+
+    Each poll keeps a short history so reconnecting clients can resume from
+    their last event id; clients that fall further behind get a reset.
+    Histories are kept for the `max_polls` polls with the latest activity,
+    plus any poll with subscribers; clients resuming on a forgotten poll get
+    a reset too.
+    """
+    def __init__(self, history=256, max_pending=1024, max_polls=1024):
+        self.history = history
+        self.max_pending = max_pending
+        self.max_polls = max_polls
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        # Poll id to PollHistory, least recently used first
+        self._polls = OrderedDict()
+
+    def _get_history(self, poll_id):
+        history = self._polls.get(poll_id)
+        if history is None:
+            history = self._polls[poll_id] = PollHistory()
+            excess = len(self._polls) - self.max_polls
+            if excess > 0:
+                idle = [other for other in self._polls if other not in self._subscribers and other != poll_id]
+                for other in idle[:excess]:
+                    del self._polls[other]
+        else:
+            self._polls.move_to_end(poll_id)
+        return history
+
+    def _next_event_id(self, history):
+        event_id = max(time.time_ns(), (history.last_id or 0) + 1)
+        history.last_id = event_id
+        if history.resumable_from is None:
+            history.resumable_from = event_id
+        return event_id
+
+    def last_event_id(self, poll_id):
+        with self._lock:
+            history = self._get_history(poll_id)
+            return history.last_id or self._next_event_id(history)
+
+    def publish(self, poll_id, kind, data=None):
+        """
+        Sends an event to every subscriber of the poll. Safe to call from any thread.
+        """
+        with self._lock:
+            history = self._get_history(poll_id)
+            event = (self._next_event_id(history), kind, data)
+            history.events.append(event)
+            if len(history.events) > self.history:
+                history.resumable_from = history.events.popleft()[0]
+            subscribers = list(self._subscribers.get(poll_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's event loop has shut down
+                self.unsubscribe(subscription)
+
+    def subscribe(self, poll_id, last_event_id=None):
+        """
+        Subscribes to a poll's events. With `last_event_id`, the events missed
+        since then are replayed first, or a reset if they are no longer known.
+        """
+        subscription = Subscription(self, poll_id, self.max_pending)
+        with self._lock:
+            self._subscribers[poll_id].add(subscription)
+            if last_event_id is not None:
+                history = self._get_history(poll_id)
+                if history.last_id is not None and history.resumable_from <= last_event_id <= history.last_id:
+                    missed = [event for event in history.events if event[0] > last_event_id]
+                else:
+                    missed = [(history.last_id or self._next_event_id(history), RESET, None)]
+                for event in missed:
+                    subscription.deliver(event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.poll_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.poll_id]
+
+
+_broker = None
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.RESULTS_STREAM_BROKER)(
+            history=settings.RESULTS_STREAM_HISTORY, max_polls=settings.RESULTS_STREAM_MAX_POLLS,
+        )
+    return _broker
+
+def publish_votes(poll_id, deltas):
+    """
+    Announces votes once the current transaction commits.
+    `deltas` maps option ids to the number of votes they gained.
+    """
+    transaction.on_commit(lambda: get_broker().publish(poll_id, 'votes', {str(k): v for k, v in deltas.items()}))
+
+def publish_reset(poll_id):
+    """
+    Tells subscribers to reload the poll's results once the current transaction commits
+    """
+    transaction.on_commit(lambda: get_broker().publish(poll_id, RESET))
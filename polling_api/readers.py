@@ -0,0 +1,148 @@
+from asgiref.sync import sync_to_async
+from functools import partial
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from . import counters
+from .models import Option, Poll
+from .serializers import OptionSerializer, PollResultsSerializer, PollSerializer
+
+# Fields whose database value is already what the serializer would output
+PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.PrimaryKeyRelatedField)
+
+
+class FieldPlan:
+    """
+    Builds the payload of a read-only serializer straight from `.values()`
+    rows, without instantiating models or serializer fields per row.
+
+    The plan is compiled once from the serializer's own fields, so it follows
+    their order and output formats. Nested serializers and method fields are
+    left to the caller, who passes their values to the renderer.
+    """
+    def __init__(self, serializer_class):
+        model = serializer_class.Meta.model
+        self.fields = []
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)):
+                self.fields.append((name, None, None))
+                continue
+            column = model._meta.get_field(field.source).attname
+            self.fields.append((name, column, self.get_converter(field)))
+            self.columns.append(column)
+
+    def get_converter(self, field):
+        """
+        Returns None if the field outputs database values as they are, or a
+        function taking the active time zone and returning the field's converter
+        """
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return None
+        if (
+            isinstance(field, serializers.DateTimeField)
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601
+            and not hasattr(field, 'timezone')
+            and settings.USE_TZ
+        ):
+            # What DateTimeField.to_representation does with aware datetimes, minus
+            # looking up the time zone for every value
+            return lambda tz: partial(format_datetime, tz=tz)
+        return lambda tz: field.to_representation
+
+    def renderer(self):
+        """
+        Returns a function building the payload of one row, given the row and
+        the values of the fields the plan leaves to the caller
+        """
+        tz = timezone.get_current_timezone()
+        fields = [
+            (name, column, None if converter is None else converter(tz))
+            for name, column, converter in self.fields
+        ]
+
+        def render(row, **values):
+            data = {}
+            for name, column, convert in fields:
+                if column is None:
+                    data[name] = values[name]
+                    continue
+                value = row[column]
+                data[name] = value if convert is None or value is None else convert(value)
+            return data
+        return render
+
+
+def format_datetime(value, tz):
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+poll_plan = FieldPlan(PollSerializer)
+option_plan = FieldPlan(OptionSerializer)
+results_plan = FieldPlan(PollResultsSerializer)
+
+
+def get_poll_rows(queryset, *extra):
+    """
+    Returns `queryset` as `.values()` rows holding what the poll payload
+    needs, plus the `extra` fields
+    """
+    return queryset.prefetch_related(None).values(*poll_plan.columns, *extra)
+
+def serialize_polls(rows):
+    """
+    Returns the `PollSerializer` payload of each poll row, with its options
+    fetched in one query
+    """
+    render_poll, render_option = poll_plan.renderer(), option_plan.renderer()
+    options = {row['id']: [] for row in rows}
+    for option in Option.objects.filter(poll_id__in=list(options)).values('poll_id', *option_plan.columns):
+        options[option['poll_id']].append(render_option(option))
+    return [render_poll(row, options=options[row['id']]) for row in rows]
+
+async def aserialize_polls(rows):
+    """
+    Async variant of `serialize_polls`
+    """
+    render_poll, render_option = poll_plan.renderer(), option_plan.renderer()
+    options = {row['id']: [] for row in rows}
+    async for option in Option.objects.filter(poll_id__in=list(options)).values('poll_id', *option_plan.columns):
+        options[option['poll_id']].append(render_option(option))
+    return [render_poll(row, options=options[row['id']]) for row in rows]
+
+def get_results_rows(queryset):
+    """
+    Returns `queryset` as `.values()` rows holding what the results payload
+    needs, including the fields `counters` reads
+    """
+    return queryset.values(*results_plan.columns, 'results_snapshot', 'archived_at')
+
+def serialize_results(row):
+    """
+    Returns the `PollResultsSerializer` payload of a results row, freezing the
+    poll's results first if it has closed
+    """
+    poll = Poll(**row)
+    counters.finalize_if_closed(poll)
+    return results_plan.renderer()(row, results=counters.get_results(poll), total_votes=counters.get_total_votes(poll))
+
+async def aserialize_results(row):
+    """
+    Async variant of `serialize_results`
+    """
+    poll = Poll(**row)
+    if poll.results_snapshot is None and poll.is_closed():
+        await sync_to_async(counters.finalize)(poll)
+    if poll.results_snapshot is None:
+        results = await counters.aget_results(poll.id)
+        total_votes = sum(result['votes'] for result in results)
+    else:
+        results = counters.get_results(poll)
+        total_votes = counters.get_total_votes(poll)
+    return results_plan.renderer()(row, results=results, total_votes=total_votes)
@@ -0,0 +1,111 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+# Replica the current request reads from, or None for the primary
+_replica = ContextVar('replica', default=None)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica picked for the current request, if any (see
+    `ReplicaReadsMixin`), and everything else to the primary. Reads inside a
+    transaction on the primary stay there.
+    """
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        # Without this, saving an object read from a replica would write to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def read_from_replica():
+    """
+    Sends the reads of the current request to a replica, the same one for
+    the whole request so it sees a single point in time
+    """
+    if settings.DATABASE_REPLICAS:
+        _replica.set(random.choice(settings.DATABASE_REPLICAS))
+
+def read_from_primary():
+    _replica.set(None)
+
+def get_replica():
+    return _replica.get()
+
+@contextmanager
+def primary():
+    """
+    Sends the reads in the block to the primary
+    """
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+def _pin_key(user_id):
+    return f'read-your-writes:{user_id}'
+
+def pin(request, response):
+    """
+    Keeps the client's reads on the primary for READ_YOUR_WRITES_WINDOW
+    seconds, so they see what it just wrote: with a cookie, and for signed-in
+    users in the cache too, which also covers their other clients
+    """
+    window = settings.READ_YOUR_WRITES_WINDOW
+    if not settings.DATABASE_REPLICAS or not window:
+        return
+    response.set_cookie(
+        settings.READ_YOUR_WRITES_COOKIE, str(int(time.time() + window)), max_age=window,
+        httponly=True, secure=request.is_secure(), samesite='Lax',
+    )
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cache.set(_pin_key(user.pk), True, window)
+
+def is_pinned(request):
+    try:
+        if float(request.COOKIES.get(settings.READ_YOUR_WRITES_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated and cache.get(_pin_key(user.pk), False)
+
+
+class ReplicaReadsMixin:
+    """
+    Serves safe requests from a read replica, unless the client wrote in the
+    last READ_YOUR_WRITES_WINDOW seconds, and pins clients to the primary
+    after a successful write. Authentication, permission and throttle checks
+    read from the primary.
+    """
+    def initial(self, request, *args, **kwargs):
+        read_from_primary()
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and settings.DATABASE_REPLICAS and not is_pinned(request):
+            read_from_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Reset here rather than around dispatch, which the async viewsets replace
+        read_from_primary()
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin(request, response)
+        return response
@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from collections import Counter
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Vote, VoteRollup, VoteRollupMark
+
+logger = logging.getLogger(__name__)
+
+MARK_ID = 1
+
+TRUNCATE = {
+    'minute': lambda at: at.replace(second=0, microsecond=0),
+    'hour': lambda at: at.replace(minute=0, second=0, microsecond=0),
+    'day': lambda at: at.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+def catch_up(batch_size=None, poll=None):
+    """
+    Counts the votes not rolled up yet into the minute, hour and day rollups,
+    `batch_size` votes per transaction, and flags them in the same
+    transaction. Votes committed late, e.g. by a slow transaction holding a
+    lower id, are picked up by the next run.
+
+    Returns the number of votes rolled up, or 0 straight away if another
+    process is already catching up. With `poll`, only that poll's votes are
+    rolled up, once any other process is done.
+    """
+    if batch_size is None:
+        batch_size = settings.VOTE_ROLLUP_BATCH_SIZE
+
+    VoteRollupMark.objects.get_or_create(pk=MARK_ID)
+    votes = Vote.objects.filter(rolled_up=False)
+    if poll is not None:
+        votes = votes.filter(poll=poll)
+    rolled_up = 0
+    while True:
+        with transaction.atomic():
+            mark = VoteRollupMark.objects.select_for_update(skip_locked=poll is None).filter(pk=MARK_ID).first()
+            if mark is None:
+                return rolled_up
+
+            batch = list(votes.order_by('id').values_list('id', 'poll_id', 'option_id', 'voted_at')[:batch_size])
+            if batch:
+                add_votes(batch)
+                Vote.objects.filter(id__in=[vote[0] for vote in batch]).update(rolled_up=True)
+            mark.updated_at = timezone.now()
+            mark.save(update_fields=['updated_at'])
+
+        rolled_up += len(batch)
+        if len(batch) < batch_size:
+            return rolled_up
+
+_lock = threading.Lock()
+_caught_up_at = float('-inf')
+
+def maybe_catch_up():
+    """
+    Catches up unless this process already did in the last
+    VOTE_ROLLUP_INTERVAL seconds. Run as votes are ingested, so failures are
+    logged rather than raised.
+    """
+    global _caught_up_at
+    if time.monotonic() - _caught_up_at < settings.VOTE_ROLLUP_INTERVAL or not _lock.acquire(blocking=False):
+        return
+    try:
+        _caught_up_at = time.monotonic()
+        catch_up()
+    except Exception:
+        logger.exception('Failed to roll up votes')
+    finally:
+        _lock.release()
+
+def add_votes(votes):
+    """
+    Adds `votes`, (id, poll id, option id, voted_at) tuples, to their buckets
+    with one upsert per bucket, sent in a single round trip
+    """
+    counts = Counter()
+    for _, poll_id, option_id, voted_at in votes:
+        for granularity, truncate in TRUNCATE.items():
+            counts[(poll_id, option_id, granularity, truncate(voted_at))] += 1
+
+    qn = connection.ops.quote_name
+    adapt = connection.ops.adapt_datetimefield_value
+    table = qn(VoteRollup._meta.db_table)
+    sql = (
+        f'INSERT INTO {table} (poll_id, option_id, granularity, bucket, votes) VALUES (%s, %s, %s, %s, %s) '
+        f'ON CONFLICT (option_id, granularity, bucket) DO UPDATE SET votes = {table}.votes + EXCLUDED.votes'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (poll_id, option_id, granularity, adapt(bucket), amount)
+            for (poll_id, option_id, granularity, bucket), amount in counts.items()
+        ])
+
+def get_histogram(poll, granularity, since=None, until=None):
+    """
+    Returns the poll's votes per `granularity` bucket between `since` and
+    `until`, each bucket with its per-option counts, total and the running
+    total of the poll's votes. Buckets without votes are left out.
+    """
+    rollups = VoteRollup.objects.filter(poll=poll, granularity=granularity)
+    cumulative = 0
+    if since is not None:
+        cumulative = rollups.filter(bucket__lt=since).aggregate(votes=Sum('votes'))['votes'] or 0
+        rollups = rollups.filter(bucket__gte=since)
+    if until is not None:
+        rollups = rollups.filter(bucket__lt=until)
+
+    buckets = []
+    for bucket, option_id, votes in rollups.order_by('bucket', 'option_id').values_list('bucket', 'option_id', 'votes'):
+        if not buckets or buckets[-1]['start'] != bucket:
+            buckets.append({'start': bucket, 'votes': {}, 'total': 0, 'cumulative': cumulative})
+        current = buckets[-1]
+        current['votes'][str(option_id)] = votes
+        current['total'] += votes
+        current['cumulative'] += votes
+        cumulative += votes
+    return buckets
+
+def get_mark():
+    return VoteRollupMark.objects.filter(pk=MARK_ID).first()
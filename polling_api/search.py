@@ -0,0 +1,61 @@
+import re
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+from .models import Poll
+
+POLL_TABLE = Poll._meta.db_table
+FTS_TABLE = f'{POLL_TABLE}_fts'
+
+# Must match the expression of the index created in migration 0007 so
+# PostgreSQL can use it
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+
+def search_polls(queryset, query):
+    """
+    Filters polls to those matching `query` on title or description and
+    annotates each with a `search_rank`, higher being more relevant.
+    Uses full-text and trigram indexes on PostgreSQL and an FTS5 index on SQLite.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == 'postgresql':
+        return search_postgres(queryset, query)
+    if connection.vendor == 'sqlite':
+        return search_sqlite(queryset, terms)
+    return queryset.filter(title__icontains=query).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+def search_postgres(queryset, query):
+    tsquery = "websearch_to_tsquery('english', %s)"
+    # Trigrams are case-insensitive; UPPER(title) is what the index of
+    # migration 0011 covers, for the title filter's icontains as well
+    matches = RawSQL(
+        f'({POSTGRES_VECTOR}) @@ {tsquery} OR UPPER(title) %% UPPER(%s)',
+        [query, query],
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        f'greatest(ts_rank({POSTGRES_VECTOR}, {tsquery}), similarity(UPPER(title), UPPER(%s)))::float8',
+        [query, query],
+        output_field=FloatField(),
+    )
+    return queryset.filter(matches).annotate(search_rank=rank)
+
+def search_sqlite(queryset, terms):
+    # Quote every term so user input can't inject FTS5 syntax, and match prefixes
+    fts_query = ' '.join('"{}"*'.format(term) for term in terms)
+    matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [fts_query])
+    # bm25 is lower for better matches; title hits weigh more than description hits
+    rank = RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {POLL_TABLE}.id',
+        [fts_query],
+        output_field=FloatField(),
+    )
+    return queryset.filter(id__in=matches).annotate(search_rank=rank)
@@ -1,9 +1,13 @@
 from rest_framework import serializers
-from .models import Poll, Option, Vote
+from rest_framework.settings import api_settings
+from django.http import Http404
+from .models import Poll, Option, Vote, VoteRollup
 from django.contrib.auth.models import User
-from django.db.models import Count
 from django.db import transaction
 from django.utils import timezone
+from . import counters, pubsub, rollups
+from .cache import results_cache
+from .ingest import VoteRejected, vote_buffer
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -29,40 +33,92 @@ class UserSerializer(serializers.ModelSerializer):
         return super().partial_update(instance, validated_data)
 
 class VoteSerializer(serializers.ModelSerializer):
+    option = serializers.IntegerField(source='option_id')
+
     class Meta:
         model = Vote
-        fields = '__all__'
+        fields = ['id', 'voted_at', 'ip_hash', 'session_id', 'poll', 'option', 'voted_by']
+        read_only_fields = ['poll', 'voted_by']
         extra_kwargs = {
-            'poll': {'required': False}
+            'ip_hash': {'required': False},
+            'session_id': {'required': False},
         }
+        # Repeat votes are rejected by the database constraints when the vote is cast
+        validators = []
 
     def validate(self, data):
-        poll = self.context.get('poll')
         user = self.context.get('user')
-        option = data.get('option')
-        ip_hash = data.get('ip_hash')
-        session_id = data.get('session_id')
 
-        data['poll'] = poll
-        data['voted_by'] = user
+        if not user and not (data.get('ip_hash') and data.get('session_id')):
+            raise serializers.ValidationError("You must be either authenticated or provide an IP address and session ID")
+        return data
+
+    def create(self, validated_data):
+        """
+        Casts the vote with a single INSERT that also checks the poll, the option
+        and the uniqueness constraints, and explains the rejection if it fails
+        """
+        poll_id = self.context.get('poll_id')
+        user = self.context.get('user')
+
+        with transaction.atomic():
+            vote = Vote.objects.cast(
+                poll_id,
+                validated_data['option_id'],
+                voted_by=user,
+                ip_hash=None if user else validated_data.get('ip_hash'),
+                session_id=None if user else validated_data.get('session_id'),
+            )
+            if vote:
+                counters.increment(vote.poll_id, vote.option_id)
+                results_cache.invalidate(vote.poll_id)
+                pubsub.publish_votes(vote.poll_id, {vote.option_id: 1})
+                transaction.on_commit(rollups.maybe_catch_up)
+        if vote is None:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [self.get_rejection_reason(validated_data)]})
+        return vote
+
+    def enqueue(self, buffer=vote_buffer):
+        """
+        Hands the vote to the write-behind buffer instead of saving it
+        """
+        user = self.context.get('user')
+        vote = Vote(
+            poll_id=self.context.get('poll_id'),
+            option_id=self.validated_data['option_id'],
+            voted_at=timezone.now(),
+            voted_by=user,
+            ip_hash=None if user else self.validated_data.get('ip_hash'),
+            session_id=None if user else self.validated_data.get('session_id'),
+        )
+        try:
+            buffer.submit(vote)
+        except VoteRejected as e:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [str(e)]})
+        self.instance = vote
+        return vote
+
+    def get_rejection_reason(self, validated_data):
+        poll = Poll.objects.filter(pk=self.context.get('poll_id')).first()
+        user = self.context.get('user')
+
+        if poll is None:
+            raise Http404('No Poll matches the given query.')
+        if poll.expire_date < timezone.now():
+            return "This poll has already expired"
 
-        if not poll.expire_date or poll.expire_date < timezone.now():
-            raise serializers.ValidationError("This poll has already expired")
-        
         if user:
-            if poll.votes.filter(voted_by=user).exists():
-                raise serializers.ValidationError("You have already voted in this poll")
-        elif ip_hash and session_id:
-            if poll.votes.filter(ip_hash=ip_hash, session_id=session_id).exists():
-                raise serializers.ValidationError("You have already voted in this poll")
+            already_voted = poll.votes.filter(voted_by=user)
         else:
-            raise serializers.ValidationError("You must be either authenticated or provide an IP address and session ID")
-        
-        if option not in poll.options.all():
-            raise serializers.ValidationError("This option is not part of the poll")
-        return data
+            already_voted = poll.votes.filter(ip_hash=validated_data.get('ip_hash'), session_id=validated_data.get('session_id'))
+        if already_voted.exists():
+            return "You have already voted in this poll"
+        return "This option is not part of the poll"
 
 class OptionSerializer(serializers.ModelSerializer):
+    # Writable so updates can refer to existing options; ignored on create
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = Option
         fields = ['text', 'id']
@@ -81,9 +137,27 @@ class PollSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'created_by', 'pub_date', 'expire_date', 'options']
         read_only_fields = ['created_by', 'pub_date']
     
+    def validate(self, data):
+        # Archived polls are cached publicly (see conditional.get_max_age)
+        if self.instance is not None and self.instance.archived_at:
+            raise serializers.ValidationError("Archived polls can't be edited")
+        return data
+
     def validate_options(self, options):
         if len(options) < 2:
             raise serializers.ValidationError("A poll must have at least two options")
+        if any('id' not in option and 'text' not in option for option in options):
+            raise serializers.ValidationError("New options must have a text")
+
+        if self.instance is not None:
+            ids = [option['id'] for option in options if 'id' in option]
+            if len(ids) != len(set(ids)):
+                raise serializers.ValidationError("An option can only be listed once")
+            unknown = set(ids) - {opt.id for opt in self.instance.options.all()}
+            if unknown:
+                raise serializers.ValidationError(
+                    f"Options {', '.join(map(str, sorted(unknown)))} are not part of this poll"
+                )
         return options
     
     def create(self, validated_data):
@@ -93,12 +167,11 @@ class PollSerializer(serializers.ModelSerializer):
 
         with transaction.atomic():
             poll = Poll.objects.create(**validated_data)
-            for option in options:
-                Option.objects.create(poll=poll, **option)
+            Option.objects.bulk_create([Option(poll=poll, text=option['text']) for option in options])
         return poll
     
     def update(self, instance, validated_data):
-        options = validated_data.pop('options')
+        options = validated_data.pop('options', None)
 
         # Remove fields that should not be updated
         validated_data.pop('created_by', None)
@@ -108,23 +181,44 @@ class PollSerializer(serializers.ModelSerializer):
             instance.title = validated_data.get('title', instance.title)
             instance.description = validated_data.get('description', instance.description)
             instance.expire_date = validated_data.get('expire_date', instance.expire_date)
+            # Edits can reopen the poll or rename options; refreeze on the next read if still closed
+            instance.results_snapshot = None
+            instance.finalized_at = None
             instance.save()
 
-            existing_options = {opt.id: opt for opt in instance.options.all()}
-            for option in options:
-                if 'id' in option:
-                    opt = existing_options.pop(option['id'])
-                    opt.text = option.get('text', opt.text)
-                    opt.save()
-                else:
-                    Option.objects.create(poll=instance, **option)
-            for opt in existing_options.values():
-                opt.delete()
+            if options is not None:
+                self.update_options(instance, options)
+            results_cache.invalidate(instance.id)
+            pubsub.publish_reset(instance.id)
         return instance
 
+    def update_options(self, instance, options):
+        """
+        Creates, renames and deletes the poll's options to match `options`,
+        in a fixed number of queries however many options the poll has
+        """
+        existing_options = {opt.id: opt for opt in instance.options.all()}
+        new_options = []
+        changed_options = []
+        for option in options:
+            if 'id' not in option:
+                new_options.append(Option(poll=instance, text=option['text']))
+                continue
+            opt = existing_options.pop(option['id'])
+            if opt.text != option.get('text', opt.text):
+                opt.text = option['text']
+                changed_options.append(opt)
+
+        if existing_options:
+            Option.objects.filter(poll=instance, id__in=existing_options).delete()
+        if changed_options:
+            Option.objects.bulk_update(changed_options, ['text'])
+        if new_options:
+            Option.objects.bulk_create(new_options)
+
 class PollResultsSerializer(serializers.ModelSerializer):
     results = serializers.SerializerMethodField()
-    total_votes = serializers.IntegerField(source='votes.count', read_only=True)
+    total_votes = serializers.SerializerMethodField()
 
     class Meta:
         model = Poll
@@ -134,4 +228,12 @@ class PollResultsSerializer(serializers.ModelSerializer):
         """
         Returns a list of options and their vote counts
         """
-        return obj.options.values('id', 'text').annotate(votes=Count('vote'))
\ No newline at end of file
+        return counters.get_results(obj)
+
+    def get_total_votes(self, obj):
+        return counters.get_total_votes(obj)
+
+class PollAnalyticsQuerySerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=VoteRollup.GRANULARITIES, default='hour')
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
@@ -0,0 +1,185 @@
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from .async_views import AsyncPollViewSet
+from .serializers import PollAnalyticsQuerySerializer, PollResultsSerializer
+from .views import (
+    CustomTokenObtainPairView, CustomTokenRefreshView, PollViewSet, cache_stats, forgot_password, logout,
+    reset_password, signup,
+)
+
+# Swagger documentation of the API views. It's attached to the views when the
+# OpenAPI document is first generated (see polling_site.schema), so serving
+# the API doesn't import drf_yasg or build these objects.
+
+vote_request_body = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    required=['option'],
+    properties={
+        'option': openapi.Schema(type=openapi.TYPE_INTEGER, description='Option ID to vote for'),
+    }
+)
+
+poll_list_parameters = [
+    openapi.Parameter(
+        'title',
+        openapi.IN_QUERY,
+        description='Filter by title',
+        type=openapi.TYPE_STRING
+    ),
+    openapi.Parameter(
+        'created_by',
+        openapi.IN_QUERY,
+        description='Filter by creator ID',
+        type=openapi.TYPE_INTEGER
+    ),
+    openapi.Parameter(
+        'is_ongoing',
+        openapi.IN_QUERY,
+        description='Filter ongoing polls',
+        type=openapi.TYPE_BOOLEAN
+    ),
+    openapi.Parameter(
+        'search',
+        openapi.IN_QUERY,
+        description='Search titles and descriptions, most relevant first',
+        type=openapi.TYPE_STRING
+    ),
+]
+
+export_filter_parameters = [
+    parameter for parameter in poll_list_parameters if parameter.name != 'search'
+] + [
+    openapi.Parameter(
+        'search',
+        openapi.IN_QUERY,
+        description='Only export polls whose title or description matches',
+        type=openapi.TYPE_STRING
+    ),
+]
+
+export_parameters = [
+    openapi.Parameter(
+        'format',
+        openapi.IN_QUERY,
+        description='Export format: csv (default) or ndjson',
+        type=openapi.TYPE_STRING,
+        enum=['csv', 'ndjson']
+    ),
+    openapi.Parameter(
+        'type',
+        openapi.IN_QUERY,
+        description='votes (default) for one row per vote, or results for one row per option',
+        type=openapi.TYPE_STRING,
+        enum=['votes', 'results']
+    ),
+]
+
+# Polls. The async viewset overrides list, vote and results, and inherits the rest.
+for viewset in (PollViewSet, AsyncPollViewSet):
+    swagger_auto_schema(manual_parameters=poll_list_parameters)(viewset.list)
+    swagger_auto_schema(method='post', request_body=vote_request_body)(viewset.vote)
+    swagger_auto_schema(method='get', responses={200: PollResultsSerializer})(viewset.results)
+
+swagger_auto_schema(method='get', query_serializer=PollAnalyticsQuerySerializer)(PollViewSet.analytics)
+swagger_auto_schema(method='get', manual_parameters=export_parameters)(PollViewSet.export)
+swagger_auto_schema(
+    method='get',
+    manual_parameters=export_filter_parameters + export_parameters
+)(PollViewSet.bulk_export)
+
+swagger_auto_schema(
+    method='get',
+    operation_summary='Results cache statistics',
+    operation_description='Hit, miss and eviction counters of the poll results cache in this process',
+)(cache_stats)
+
+# Auth
+
+swagger_auto_schema(
+    tags=['auth'],
+    operation_summary='Login',
+    operation_description='Authenticate a user and get access & refresh tokens',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['username', 'password'],
+        properties={
+            'username': openapi.Schema(type=openapi.TYPE_STRING),
+            'password': openapi.Schema(type=openapi.TYPE_STRING),
+        }
+    )
+)(CustomTokenObtainPairView.post)
+
+swagger_auto_schema(
+    tags=['auth'],
+    operation_summary='Refresh Token',
+    operation_description='Get a new access token using the refresh token',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['refresh'],
+        properties={
+            'refresh': openapi.Schema(type=openapi.TYPE_STRING),
+        }
+    )
+)(CustomTokenRefreshView.post)
+
+swagger_auto_schema(
+    method='post',
+    tags=['auth'],
+    operation_summary='Signup',
+    operation_description='Create a new user account',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['username', 'email', 'password'],
+        properties={
+            'username': openapi.Schema(type=openapi.TYPE_STRING),
+            'email': openapi.Schema(type=openapi.TYPE_STRING),
+            'password': openapi.Schema(type=openapi.TYPE_STRING),
+        }
+    )
+)(signup)
+
+swagger_auto_schema(
+    method='post',
+    tags=['auth'],
+    operation_summary='Logout',
+    operation_description='Logs out user by blacklisting the refresh token',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['refresh_token'],
+        properties={
+            'refresh_token': openapi.Schema(type=openapi.TYPE_STRING),
+        }
+    )
+)(logout)
+
+swagger_auto_schema(
+    method='post',
+    tags=['auth'],
+    operation_summary='Forgot Password',
+    operation_description='Send an email with a link to reset your password',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['email', 'front_end_url'],
+        properties={
+            'email': openapi.Schema(type=openapi.TYPE_STRING),
+            'front_end_url': openapi.Schema(type=openapi.TYPE_STRING, description='Frontend URL where user will reset password'),
+            'sender_email': openapi.Schema(type=openapi.TYPE_STRING, description='Email address to send the reset link from'),
+        }
+    )
+)(forgot_password)
+
+swagger_auto_schema(
+    method='post',
+    tags=['auth'],
+    operation_summary='Reset Password',
+    operation_description='Reset user password using the token sent to their email',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['token', 'uid', 'password'],
+        properties={
+            'token': openapi.Schema(type=openapi.TYPE_STRING, description='Token sent to user email'),
+            'uid': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID'),
+            'password': openapi.Schema(type=openapi.TYPE_STRING, description='New password'),
+        }
+    )
+)(reset_password)
@@ -1,3 +1,1626 @@
-from django.test import TestCase
+import asyncio
+import csv
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipIf
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.db.models import F, Sum
+from django.db.migrations.executor import MigrationExecutor
+from django.http import StreamingHttpResponse
+from django.urls import include, path
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.routers import DefaultRouter
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from polling_site.schema import SchemaCache, generate_schema
+from . import authentication, counters, exports, pubsub, readers, rollups, voters
+from .archive import archive_poll
+from .async_views import AsyncPollViewSet
+from .blacklist import GENERATION_KEY, BloomFilter, RefreshToken, TokenBlacklist, token_blacklist
+from .cache import results_cache
+from .checks import check_results_cache, check_vote_ingest
+from .ingest import VoteBuffer, voter_key
+from .metrics import registry, render_pool_metrics
+from .pagination import PollPagination
+from .models import Option, Poll, Vote, VoteCounter, VoteRollup
+from .serializers import PollAnalyticsQuerySerializer, PollResultsSerializer, PollSerializer, VoteSerializer
+from .throttles import ScopedRateThrottle
 
-# Create your tests here.
+
+def make_poll(user, title='Favourite colour', description='Pick one', expires_in=timedelta(days=1), options=('Red', 'Blue')):
+    poll = Poll.objects.create(
+        title=title, description=description, created_by=user, expire_date=timezone.now() + expires_in,
+    )
+    Option.objects.bulk_create([Option(poll=poll, text=text) for text in options])
+    return poll
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # Throttle counters and cached payloads live in the cache
+        cache.clear()
+        results_cache.local.clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.client = APIClient()
+
+
+class ResultsCacheTests(APITestCase):
+    def test_missing_poll_gets_no_version(self):
+        response = self.client.get('/api/polls/999/results/')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(results_cache.backend.get('polls:999:version'))
+
+    def test_versions_expire(self):
+        poll = make_poll(self.user)
+        self.assertEqual(self.client.get(f'/api/polls/{poll.id}/').status_code, 200)
+        self.assertIsNotNone(results_cache.backend.get(f'polls:{poll.id}:version'))
+
+        later = time.time() + settings.RESULTS_CACHE_VERSION_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertIsNone(results_cache.backend.get(f'polls:{poll.id}:version'))
+
+    @override_settings(WEB_CONCURRENCY=4)
+    def test_per_process_cache_with_several_workers_is_an_error(self):
+        self.assertEqual([error.id for error in check_results_cache(None)], ['polling_api.E001'])
+
+    @override_settings(SERVERLESS=True)
+    def test_per_process_cache_on_serverless_is_an_error(self):
+        self.assertEqual([error.id for error in check_results_cache(None)], ['polling_api.E001'])
+
+    @override_settings(SERVERLESS=True, WEB_CONCURRENCY=4, CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache', 'LOCATION': 'localhost:11211'},
+    })
+    def test_shared_cache_with_several_processes_passes(self):
+        self.assertEqual(check_results_cache(None), [])
+
+    def test_stats_are_counted_across_threads(self):
+        before = results_cache.stats()['hits']
+
+        def record():
+            for _ in range(1000):
+                results_cache.record('hits')
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results_cache.stats()['hits'] - before, 8000)
+
+    def test_etag_changes_after_a_vote(self):
+        poll = make_poll(self.user)
+        etag = self.client.get(f'/api/polls/{poll.id}/results/')['ETag']
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/polls/{poll.id}/vote/', {'option': poll.options.first().id}, format='json')
+
+        response = self.client.get(f'/api/polls/{poll.id}/results/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_votes'], 1)
+
+    def test_unchanged_results_are_not_resent(self):
+        poll = make_poll(self.user)
+        for url in (f'/api/polls/{poll.id}/results/', '/api/polls/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertNotIn('Last-Modified', response)
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    @override_settings(WEB_CONCURRENCY=2)
+    def test_no_etags_without_a_shared_cache(self):
+        # Each process would tag responses with versions of its own
+        poll = make_poll(self.user)
+        for url in (f'/api/polls/{poll.id}/', f'/api/polls/{poll.id}/results/', '/api/polls/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        make_poll(self.user)
+
+    def query_counts(self):
+        return [histogram.sum for histogram in registry.histograms['polling_db_queries'].values()]
+
+    def test_queries_are_counted(self):
+        self.assertEqual(self.client.get('/api/polls/').status_code, 200)
+
+        self.assertEqual(len(self.query_counts()), 1)
+        self.assertGreater(self.query_counts()[0], 0)
+
+    async def test_queries_are_counted_under_asgi(self):
+        # The ORM runs in another thread than the middleware here
+        response = await AsyncClient().get('/api/polls/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.query_counts()), 1)
+        self.assertGreater(self.query_counts()[0], 0)
+
+
+class PoolMetricsTests(SimpleTestCase):
+    # psycopg leaves the counters that are still zero out of get_stats()
+    stats = {
+        'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1, 'requests_waiting': 2,
+        'requests_num': 10, 'requests_queued': 3, 'requests_wait_ms': 1500, 'requests_errors': 1,
+        'connections_num': 5, 'connections_ms': 250,
+    }
+    idle_stats = {'pool_min': 2, 'pool_max': 10, 'pool_size': 2, 'pool_available': 2, 'requests_waiting': 0}
+
+    def fake_pools(self, **stats):
+        return mock.patch('polling_api.metrics.get_pool_stats', return_value=stats)
+
+    def test_pool_stats_are_rendered(self):
+        with self.fake_pools(default=self.stats):
+            lines = render_pool_metrics().splitlines()
+
+        self.assertEqual(lines[:3], [
+            '# HELP polling_db_pool_connections Connections open in the pool',
+            '# TYPE polling_db_pool_connections gauge',
+            'polling_db_pool_connections{database="default"} 4',
+        ])
+        for sample in (
+            'polling_db_pool_available{database="default"} 1',
+            'polling_db_pool_checked_out{database="default"} 3',
+            'polling_db_pool_waiting{database="default"} 2',
+            'polling_db_pool_requests_total{database="default"} 10',
+            'polling_db_pool_queued_total{database="default"} 3',
+            'polling_db_pool_wait_seconds_total{database="default"} 1.5',
+            'polling_db_pool_timeouts_total{database="default"} 1',
+            'polling_db_pool_connects_total{database="default"} 5',
+            'polling_db_pool_connect_seconds_total{database="default"} 0.25',
+        ):
+            self.assertIn(sample, lines)
+        self.assertIn('# TYPE polling_db_pool_requests_total counter', lines)
+
+    def test_each_pool_is_labelled_and_missing_counters_are_zero(self):
+        with self.fake_pools(replica_1=self.idle_stats, default=self.stats):
+            lines = render_pool_metrics().splitlines()
+
+        self.assertEqual(
+            [line for line in lines if line.startswith('polling_db_pool_requests_total')],
+            ['polling_db_pool_requests_total{database="default"} 10',
+             'polling_db_pool_requests_total{database="replica_1"} 0'],
+        )
+        self.assertIn('polling_db_pool_wait_seconds_total{database="replica_1"} 0.0', lines)
+
+    def test_nothing_without_a_pool(self):
+        self.assertEqual(render_pool_metrics(), '')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_includes_the_pool(self):
+        with self.fake_pools(default=self.stats):
+            response = self.client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('polling_db_pool_checked_out{database="default"} 3', response.content.decode())
+
+
+class ClosedPollCachingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user, expires_in=-timedelta(days=1))
+
+    def test_closed_polls_are_revalidated(self):
+        for url in (f'/api/polls/{self.poll.id}/', f'/api/polls/{self.poll.id}/results/'):
+            self.assertEqual(self.client.get(url)['Cache-Control'], 'no-cache')
+
+    def test_archived_polls_are_cached(self):
+        etag = self.client.get(f'/api/polls/{self.poll.id}/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_poll(self.poll)
+
+        response = self.client.get(f'/api/polls/{self.poll.id}/')
+        self.assertNotEqual(response['ETag'], etag)
+        for response in (response, self.client.get(f'/api/polls/{self.poll.id}/results/')):
+            self.assertEqual(response['Cache-Control'], f'public, max-age={settings.CLOSED_POLL_MAX_AGE}')
+
+    def test_archived_polls_cant_be_edited(self):
+        archive_poll(self.poll)
+        self.client.force_authenticate(self.user)
+
+        response = self.client.patch(f'/api/polls/{self.poll.id}/', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ["Archived polls can't be edited"]})
+
+
+class ReadersTests(APITestCase):
+    """
+    The fast read path must render byte for byte what the serializers would
+    """
+    def setUp(self):
+        super().setUp()
+        self.open = make_poll(self.user, description='')
+        self.unvoted = make_poll(self.user, title='Nobody voted yet')
+        self.closed = make_poll(self.user, title='Closed', expires_in=-timedelta(days=1))
+        self.archived = make_poll(self.user, title='Archived', expires_in=-timedelta(days=1))
+
+        self.vote(self.open, 'Red')
+        self.vote(self.open, 'Blue', voter='bob')
+        for poll in (self.closed, self.archived):
+            self.vote(poll, 'Blue', voted_at=timezone.now() - timedelta(days=2))
+        counters.finalize(self.closed)
+        archive_poll(self.archived)
+
+    def vote(self, poll, text, voter=None, voted_at=None):
+        option = poll.options.get(text=text)
+        voted_by = User.objects.create_user(voter) if voter else self.user
+        Vote.objects.cast(poll.id, option.id, voted_by=voted_by, voted_at=voted_at)
+        counters.increment(poll.id, option.id)
+
+    def assertSameJSON(self, data, expected):
+        self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_list(self):
+        polls = Poll.objects.order_by('id')
+        expected = PollSerializer(polls, many=True).data
+        rows = list(readers.get_poll_rows(polls))
+
+        self.assertSameJSON(readers.serialize_polls(rows), expected)
+        self.assertSameJSON(async_to_sync(readers.aserialize_polls)(rows), expected)
+
+    def test_retrieve(self):
+        for poll in Poll.objects.all():
+            with self.subTest(poll=poll.title):
+                row = readers.get_poll_rows(Poll.objects.filter(pk=poll.pk)).get()
+                self.assertSameJSON(readers.serialize_polls([row])[0], PollSerializer(poll).data)
+
+    def test_results(self):
+        totals = {}
+        for poll in Poll.objects.all():
+            with self.subTest(poll=poll.title):
+                expected = PollResultsSerializer(poll).data
+                totals[poll.title] = expected['total_votes']
+                row = readers.get_results_rows(Poll.objects.filter(pk=poll.pk)).get()
+
+                self.assertSameJSON(readers.serialize_results(row), expected)
+                self.assertSameJSON(async_to_sync(readers.aserialize_results)(row), expected)
+
+        self.assertEqual(totals, {'Favourite colour': 2, 'Nobody voted yet': 0, 'Closed': 1, 'Archived': 1})
+
+    def test_results_of_closed_poll_before_snapshot(self):
+        poll = make_poll(self.user, title='Just closed', expires_in=-timedelta(minutes=1))
+        row = readers.get_results_rows(Poll.objects.filter(pk=poll.pk)).get()
+
+        data = readers.serialize_results(row)
+        self.assertSameJSON(data, PollResultsSerializer(Poll.objects.get(pk=poll.pk)).data)
+
+
+@override_settings(JWT_USER_CACHE_TIMEOUT=300)
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.url = f'/api/users/{self.user.id}/'
+
+    def test_users_are_cached(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        response = self.client.get(self.url)
+        # Session authentication comes first and sends no WWW-Authenticate
+        # challenge, so DRF answers failed authentication with a 403
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['code'], 'user_inactive')
+
+    def test_only_request_fields_are_cached(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        values = authentication.get_cache().get(authentication.get_cache_key(self.user.id))
+        self.assertEqual(dict(zip(authentication.get_cached_fields(User), values)), {
+            'id': self.user.id, 'username': 'alice', 'is_active': True, 'is_staff': False, 'is_superuser': False,
+        })
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['username'], 'alice')
+
+    @mock.patch('rest_framework_simplejwt.settings.api_settings.CHECK_REVOKE_TOKEN', True)
+    def test_password_change_revokes_cached_tokens(self):
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertIsNotNone(authentication.get_cache().get(authentication.get_cache_key(self.user.id, token['hash_password'])))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('changed')
+            self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['code'], 'password_changed')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_sizing(self):
+        bloom = BloomFilter(1000, false_positive_rate=0.01)
+
+        # About 9.6 bits and 7 hashes per item for 1%
+        self.assertEqual((bloom.size, bloom.hashes, len(bloom.bits)), (9585, 7, 1199))
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        items = [f'jti-{i}' for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+        self.assertEqual(bloom.count, 1000)
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+
+class TokenBlacklistTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        token_blacklist.reset()
+
+    def new_token(self):
+        return RefreshToken.for_user(self.user)
+
+    def jti(self, token):
+        return token.payload['jti']
+
+    def test_blacklisted_tokens_are_found(self):
+        blacklisted, other = self.new_token(), self.new_token()
+        blacklist = TokenBlacklist()
+        blacklisted.blacklist()
+
+        self.assertTrue(blacklist.contains(self.jti(blacklisted)))
+        with self.assertNumQueries(0):
+            self.assertFalse(blacklist.contains(self.jti(other)))
+
+    def test_other_processes_sync_on_logout(self):
+        token = self.new_token()
+        elsewhere = TokenBlacklist()
+        self.assertFalse(elsewhere.contains(self.jti(token)))
+
+        # The blacklist of this process bumps the generation in the shared cache
+        token.blacklist()
+
+        self.assertEqual(cache.get(GENERATION_KEY), 1)
+        self.assertTrue(elsewhere.contains(self.jti(token)))
+
+    def test_tokens_blacklisted_elsewhere_are_picked_up_after_the_interval(self):
+        token = self.new_token()
+        blacklist = TokenBlacklist()
+        self.assertFalse(blacklist.contains(self.jti(token)))
+        BlacklistedToken.objects.create(token=OutstandingToken.objects.get(jti=self.jti(token)))
+
+        self.assertFalse(blacklist.contains(self.jti(token)))
+        with override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0):
+            self.assertTrue(blacklist.contains(self.jti(token)))
+
+    def test_false_positives_are_checked_once(self):
+        token = self.new_token()
+        blacklist = TokenBlacklist()
+        blacklist.sync()
+        with mock.patch.object(BloomFilter, '__contains__', return_value=True):
+            with self.assertNumQueries(1):
+                self.assertFalse(blacklist.contains(self.jti(token)))
+            with self.assertNumQueries(0):
+                self.assertFalse(blacklist.contains(self.jti(token)))
+        self.assertEqual((blacklist.hits, blacklist.queries), (1, 1))
+
+    @override_settings(WEB_CONCURRENCY=2)
+    def test_several_processes_without_a_shared_cache_query_the_database(self):
+        token = self.new_token()
+        blacklist = TokenBlacklist()
+
+        with self.assertNumQueries(1):
+            self.assertFalse(blacklist.contains(self.jti(token)))
+        token.blacklist()
+        self.assertTrue(blacklist.contains(self.jti(token)))
+        self.assertIsNone(blacklist._filter)
+
+    def test_refreshing_after_logout_is_rejected(self):
+        token = self.new_token()
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post('/api/auth/token/refresh/', {'refresh': str(token)}).status_code, 200)
+
+        self.assertEqual(self.client.post('/api/auth/logout/', {'refresh_token': str(token)}).status_code, 200)
+
+        response = self.client.post('/api/auth/token/refresh/', {'refresh': str(token)})
+        self.assertEqual(response.status_code, 401)
+
+
+class PollOptionsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user)
+        self.red, self.blue = self.poll.options.all()
+        self.client.force_authenticate(self.user)
+
+    def edit(self, options):
+        return self.client.patch(f'/api/polls/{self.poll.id}/', {'options': options}, format='json')
+
+    def option_texts(self):
+        return list(self.poll.options.order_by('id').values_list('text', flat=True))
+
+    def test_create(self):
+        response = self.client.post('/api/polls/', {
+            'title': 'Favourite season', 'description': 'Pick one', 'expire_date': timezone.now() + timedelta(days=1),
+            'options': [{'text': 'Spring'}, {'text': 'Summer'}, {'text': 'Autumn'}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        poll = Poll.objects.get(pk=response.json()['id'])
+        self.assertEqual(list(poll.options.order_by('id').values_list('text', flat=True)), ['Spring', 'Summer', 'Autumn'])
+
+    def test_options_are_renamed_created_and_deleted(self):
+        response = self.edit([{'id': self.red.id, 'text': 'Crimson'}, {'text': 'Green'}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.option_texts(), ['Crimson', 'Green'])
+        self.assertEqual(self.poll.options.order_by('id').first().id, self.red.id)
+        self.assertFalse(Option.objects.filter(pk=self.blue.id).exists())
+
+    def test_options_listed_by_id_alone_are_kept(self):
+        response = self.edit([{'id': self.blue.id}, {'id': self.red.id}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.option_texts(), ['Red', 'Blue'])
+
+    def test_queries_dont_grow_with_the_options(self):
+        def count_queries(options):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.edit(options).status_code, 200)
+            return len(queries)
+
+        few = count_queries([{'id': self.red.id, 'text': 'Crimson'}, {'text': 'Green'}])
+        options = list(self.poll.options.order_by('id'))
+        many = count_queries(
+            [{'id': option.id, 'text': f'{option.text}!'} for option in options[1:]]
+            + [{'text': f'New {i}'} for i in range(8)]
+        )
+
+        self.assertEqual(many, few)
+        self.assertEqual(len(self.option_texts()), 9)
+
+    def test_invalid_options(self):
+        other = make_poll(self.user).options.first()
+        cases = [
+            ([{'id': self.red.id, 'text': 'Crimson'}, {'id': other.id}], f'Options {other.id} are not part of this poll'),
+            ([{'id': self.red.id}, {'id': 0}, {'id': other.id}], f'Options 0, {other.id} are not part of this poll'),
+            ([{'id': self.red.id}, {'id': self.red.id, 'text': 'Crimson'}], 'An option can only be listed once'),
+            ([{'id': self.red.id}, {}], 'New options must have a text'),
+            ([{'id': self.red.id}], 'A poll must have at least two options'),
+        ]
+        for options, error in cases:
+            with self.subTest(error):
+                response = self.edit(options)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'options': [error]})
+                self.assertEqual(self.option_texts(), ['Red', 'Blue'])
+
+
+class VoteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user)
+        self.option = self.poll.options.first()
+
+    def vote(self, poll=None, option=None):
+        poll, option = poll or self.poll, option or self.option
+        return self.client.post(f'/api/polls/{poll.id}/vote/', {'option': option.id}, format='json')
+
+    def assertRejected(self, response, reason):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': [reason]})
+
+    def test_user_can_only_vote_once(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.vote().status_code, 201)
+
+        self.assertRejected(self.vote(option=self.poll.options.last()), 'You have already voted in this poll')
+        self.assertEqual(Vote.objects.filter(poll=self.poll).count(), 1)
+
+    def test_anonymous_voter_can_only_vote_once(self):
+        self.assertEqual(self.vote().status_code, 201)
+
+        self.assertRejected(self.vote(), 'You have already voted in this poll')
+        vote = Vote.objects.get(poll=self.poll)
+        self.assertIsNone(vote.voted_by)
+        self.assertTrue(vote.ip_hash and vote.session_id)
+
+    def test_anonymous_voters_with_other_sessions_can_vote(self):
+        self.assertEqual(self.vote().status_code, 201)
+        self.client = APIClient()
+
+        self.assertEqual(self.vote().status_code, 201)
+
+    def test_expired_poll(self):
+        poll = make_poll(self.user, expires_in=-timedelta(minutes=1))
+
+        self.assertRejected(self.vote(poll, poll.options.first()), 'This poll has already expired')
+
+    def test_option_of_another_poll(self):
+        other = make_poll(self.user)
+
+        self.assertRejected(self.vote(option=other.options.first()), 'This option is not part of the poll')
+        self.assertFalse(Vote.objects.exists())
+
+    def test_votes_are_throttled(self):
+        self.client.force_authenticate(self.user)
+        num_requests, _ = ScopedRateThrottle().parse_rate(settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']['vote'])
+        # Rejected votes count towards the limit too
+        for _ in range(num_requests):
+            self.assertIn(self.vote().status_code, (201, 400))
+
+        response = self.vote()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+
+async_router = DefaultRouter()
+async_router.register('polls', AsyncPollViewSet)
+
+# The API as usual, plus the async poll viewset under /async/ (see AsyncPollViewSetTests)
+urlpatterns = [
+    path('api/', include('polling_api.urls')),
+    path('async/', include(async_router.urls)),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncPollViewSetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user)
+        self.red, self.blue = self.poll.options.all()
+        self.other = User.objects.create_user('bob')
+
+    def get_both(self, path):
+        """
+        Sends the GET to the sync and the async viewset, each with an empty cache
+        """
+        cache.clear()
+        results_cache.local.clear()
+        sync_response = self.client.get(f'/api/{path}')
+        cache.clear()
+        results_cache.local.clear()
+        async_response = async_to_sync(AsyncClient().get)(f'/async/{path}')
+        return sync_response, async_response
+
+    def vote_both(self, poll, option, users=(None, None)):
+        """
+        Votes through the sync viewset as the first of `users`, then through
+        the async one as the second; None votes anonymously
+        """
+        def post(send, prefix, user):
+            headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'} if user else {}
+            return send(
+                f'/{prefix}/polls/{poll.id}/vote/', json.dumps({'option': option.id}),
+                content_type='application/json', headers=headers,
+            )
+
+        return post(APIClient().post, 'api', users[0]), post(async_to_sync(AsyncClient().post), 'async', users[1])
+
+    def assertSameResponse(self, sync_response, async_response):
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_list(self):
+        make_poll(self.other, title='Favourite animal')
+        make_poll(self.user, title='Closed', expires_in=-timedelta(days=1))
+        Vote.objects.cast(self.poll.id, self.red.id, voted_by=self.other)
+        counters.increment(self.poll.id, self.red.id)
+
+        for query in ('', '?is_ongoing=true', f'?created_by={self.other.id}', '?search=animal'):
+            with self.subTest(query=query):
+                self.assertSameResponse(*self.get_both(f'polls/{query}'))
+
+    def test_list_pages(self):
+        for title in ('Favourite animal', 'Favourite season'):
+            make_poll(self.user, title=title)
+
+        sync_response, async_response = self.get_both('polls/?page_size=2')
+
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        sync_page, async_page = sync_response.json(), async_response.json()
+        self.assertEqual(async_page['results'], sync_page['results'])
+        self.assertEqual(async_page['next'], sync_page['next'].replace('/api/', '/async/'))
+
+    def test_results(self):
+        Vote.objects.cast(self.poll.id, self.blue.id, voted_by=self.other)
+        counters.increment(self.poll.id, self.blue.id)
+
+        sync_response, async_response = self.get_both(f'polls/{self.poll.id}/results/')
+
+        self.assertSameResponse(sync_response, async_response)
+        self.assertEqual(async_response.json()['total_votes'], 1)
+
+    def test_results_of_missing_poll(self):
+        self.assertSameResponse(*self.get_both('polls/0/results/'))
+
+    def test_vote(self):
+        sync_response, async_response = self.vote_both(self.poll, self.red, users=(self.user, self.other))
+
+        self.assertEqual((sync_response.status_code, async_response.status_code), (201, 201))
+        fields = ('poll', 'option', 'ip_hash', 'session_id')
+        self.assertEqual(
+            {field: async_response.json()[field] for field in fields},
+            {field: sync_response.json()[field] for field in fields},
+        )
+        self.assertEqual(counters.get_option_counts(Poll.objects.get(pk=self.poll.id)), {self.red.id: 2})
+
+    def test_rejected_votes(self):
+        expired = make_poll(self.user, expires_in=-timedelta(minutes=1))
+        Vote.objects.cast(self.poll.id, self.red.id, voted_by=self.user)
+        cases = [
+            ('already voted', self.poll, self.blue, (self.user, self.user)),
+            ('expired', expired, expired.options.first(), (None, None)),
+            ('other poll', self.poll, expired.options.first(), (self.other, self.other)),
+        ]
+        for name, poll, option, users in cases:
+            with self.subTest(name):
+                self.assertSameResponse(*self.vote_both(poll, option, users))
+
+
+@override_settings(ANONYMOUS_VOTER_TOKENS=True)
+class VoterTokenTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user)
+        self.option = self.poll.options.first()
+
+    def vote(self, client=None, **headers):
+        return (client or self.client).post(
+            f'/api/polls/{self.poll.id}/vote/', {'option': self.option.id}, format='json', headers=headers,
+        )
+
+    def test_new_voters_get_a_token_instead_of_a_session(self):
+        response = self.vote()
+
+        self.assertEqual(response.status_code, 201)
+        token = response[voters.TOKEN_HEADER]
+        self.assertEqual(response.cookies[settings.VOTER_COOKIE_NAME].value, token)
+        self.assertEqual(Vote.objects.get().session_id, voters.get_signer().unsign(token))
+        self.assertFalse(Session.objects.exists())
+
+    def test_token_is_reused(self):
+        token = self.vote()[voters.TOKEN_HEADER]
+
+        for client, headers in ((self.client, {}), (APIClient(), {voters.TOKEN_HEADER: token})):
+            with self.subTest(headers=headers):
+                response = self.vote(client, **headers)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'non_field_errors': ['You have already voted in this poll']})
+                self.assertNotIn(voters.TOKEN_HEADER, response)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_invalid_token_gets_a_new_voter(self):
+        token = self.vote()[voters.TOKEN_HEADER]
+
+        response = self.vote(APIClient(), **{voters.TOKEN_HEADER: token[:-1] + ('0' if token[-1] != '0' else '1')})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response[voters.TOKEN_HEADER], token)
+        self.assertEqual(Vote.objects.count(), 2)
+
+    def test_session_voters_keep_their_session_key(self):
+        # Voted before tokens were turned on
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key = 'a' * 32
+        vote = self.vote()
+        self.assertEqual(vote.status_code, 201)
+        self.assertEqual(Vote.objects.get().session_id, session_key)
+
+        response = self.vote(APIClient(), **{voters.TOKEN_HEADER: vote[voters.TOKEN_HEADER]})
+        self.assertEqual(response.status_code, 400)
+
+
+class ClearVoterSessionsTests(TestCase):
+    def setUp(self):
+        self.empty = []
+        for _ in range(3):
+            session = SessionStore()
+            session.create()
+            self.empty.append(session.session_key)
+        session = SessionStore()
+        session['_auth_user_id'] = '1'
+        session.create()
+        self.login = session.session_key
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('clear_voter_sessions', '--dry-run', '--batch-size=2', stdout=out)
+
+        self.assertIn('3 empty voter session(s) would be deleted', out.getvalue())
+        self.assertEqual(Session.objects.count(), 4)
+
+    def test_empty_sessions_are_deleted(self):
+        out = StringIO()
+        call_command('clear_voter_sessions', '--batch-size=2', stdout=out)
+
+        self.assertIn('Deleted 3 empty voter session(s)', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [self.login])
+
+
+class VoteConstraintsMigrationTests(TransactionTestCase):
+    before = [('polling_api', '0005_vote_counter')]
+    after = [('polling_api', '0006_vote_constraints')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicate_votes_are_removed(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        user = apps.get_model('auth', 'User').objects.create(username='bob')
+        poll = apps.get_model('polling_api', 'Poll').objects.create(
+            title='Poll', created_by=user, expire_date=timezone.now() + timedelta(days=1),
+        )
+        red, blue = [apps.get_model('polling_api', 'Option').objects.create(poll=poll, text=text) for text in ('Red', 'Blue')]
+        Vote = apps.get_model('polling_api', 'Vote')
+        first_user_vote = Vote.objects.create(poll=poll, option=red, voted_by=user)
+        Vote.objects.create(poll=poll, option=blue, voted_by=user)
+        first_anonymous_vote = Vote.objects.create(poll=poll, option=blue, ip_hash='ip', session_id='session')
+        Vote.objects.create(poll=poll, option=red, ip_hash='ip', session_id='session')
+        other_session = Vote.objects.create(poll=poll, option=red, ip_hash='ip', session_id='other')
+        apps.get_model('polling_api', 'VoteCounter').objects.create(poll=poll, option=red, shard=0, votes=3)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+
+        Vote = apps.get_model('polling_api', 'Vote')
+        self.assertEqual(
+            set(Vote.objects.values_list('id', flat=True)),
+            {first_user_vote.id, first_anonymous_vote.id, other_session.id},
+        )
+        counts = dict(apps.get_model('polling_api', 'VoteCounter').objects.values_list('option_id', 'votes'))
+        self.assertEqual(counts, {red.id: 2, blue.id: 1})
+
+
+@override_settings(VOTE_COUNTER_SHARDS=4)
+class VoteCounterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user)
+        self.red, self.blue = self.poll.options.order_by('id')
+        self.voter_numbers = itertools.count()
+
+    def cast(self, option, count):
+        shards = iter(range(count))
+        # Spread the votes over every shard
+        with mock.patch('polling_api.counters.random.randrange', side_effect=lambda n: next(shards) % n):
+            for _ in range(count):
+                voter = User.objects.create_user(f'voter{next(self.voter_numbers)}')
+                vote = Vote.objects.cast(self.poll.id, option.id, voted_by=voter)
+                counters.increment(vote.poll_id, vote.option_id)
+
+    def counts(self):
+        return counters.get_option_counts(Poll.objects.get(pk=self.poll.pk))
+
+    def test_shards_sum_to_the_votes(self):
+        self.cast(self.red, 6)
+        self.cast(self.blue, 3)
+
+        self.assertEqual(VoteCounter.objects.filter(option=self.red).count(), 4)
+        self.assertEqual(self.counts(), {self.red.id: 6, self.blue.id: 3})
+
+    def test_reconcile_rebuilds_drifted_counters(self):
+        self.cast(self.red, 6)
+        self.cast(self.blue, 3)
+        VoteCounter.objects.filter(option=self.red, shard=1).update(votes=F('votes') + 5)
+        VoteCounter.objects.filter(option=self.blue).delete()
+
+        self.assertEqual(counters.reconcile(self.poll), {self.red.id: (11, 6), self.blue.id: (0, 3)})
+        self.assertEqual(self.counts(), {self.red.id: 6, self.blue.id: 3})
+        self.assertEqual(counters.reconcile(self.poll), {})
+
+    def test_rebuild_command(self):
+        self.cast(self.red, 2)
+        VoteCounter.objects.filter(option=self.red).delete()
+
+        out = StringIO()
+        call_command('rebuild_vote_counters', '--check', stdout=out)
+        self.assertIn(f'Poll {self.poll.id}, option {self.red.id}: counted 0, actual 2', out.getvalue())
+        self.assertEqual(self.counts(), {})
+
+        out = StringIO()
+        call_command('rebuild_vote_counters', str(self.poll.id), stdout=out)
+        self.assertIn('Rebuilt vote counters for 1 poll(s)', out.getvalue())
+        self.assertEqual(self.counts(), {self.red.id: 2})
+
+
+@skipIf(connection.vendor == 'sqlite', "SQLite's in-memory test database doesn't take concurrent writes")
+class ConcurrentVoteTests(TransactionTestCase):
+    def test_concurrent_votes_are_all_counted(self):
+        owner = User.objects.create_user('alice')
+        poll = make_poll(owner)
+        option = poll.options.first()
+        voters = [User.objects.create_user(f'voter{number}') for number in range(20)]
+        barrier = threading.Barrier(len(voters))
+
+        def vote(user):
+            try:
+                serializer = VoteSerializer(data={'option': option.id}, context={'poll_id': poll.id, 'user': user})
+                serializer.is_valid(raise_exception=True)
+                barrier.wait()
+                serializer.save()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(len(voters)) as executor:
+            list(executor.map(vote, voters))
+
+        self.assertEqual(Vote.objects.filter(poll=poll).count(), len(voters))
+        self.assertEqual(counters.get_option_counts(poll), {option.id: len(voters)})
+        self.assertEqual(counters.reconcile(poll, fix=False), {})
+
+
+class VoteBufferTests(APITestCase):
+    def test_votes_conflicting_at_insert_are_not_counted(self):
+        poll = make_poll(self.user)
+        red, blue = poll.options.all()
+        other = User.objects.create_user('bob')
+        # Bob votes directly while his buffered vote is waiting
+        Vote.objects.cast(poll.id, red.id, voted_by=other)
+        counters.increment(poll.id, red.id)
+        batch = [
+            Vote(poll_id=poll.id, option_id=blue.id, voted_at=timezone.now(), voted_by=self.user),
+            Vote(poll_id=poll.id, option_id=blue.id, voted_at=timezone.now(), voted_by=other),
+        ]
+        buffer = VoteBuffer(max_size=10, batch_size=10, max_age=1, meta_timeout=1)
+
+        # As if the vote landed after the batch was checked for repeat votes
+        with mock.patch.object(VoteBuffer, '_filter_valid', side_effect=lambda batch: batch), \
+                mock.patch.object(pubsub, 'publish_votes') as publish_votes:
+            buffer.flush(batch)
+
+        self.assertEqual((buffer.saved, buffer.dropped), (1, 1))
+        self.assertEqual(Vote.objects.filter(poll=poll).count(), 2)
+        self.assertEqual(counters.get_option_counts(Poll.objects.get(pk=poll.id)), {red.id: 1, blue.id: 1})
+        publish_votes.assert_called_once_with(poll.id, {blue.id: 1})
+
+    def test_votes_cast_before_expiry_are_kept(self):
+        poll = make_poll(self.user, expires_in=-timedelta(seconds=1))
+        option = poll.options.first()
+        late = User.objects.create_user('bob')
+        batch = [
+            # Acknowledged just before the poll closed
+            Vote(poll_id=poll.id, option_id=option.id, voted_at=poll.expire_date - timedelta(seconds=1), voted_by=self.user),
+            # Cast after it closed, e.g. after an edit moved the expiry date forward
+            Vote(poll_id=poll.id, option_id=option.id, voted_at=poll.expire_date + timedelta(milliseconds=1), voted_by=late),
+        ]
+        buffer = VoteBuffer(max_size=10, batch_size=10, max_age=1, meta_timeout=1)
+
+        buffer.flush(batch)
+
+        self.assertEqual((buffer.saved, buffer.dropped), (1, 1))
+        self.assertEqual(list(Vote.objects.filter(poll=poll).values_list('voted_by', flat=True)), [self.user.id])
+
+    def make_batch(self):
+        poll = make_poll(self.user)
+        return [Vote(poll_id=poll.id, option_id=poll.options.first().id, voted_at=timezone.now(), voted_by=self.user)]
+
+    @override_settings(VOTE_BUFFER_RETRIES=2)
+    def test_failed_batches_are_retried(self):
+        batch = self.make_batch()
+        buffer = VoteBuffer(max_size=10, batch_size=10, max_age=1, meta_timeout=1)
+        flush, errors = buffer.flush, [OperationalError('connection lost')]
+
+        def flaky_flush(batch):
+            if errors:
+                raise errors.pop()
+            flush(batch)
+
+        with mock.patch.object(buffer, 'flush', side_effect=flaky_flush) as failing, \
+                mock.patch('polling_api.ingest.time.sleep'), self.assertLogs('polling_api.ingest', 'WARNING'):
+            buffer.save(batch)
+
+        self.assertEqual(failing.call_count, 2)
+        self.assertEqual((buffer.saved, buffer.dropped), (1, 0))
+
+    @override_settings(VOTE_BUFFER_RETRIES=2)
+    def test_votes_lost_after_the_retries_are_logged(self):
+        batch = self.make_batch()
+        buffer = VoteBuffer(max_size=10, batch_size=10, max_age=1, meta_timeout=1)
+        buffer._pending.add(voter_key(batch[0]))
+
+        with mock.patch.object(buffer, 'flush', side_effect=OperationalError('connection lost')) as failing, \
+                mock.patch('polling_api.ingest.time.sleep'), self.assertLogs('polling_api.ingest', 'ERROR') as logs:
+            buffer.save(batch)
+
+        self.assertEqual(failing.call_count, 3)
+        self.assertEqual(buffer.dropped, 1)
+        self.assertIn(f'Lost vote: poll {batch[0].poll_id}, option {batch[0].option_id}', '\n'.join(logs.output))
+        # The voter can try again
+        self.assertEqual(buffer._pending, set())
+
+    @override_settings(VOTE_INGEST_MODE='buffered', SERVERLESS=True)
+    def test_buffering_on_serverless_is_flagged(self):
+        self.assertEqual([warning.id for warning in check_vote_ingest(None)], ['polling_api.W003'])
+
+
+class RollupTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user)
+        self.red, self.blue = self.poll.options.all()
+        self.start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+        self.voters = (User.objects.create_user(f'voter{i}') for i in itertools.count())
+
+    def cast(self, option, minutes, poll=None):
+        poll = poll or self.poll
+        vote = Vote.objects.cast(poll.id, option.id, voted_by=next(self.voters), voted_at=self.start + timedelta(minutes=minutes))
+        counters.increment(poll.id, option.id)
+        return vote
+
+    def rollup(self, granularity):
+        return list(
+            VoteRollup.objects.filter(poll=self.poll, granularity=granularity)
+            .order_by('bucket', 'option_id').values_list('bucket', 'option_id', 'votes')
+        )
+
+
+class RollupTests(RollupTestCase):
+    def test_votes_are_counted_into_every_granularity(self):
+        for option, minutes in ((self.red, 0), (self.red, 0.5), (self.blue, 1), (self.red, 61)):
+            self.cast(option, minutes)
+
+        self.assertEqual(rollups.catch_up(batch_size=3), 4)
+        self.assertEqual(rollups.catch_up(), 0)
+
+        hour = timedelta(hours=1)
+        self.assertEqual(self.rollup('minute'), [
+            (self.start, self.red.id, 2),
+            (self.start + timedelta(minutes=1), self.blue.id, 1),
+            (self.start + timedelta(minutes=61), self.red.id, 1),
+        ])
+        self.assertEqual(self.rollup('hour'), [
+            (self.start, self.red.id, 2), (self.start, self.blue.id, 1), (self.start + hour, self.red.id, 1),
+        ])
+        day = self.start.replace(hour=0)
+        self.assertEqual(sum(votes for bucket, _, votes in self.rollup('day') if bucket >= day), 4)
+        self.assertFalse(Vote.objects.filter(rolled_up=False).exists())
+
+    def test_votes_committed_late_are_counted(self):
+        # A slow transaction commits a lower id after later votes were rolled up
+        late = self.cast(self.red, 0)
+        Vote.objects.filter(pk=late.pk).delete()
+        self.cast(self.blue, 1)
+        rollups.catch_up()
+
+        Vote.objects.create(id=late.id, poll=self.poll, option=self.red, voted_by=next(self.voters))
+
+        self.assertEqual(rollups.catch_up(), 1)
+        self.assertEqual(VoteRollup.objects.filter(granularity='day').aggregate(total=Sum('votes'))['total'], 2)
+
+    def test_synchronous_votes_are_rolled_up(self):
+        self.client.force_authenticate(self.user)
+        with mock.patch.object(rollups, '_caught_up_at', float('-inf')), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/polls/{self.poll.id}/vote/', {'option': self.red.id}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([votes for _, _, votes in self.rollup('hour')], [1])
+
+    def test_catching_up_is_throttled(self):
+        self.cast(self.red, 0)
+        with mock.patch.object(rollups, '_caught_up_at', float('-inf')):
+            rollups.maybe_catch_up()
+            self.cast(self.blue, 0)
+            rollups.maybe_catch_up()
+
+        self.assertEqual(Vote.objects.filter(rolled_up=False).count(), 1)
+
+    def test_archiving_rolls_up_the_votes_first(self):
+        poll = make_poll(self.user, expires_in=-timedelta(days=settings.VOTE_RETENTION_DAYS + 1))
+        option = poll.options.first()
+        self.start = poll.expire_date - timedelta(days=1)
+        for minutes in range(3):
+            self.cast(option, minutes, poll)
+
+        self.assertEqual(archive_poll(poll), 3)
+
+        self.assertEqual(VoteRollup.objects.filter(poll=poll, granularity='day').aggregate(total=Sum('votes'))['total'], 3)
+
+    def test_rollup_votes_command(self):
+        self.cast(self.red, 0)
+        out = StringIO()
+
+        call_command('rollup_votes', stdout=out)
+
+        self.assertIn('Rolled up 1 vote(s)', out.getvalue())
+
+
+class AnalyticsTests(RollupTestCase):
+    def setUp(self):
+        super().setUp()
+        for option, minutes in ((self.red, 0), (self.blue, 30), (self.red, 60), (self.red, 90)):
+            self.cast(option, minutes)
+        rollups.catch_up()
+        self.client.force_authenticate(self.user)
+
+    def analytics(self, **params):
+        return self.client.get(f'/api/polls/{self.poll.id}/analytics/', params)
+
+    def test_hourly_histogram(self):
+        response = self.analytics()
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['id'], data['granularity']), (self.poll.id, 'hour'))
+        self.assertIsNotNone(data['rolled_up_at'])
+        self.assertEqual(data['options'], [{'id': self.red.id, 'text': 'Red'}, {'id': self.blue.id, 'text': 'Blue'}])
+        self.assertEqual([(bucket['votes'], bucket['total'], bucket['cumulative']) for bucket in data['buckets']], [
+            ({str(self.red.id): 1, str(self.blue.id): 1}, 2, 2),
+            ({str(self.red.id): 2}, 2, 4),
+        ])
+
+    def test_window(self):
+        since = self.start + timedelta(minutes=30)
+        response = self.analytics(granularity='minute', since=since.isoformat(), until=(since + timedelta(minutes=31)).isoformat())
+
+        self.assertEqual(response.status_code, 200)
+        # The vote before `since` still counts towards the running total
+        self.assertEqual([(bucket['total'], bucket['cumulative']) for bucket in response.json()['buckets']], [(1, 2), (1, 3)])
+
+    def test_only_for_the_creator_and_admins(self):
+        self.client.force_authenticate(User.objects.create_user('bob'))
+
+        self.assertEqual(self.analytics().status_code, 403)
+
+    def test_invalid_query(self):
+        response = self.analytics(granularity='week', since='yesterday')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'granularity', 'since'})
+
+
+class PollAnalyticsQuerySerializerTests(SimpleTestCase):
+    def test_defaults_to_hours(self):
+        query = PollAnalyticsQuerySerializer(data={})
+
+        self.assertTrue(query.is_valid())
+        self.assertEqual(query.validated_data, {'granularity': 'hour'})
+
+    def test_window(self):
+        query = PollAnalyticsQuerySerializer(data={'granularity': 'day', 'since': '2026-01-01T00:00:00Z'})
+
+        self.assertTrue(query.is_valid())
+        self.assertEqual(query.validated_data['since'].isoformat(), '2026-01-01T00:00:00+00:00')
+        self.assertNotIn('until', query.validated_data)
+
+    def test_unknown_granularity(self):
+        query = PollAnalyticsQuerySerializer(data={'granularity': 'week'})
+
+        self.assertFalse(query.is_valid())
+        self.assertEqual(list(query.errors), ['granularity'])
+
+
+class BrokerTests(SimpleTestCase):
+    async def received(self, subscription):
+        # Events are handed to the subscriber's loop with call_soon_threadsafe
+        await asyncio.sleep(0)
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        return events
+
+    async def test_events_reach_the_poll_subscribers(self):
+        broker = pubsub.InProcessBroker()
+        first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+
+        broker.publish(1, 'votes', {'10': 1})
+        broker.publish(1, 'votes', {'11': 2})
+
+        events = await self.received(first)
+        self.assertEqual([(kind, data) for _, kind, data in events], [('votes', {'10': 1}), ('votes', {'11': 2})])
+        self.assertLess(events[0][0], events[1][0])
+        self.assertEqual(await self.received(second), events)
+        self.assertEqual(await self.received(other), [])
+
+    async def test_resuming_replays_missed_events(self):
+        broker = pubsub.InProcessBroker()
+        broker.publish(1, 'votes', {'10': 1})
+        seen = broker.last_event_id(1)
+        broker.publish(1, 'votes', {'10': 2})
+        broker.publish(1, 'votes', {'11': 1})
+
+        events = await self.received(broker.subscribe(1, last_event_id=seen))
+
+        self.assertEqual([data for _, _, data in events], [{'10': 2}, {'11': 1}])
+
+    async def test_resuming_from_outside_the_history_resets(self):
+        broker = pubsub.InProcessBroker(history=2)
+        broker.publish(1, 'votes', {'10': 1})
+        dropped = broker.last_event_id(1)
+        for _ in range(3):
+            broker.publish(1, 'votes', {'10': 1})
+
+        for last_event_id in (dropped, 1):
+            with self.subTest(last_event_id=last_event_id):
+                events = await self.received(broker.subscribe(1, last_event_id=last_event_id))
+                self.assertEqual([(event_id, kind) for event_id, kind, _ in events], [(broker.last_event_id(1), pubsub.RESET)])
+
+    async def test_idle_polls_are_forgotten(self):
+        broker = pubsub.InProcessBroker(max_polls=2)
+        subscription = broker.subscribe(1)
+        for poll_id in (1, 2):
+            broker.publish(poll_id, 'votes', {'10': 1})
+        seen = broker.last_event_id(2)
+
+        broker.publish(3, 'votes', {'10': 1})
+
+        # Poll 1 has a subscriber, so poll 2 goes
+        self.assertEqual(list(broker._polls), [1, 3])
+        events = await self.received(broker.subscribe(2, last_event_id=seen))
+        self.assertEqual([kind for _, kind, _ in events], [pubsub.RESET])
+        subscription.close()
+        broker.publish(4, 'votes', {'10': 1})
+        self.assertNotIn(1, broker._polls)
+
+    async def test_slow_subscribers_are_reset(self):
+        broker = pubsub.InProcessBroker(max_pending=2)
+        subscription = broker.subscribe(1)
+        for _ in range(3):
+            broker.publish(1, 'votes', {'10': 1})
+        await asyncio.sleep(0)
+
+        self.assertEqual(await subscription.get(), (broker.last_event_id(1), pubsub.RESET, None))
+        self.assertTrue(subscription.queue.empty())
+
+
+@override_settings(RESULTS_STREAM_HEARTBEAT=5)
+class ResultsStreamTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.broker = pubsub.InProcessBroker()
+        patcher = mock.patch.object(pubsub, '_broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.poll = make_poll(self.user)
+        self.red, self.blue = self.poll.options.all()
+
+    async def open_stream(self, **headers):
+        response = await AsyncClient().get(f'/api/polls/{self.poll.id}/results/stream/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return aiter(response.streaming_content)
+
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        fields = dict(line.split(': ', 1) for line in chunk.decode().strip().splitlines())
+        return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+    def results(self, red, blue):
+        return [
+            {'id': self.red.id, 'text': 'Red', 'votes': red},
+            {'id': self.blue.id, 'text': 'Blue', 'votes': blue},
+        ]
+
+    async def test_snapshot_then_votes(self):
+        stream = await self.open_stream()
+
+        snapshot_id, kind, data = await self.next_event(stream)
+        self.assertEqual((kind, data), ('snapshot', {'results': self.results(0, 0)}))
+
+        self.broker.publish(self.poll.id, 'votes', {str(self.red.id): 2})
+        event_id, kind, data = await self.next_event(stream)
+        self.assertGreater(event_id, snapshot_id)
+        self.assertEqual((kind, data), ('votes', {'deltas': {str(self.red.id): 2}}))
+
+    async def test_votes_landing_during_the_snapshot_are_not_sent_again(self):
+        reads = [self.results(0, 0), self.results(1, 0)]
+
+        async def aget_results(poll_id):
+            if len(reads) == 2:
+                # A vote commits while the first read runs; it may or may not be in it
+                self.broker.publish(poll_id, 'votes', {str(self.red.id): 1})
+            return reads.pop(0)
+
+        with mock.patch.object(counters, 'aget_results', side_effect=aget_results):
+            stream = await self.open_stream()
+            snapshot_id, kind, data = await self.next_event(stream)
+
+        self.assertEqual((snapshot_id, kind, data), (self.broker.last_event_id(self.poll.id), 'snapshot', {'results': self.results(1, 0)}))
+        self.broker.publish(self.poll.id, 'votes', {str(self.blue.id): 1})
+        self.assertEqual((await self.next_event(stream))[1:], ('votes', {'deltas': {str(self.blue.id): 1}}))
+
+    async def test_reconnecting_resumes_after_the_last_event(self):
+        stream = await self.open_stream()
+        snapshot_id, _, _ = await self.next_event(stream)
+        self.broker.publish(self.poll.id, 'votes', {str(self.red.id): 1})
+        seen, _, _ = await self.next_event(stream)
+        # Lands while the client is away
+        self.broker.publish(self.poll.id, 'votes', {str(self.blue.id): 1})
+
+        stream = await self.open_stream(**{'Last-Event-ID': str(seen)})
+
+        event_id, kind, data = await self.next_event(stream)
+        self.assertGreater(event_id, seen)
+        self.assertEqual((kind, data), ('votes', {'deltas': {str(self.blue.id): 1}}))
+
+    async def test_unknown_last_event_id_starts_over(self):
+        stream = await self.open_stream(**{'Last-Event-ID': '1'})
+
+        _, kind, data = await self.next_event(stream)
+
+        self.assertEqual((kind, data), ('snapshot', {'results': self.results(0, 0)}))
+
+    async def test_missing_poll(self):
+        response = await AsyncClient().get('/api/polls/0/results/stream/')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_needs_the_asgi_server(self):
+        response = self.client.get(f'/api/polls/{self.poll.id}/results/stream/')
+
+        self.assertEqual(response.status_code, 501)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll = make_poll(self.user)
+        self.red, self.blue = self.poll.options.all()
+        self.other = User.objects.create_user('bob')
+        self.votes = [
+            Vote.objects.cast(self.poll.id, self.red.id, voted_by=self.user),
+            Vote.objects.cast(self.poll.id, self.blue.id, voted_by=self.other),
+        ]
+        for vote in self.votes:
+            counters.increment(self.poll.id, vote.option_id)
+
+    def export(self, path='', user=None, **params):
+        self.client.force_authenticate(user or self.user)
+        return self.client.get(f'/api/polls/{path}export/', params)
+
+    def read_csv(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_votes_as_csv(self):
+        response = self.export(f'{self.poll.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="poll-{self.poll.id}-votes.csv"')
+        rows = self.read_csv(response)
+        self.assertEqual(rows[0], exports.VOTE_COLUMNS)
+        self.assertEqual(rows[1:], [
+            [str(self.poll.id), str(vote.option_id), option, str(vote.id), vote.voted_at.isoformat(), str(voter.id), '1']
+            for vote, option, voter in zip(self.votes, ('Red', 'Blue'), (self.user, self.other))
+        ])
+
+    def test_results_as_ndjson(self):
+        response = self.export(f'{self.poll.id}/', format='ndjson', type='results')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'poll_id': self.poll.id, 'poll': 'Favourite colour', 'option_id': option.id, 'option': option.text, 'votes': 1}
+            for option in (self.red, self.blue)
+        ])
+
+    def test_only_the_creator_and_admins_can_export_a_poll(self):
+        self.assertEqual(self.client.get(f'/api/polls/{self.poll.id}/export/').status_code, 403)
+        self.assertEqual(self.export(f'{self.poll.id}/', user=self.other).status_code, 403)
+        admin = User.objects.create_user('admin', is_staff=True)
+        self.assertEqual(self.export(f'{self.poll.id}/', user=admin).status_code, 200)
+
+    def test_bulk_export_is_for_admins(self):
+        make_poll(self.other, title='Favourite animal')
+        self.assertEqual(self.export().status_code, 403)
+        admin = User.objects.create_user('admin', is_staff=True)
+
+        response = self.export(user=admin, type='results', created_by=self.other.id, cursor='ignored', page_size=1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row[1] for row in self.read_csv(response)], ['poll', 'Favourite animal', 'Favourite animal'])
+
+    def test_streams_asynchronously_under_asgi(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = async_to_sync(AsyncClient().get)(f'/api/polls/{self.poll.id}/export/?format=ndjson', headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        lines = async_to_sync(read)().decode().splitlines()
+        self.assertEqual([json.loads(line)['vote_id'] for line in lines], [vote.id for vote in self.votes])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaTests(TransactionTestCase):
+    """
+    The replica is a second connection to the test database, so the queries
+    each connection ran tell where a request read from. Not a TestCase: reads
+    inside a transaction always go to the primary.
+    """
+    # Includes the replica added below, which the test runner doesn't know of
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # Without DATABASE_REPLICA_URLS, add the replica for these tests only
+        if 'replica_1' not in connections.settings:
+            primary = connections['default'].settings_dict
+            connections.settings['replica_1'] = {**primary, 'TEST': {**primary['TEST'], 'MIRROR': 'default'}}
+            cls.addClassCleanup(cls.remove_replica)
+        super().setUpClass()
+
+    @classmethod
+    def remove_replica(cls):
+        connections['replica_1'].close()
+        del connections['replica_1']
+        del connections.settings['replica_1']
+
+    def setUp(self):
+        cache.clear()
+        results_cache.local.clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.poll = make_poll(self.user, title='Favourite colour')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def databases_read(self, table, request):
+        """
+        Returns the response to `request()`, and the databases it read
+        `table` from
+        """
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_1']) as replica:
+            response = request()
+        databases = {
+            alias for alias, captured in (('default', primary), ('replica_1', replica))
+            if any('SELECT' in query['sql'] and f'"{table}"' in query['sql'] for query in captured)
+        }
+        return response, databases
+
+    def list_polls(self):
+        response, databases = self.databases_read('polling_api_poll', lambda: self.client.get('/api/polls/'))
+        self.assertEqual(response.status_code, 200)
+        return databases
+
+    def create_poll(self):
+        return self.client.post('/api/polls/', {
+            'title': 'New poll',
+            'expire_date': (timezone.now() + timedelta(days=1)).isoformat(),
+            'options': [{'text': 'Yes'}, {'text': 'No'}],
+        }, format='json')
+
+    def test_safe_reads_use_the_replica(self):
+        self.assertEqual(self.list_polls(), {'replica_1'})
+
+        response, databases = self.databases_read('auth_user', lambda: self.client.get(f'/api/users/{self.user.id}/'))
+        self.assertEqual(response.json()['email'], 'alice@example.com')
+        self.assertEqual(databases, {'replica_1'})
+
+    def test_writes_and_reads_after_them_use_the_primary(self):
+        response, databases = self.databases_read('polling_api_option', self.create_poll)
+
+        self.assertEqual(response.status_code, 201)
+        # Read back in the same request
+        self.assertEqual([option['text'] for option in response.json()['options']], ['Yes', 'No'])
+        self.assertEqual(databases, {'default'})
+
+    def test_votes_use_the_primary(self):
+        option = self.poll.options.first()
+        response, databases = self.databases_read('polling_api_option', lambda: self.client.post(
+            f'/api/polls/{self.poll.id}/vote/', {'option': option.id}, format='json',
+        ))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(databases, {'default'})
+
+    def test_reads_after_a_write_use_the_primary_until_the_pin_expires(self):
+        self.assertEqual(self.create_poll().status_code, 201)
+        self.assertIn(settings.READ_YOUR_WRITES_COOKIE, self.client.cookies)
+
+        self.assertEqual(self.list_polls(), {'default'})
+
+        later = time.time() + settings.READ_YOUR_WRITES_WINDOW + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(self.list_polls(), {'replica_1'})
+
+    def test_other_clients_of_a_user_who_wrote_use_the_primary(self):
+        self.assertEqual(self.create_poll().status_code, 201)
+        self.client.cookies.clear()
+
+        self.assertEqual(self.list_polls(), {'default'})
+
+
+class PaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        expire_date = timezone.now() + timedelta(days=1)
+        # Ties on expire_date are broken by id
+        self.polls = [make_poll(self.user, title=f'Poll {number}') for number in range(7)]
+        Poll.objects.filter(pk__in=[poll.pk for poll in self.polls[:4]]).update(expire_date=expire_date)
+        Poll.objects.filter(pk__in=[poll.pk for poll in self.polls[4:]]).update(expire_date=expire_date - timedelta(hours=1))
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [poll['id'] for poll in response.json()['results']]
+            url = response.json()['next']
+        return ids
+
+    def test_pages_follow_expiry_then_id(self):
+        expected = list(Poll.objects.order_by('expire_date', 'id').values_list('id', flat=True))
+
+        self.assertEqual(self.walk('/api/polls/?page_size=3'), expected)
+
+    def test_pages_stay_stable_when_polls_are_added(self):
+        response = self.client.get('/api/polls/?page_size=3')
+        first_page = [poll['id'] for poll in response.json()['results']]
+        # Sorts before every poll already seen
+        make_poll(self.user, title='Expires first', expires_in=timedelta(minutes=1))
+
+        rest = self.walk(response.json()['next'])
+        self.assertEqual(len(first_page + rest), len(set(first_page + rest)))
+        self.assertEqual(set(first_page + rest), {poll.id for poll in self.polls})
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(PollPagination, 'max_page_size', 2):
+            response = self.client.get('/api/polls/?page_size=1000')
+
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/polls/?cursor=not-a-cursor')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.colours = make_poll(self.user, title='Favourite colour', description='Primary colours only')
+        self.lunch = make_poll(self.user, title='Lunch spot', description='Somewhere with good colour and light')
+        self.commute = make_poll(self.user, title='Commute', description='')
+
+    def search(self, **params):
+        response = self.client.get('/api/polls/', params)
+        self.assertEqual(response.status_code, 200)
+        return [poll['id'] for poll in response.json()['results']]
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search(search='colour'), [self.colours.id, self.lunch.id])
+
+    def test_search_matches_prefixes(self):
+        self.assertEqual(self.search(search='comm'), [self.commute.id])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search(search='"lunch" OR NOT*'), [])
+        self.assertEqual(self.search(search='!!!'), [])
+
+    def test_search_sees_edits(self):
+        Poll.objects.filter(pk=self.commute.id).update(title='Cycling commute')
+
+        self.assertEqual(self.search(search='cycling'), [self.commute.id])
+
+    def test_title_filter_is_case_insensitive_substring(self):
+        self.assertEqual(sorted(self.search(title='COLOUR')), [self.colours.id])
+
+
+class SchemaTests(SimpleTestCase):
+    def test_schema_is_served_with_an_etag(self):
+        response = self.client.get('/api/docs/openapi.json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertRegex(response['ETag'], r'^"schema-[0-9a-f]{32}"$')
+        self.assertIn('/polls/', json.loads(response.content)['paths'])
+
+    def test_unchanged_schema_is_not_resent(self):
+        etag = self.client.get('/api/docs/openapi.json')['ETag']
+
+        response = self.client.get('/api/docs/openapi.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        # Swagger UI fetches the same document
+        response = self.client.get('/api/docs/', {'format': 'openapi'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/api/docs/openapi.json', HTTP_IF_NONE_MATCH='"schema-stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_generated_file_is_loaded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'openapi.json')
+            with open(path, 'wb') as f:
+                f.write(b'{"paths": {}}')
+
+            with override_settings(OPENAPI_SCHEMA_FILE=path, DEBUG=False):
+                content, etag = SchemaCache().get()
+            self.assertEqual(content, b'{"paths": {}}')
+
+            # DEBUG ignores the file, so it shows local changes
+            with override_settings(OPENAPI_SCHEMA_FILE=path, DEBUG=True):
+                debug_content, debug_etag = SchemaCache().get()
+            self.assertIn('/polls/', json.loads(debug_content)['paths'])
+            self.assertNotEqual(debug_etag, etag)
+
+    def test_generate_schema_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'openapi.json')
+            out = StringIO()
+            call_command('generate_schema', f'--output={path}', stdout=out)
+
+            with open(path, 'rb') as f:
+                content = f.read()
+        self.assertEqual(content, generate_schema())
+        self.assertIn(f'Wrote {len(content)} bytes to {path}', out.getvalue())
+
+
+class StartupTests(SimpleTestCase):
+    def test_cold_start_is_within_budget(self):
+        out = StringIO()
+        call_command('profile_startup', runs=2, max_ms=settings.STARTUP_TIME_BUDGET, stdout=out)
+        self.assertIn('Cold start:', out.getvalue())
+
+    def test_budget_is_enforced(self):
+        with self.assertRaisesMessage(CommandError, 'over the 1 ms budget'):
+            call_command('profile_startup', runs=1, max_ms=1, stdout=StringIO())
+
+    def test_lean_startup_defers_the_docs_and_the_admin(self):
+        script = (
+            'import sys\n'
+            'from polling_site.wsgi import application\n'
+            'from django.urls import resolve\n'
+            'def deferred():\n'
+            '    return sorted(name for name in sys.modules if name.startswith(("drf_yasg.", "django.contrib.auth.admin")))\n'
+            'resolve("/api/polls/")\n'
+            'print(deferred())\n'
+            'resolve("/admin/auth/user/")\n'
+            'print(deferred())\n'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'polling_site.settings', 'LEAN_STARTUP': 'True'},
+        )
+        at_startup, after_admin = result.stdout.strip().splitlines()
+        self.assertEqual(at_startup, '[]')
+        self.assertEqual(after_admin, "['django.contrib.auth.admin']")
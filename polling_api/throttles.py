@@ -1,17 +1,99 @@
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import throttling
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Rate throttle using a sliding window counter.
+
+    Requests are counted per fixed window, and the previous window's count is
+    weighted by how much of it still overlaps the sliding window. A check is an
+    atomic increment plus one read whatever the rate, so workers sharing a
+    cache (THROTTLE_CACHE_ALIAS) agree on the limits without losing updates.
+    """
+    @property
+    def cache(self):
+        return caches[settings.THROTTLE_CACHE_ALIAS]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window, self.elapsed = divmod(self.now, self.duration)
+        current_key = f'{self.key}:{int(window)}'
+
+        count = self.incr(current_key)
+        self.previous = self.cache.get(f'{self.key}:{int(window) - 1}', 0)
+        self.count = count - 1
+        if self.previous * (1 - self.elapsed / self.duration) + count <= self.num_requests:
+            return True
+
+        # Rejected requests don't count towards the limit
+        try:
+            self.cache.decr(current_key)
+        except ValueError:
+            pass
+        return self.throttle_failure()
+
+    def incr(self, key):
+        """
+        Atomically adds one to the window counter at `key`, creating it if needed
+        """
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Kept until the end of the next window, where it is the previous count
+            self.cache.add(key, 0, 2 * self.duration)
+            return self.cache.incr(key)
+
+    def wait(self):
+        """
+        Returns the seconds until the previous window's weight has decayed enough
+        to admit another request, or until the current window ends
+        """
+        remaining = self.duration - self.elapsed
+        if self.count + 1 > self.num_requests or not self.previous:
+            return remaining
+        decayed = self.duration * (1 - (self.num_requests - self.count - 1) / self.previous) - self.elapsed
+        return min(max(decayed, 0), remaining)
+
+class AnonRateThrottle(SlidingWindowRateThrottle, throttling.AnonRateThrottle):
+    pass
+
+class UserRateThrottle(SlidingWindowRateThrottle, throttling.UserRateThrottle):
+    pass
+
+class ScopedRateThrottle(SlidingWindowRateThrottle, throttling.ScopedRateThrottle):
+    def allow_request(self, request, view):
+        # Same scope lookup as DRF's ScopedRateThrottle, which can't be reused
+        # because it defers to the timestamp-list implementation
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
 
 class AdminThrottle(UserRateThrottle):
     scope = 'admin'
-    
+
     def allow_request(self, request, view):
         if request.user.is_authenticated and request.user.is_staff:
             self.scope = 'admin'
         else:
             self.scope = 'user'
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
         return super().allow_request(request, view)
 
 class PollCreationThrottle(UserRateThrottle):
     scope = 'poll_creation'
 
 class SignupThrottle(AnonRateThrottle):
-    scope = 'signup'
\ No newline at end of file
+    scope = 'signup'
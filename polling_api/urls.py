@@ -1,16 +1,22 @@
 from django.urls import path, include
-from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from django.conf import settings
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, PollViewSet, CustomTokenObtainPairView, CustomTokenRefreshView, signup, logout, forgot_password, reset_password
+from .async_views import AsyncPollViewSet
+from .views import UserViewSet, PollViewSet, CustomTokenObtainPairView, CustomTokenRefreshView, signup, logout, forgot_password, reset_password, cache_stats, metrics, results_stream
 
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
-router.register(r'polls', PollViewSet)
+if settings.ASYNC_VIEWS:
+    router.register(r'polls', AsyncPollViewSet)
+else:
+    router.register(r'polls', PollViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('polls/<int:pk>/results/stream/', results_stream, name='poll-results-stream'),
+    path('stats/cache/', cache_stats, name='cache_stats'),
+    path('metrics', metrics, name='metrics'),
     path('auth/signup/', signup, name='signup'),
     path('auth/logout/', logout, name='logout'),
     path('auth/forgot-password/', forgot_password, name='forgot_password'),
@@ -1,32 +1,39 @@
+import asyncio
+import hmac
+import json
 from rest_framework import permissions, viewsets, status
 from rest_framework.response import Response
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.models import User
 from .models import Poll, Option, Vote
-from .serializers import UserSerializer, PollSerializer, VoteSerializer, PollResultsSerializer
-from .permissions import IsPollCreatorOrAdmin, IsSelfOrAdmin
+from .serializers import UserSerializer, PollSerializer, VoteSerializer, PollAnalyticsQuerySerializer
+from .permissions import CanViewPollData, IsPollCreatorOrAdmin, IsSelfOrAdmin
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .utils import get_ip_hash
-from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from .cache import results_cache
+from .metrics import registry as metrics_registry, render_pool_metrics
+from . import conditional, counters, exports, pubsub, readers, replicas, rollups, voters
+from .renderers import CSVRenderer, NDJSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import PollFilter
-from rest_framework.throttling import ScopedRateThrottle
-from .throttles import AdminThrottle, PollCreationThrottle, SignupThrottle
-from django.utils.decorators import method_decorator
-from rest_framework_simplejwt.tokens import RefreshToken
+from .pagination import PollPagination, UserPagination
+from .throttles import AdminThrottle, PollCreationThrottle, ScopedRateThrottle, SignupThrottle
+from .blacklist import RefreshToken
+from .replicas import ReplicaReadsMixin
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.conf import settings
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     """
     API endpoints for Users CRUD
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserPagination
 
     def get_permissions(self):
         if self.action == 'list':
@@ -36,160 +43,335 @@ class UserViewSet(viewsets.ModelViewSet):
         else:
             permission_classes = [IsAuthenticated, IsSelfOrAdmin]
         return [permission() for permission in permission_classes]
-    
-    def create(self, request, *args, **kwargs):
-        self.throttle_classes = [SignupThrottle]
-        return super().create(request, *args, **kwargs)
-
-@method_decorator(name='list', decorator=swagger_auto_schema(
-    manual_parameters=[
-        openapi.Parameter(
-            'title',
-            openapi.IN_QUERY,
-            description='Filter by title',
-            type=openapi.TYPE_STRING
-        ),
-        openapi.Parameter(
-            'created_by',
-            openapi.IN_QUERY,
-            description='Filter by creator ID',
-            type=openapi.TYPE_INTEGER
-        ),
-        openapi.Parameter(
-            'is_ongoing',
-            openapi.IN_QUERY,
-            description='Filter ongoing polls',
-            type=openapi.TYPE_BOOLEAN
-        ),
-        ]
-    )
-)
-class PollViewSet(viewsets.ModelViewSet):
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [SignupThrottle()]
+        return super().get_throttles()
+
+class PollViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     """
     API endpoints for Polls CRUD
     """
-    queryset = Poll.objects.prefetch_related('options').all()
+    queryset = Poll.objects.prefetch_related('options').defer('results_snapshot')
     serializer_class = PollSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = PollFilter
+    pagination_class = PollPagination
+    lookup_value_regex = '[0-9]+'
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             permission_classes = [IsAuthenticated, IsPollCreatorOrAdmin]
+        elif self.action in ['export', 'analytics']:
+            permission_classes = [IsAuthenticated, CanViewPollData]
+        elif self.action == 'bulk_export':
+            permission_classes = [IsAuthenticated, IsAdminUser]
         else:
             permission_classes = [AllowAny]
         return [permission() for permission in permission_classes]
+
+    def get_throttles(self):
+        if self.action == 'create':
+            throttle_classes = [PollCreationThrottle]
+        elif self.action == 'vote':
+            self.throttle_scope = 'vote'
+            throttle_classes = [ScopedRateThrottle, AdminThrottle]
+        else:
+            return super().get_throttles()
+        return [throttle() for throttle in throttle_classes]
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        rows = self.get_list_rows(queryset)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(readers.serialize_polls(list(rows)))
+        if replicas.get_replica() is not None or not conditional.is_enabled():
+            # A lagging replica's page would be tagged with the versions of
+            # newer writes, and clients would keep it as current
+            return self.get_paginated_response(readers.serialize_polls(page))
+
+        versions = results_cache.get_versions([row['id'] for row in page])
+        etag = conditional.get_list_validator(request, versions)
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            response = self.get_paginated_response(readers.serialize_polls(page))
+        return conditional.add_validators(response, etag)
+
+    def get_list_rows(self, queryset):
+        """
+        Returns the polls as rows for the fast read path, keeping the search
+        rank that search results are paginated on
+        """
+        if 'search_rank' in queryset.query.annotations:
+            return readers.get_poll_rows(queryset, 'search_rank')
+        return readers.get_poll_rows(queryset)
+
+    def retrieve(self, request, *args, **kwargs):
+        def compute():
+            queryset = readers.get_poll_rows(self.filter_queryset(self.get_queryset()))
+            return readers.serialize_polls([get_object_or_404(queryset, pk=kwargs['pk'])])[0]
+
+        return self.get_cached_response('poll', int(kwargs['pk']), compute)
+
+    def get_cached_response(self, kind, poll_id, compute):
+        """
+        Returns the cached `kind` payload of the poll, or a 304 if the client
+        already has it. Archived polls may be cached by clients for CLOSED_POLL_MAX_AGE.
+        """
+        version = results_cache.get_version(poll_id, exists=Poll.objects.filter(pk=poll_id).exists)
+        if version is None:
+            raise Http404('No Poll matches the given query.')
+        etag = conditional.get_validator(self.request, kind, poll_id, version)
+        response = conditional.not_modified(self.request, etag)
+        if response is None:
+            # Payloads are cached under the version of the poll's last write,
+            # which a lagging replica may not have yet
+            with replicas.primary():
+                data = results_cache.get_or_set(kind, poll_id, compute, version=version)
+            response = Response(data)
+        else:
+            data = results_cache.peek(kind, poll_id, version)
+
+        def is_archived():
+            # Archiving bumps the version, so this is cached alongside the payloads
+            with replicas.primary():
+                return results_cache.get_or_set(
+                    'archived', poll_id, Poll.objects.filter(pk=poll_id, archived_at__isnull=False).exists,
+                    version=version,
+                )
+
+        return conditional.add_validators(response, etag, conditional.get_max_age(data, is_archived))
+
+    def perform_destroy(self, instance):
+        results_cache.invalidate(instance.id)
+        pubsub.publish_reset(instance.id)
+        super().perform_destroy(instance)
     
-    def create(self, request, *args, **kwargs):
-        self.throttle_classes = [PollCreationThrottle]
-        return super().create(request, *args, **kwargs)
-    
-    @swagger_auto_schema(
-        method='post',
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            required=['option'],
-            properties={
-                'option': openapi.Schema(type=openapi.TYPE_INTEGER, description='Option ID to vote for'),
-            }
-        )
-    )
     @action(detail=True, methods=['POST'])
     def vote(self, request, pk=None):
         """
         API endpoint for voting in a poll
         """
-        self.throttle_classes = [ScopedRateThrottle, AdminThrottle]
-        self.throttle_scope = 'vote'
-
-        poll = get_object_or_404(Poll, pk=pk)
-
         user = request.user
+        voter_id = None
         if not user or not user.is_authenticated or user.is_anonymous:
             user = None
             request.data['ip_hash'] = get_ip_hash(request.META['REMOTE_ADDR'])
-            
-            session_id = request.session.session_key
-            if not session_id:
-                request.session.create()
+
+            if settings.ANONYMOUS_VOTER_TOKENS:
+                session_id = voters.get_voter_id(request)
+                if not session_id:
+                    session_id = voter_id = voters.new_voter_id(request)
+            else:
                 session_id = request.session.session_key
+                if not session_id:
+                    request.session.create()
+                    session_id = request.session.session_key
             request.data['session_id'] = session_id
-        
-        serializer = VoteSerializer(data=request.data, context={'poll': poll, 'user': user})
+
+        serializer = VoteSerializer(data=request.data, context={'poll_id': int(pk), 'user': user})
         if serializer.is_valid():
-            serializer.save(poll=poll)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            if settings.VOTE_INGEST_MODE == 'buffered':
+                serializer.enqueue()
+                response = Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+            else:
+                serializer.save()
+                response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        else:
+            response = Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if voter_id:
+            voters.set_voter_token(response, voter_id)
+        return response
     
-    @swagger_auto_schema(
-        method='get',
-        responses={200: PollResultsSerializer}
-    )
     @action(detail=True, methods=['GET'])
     def results(self, request, pk=None):
         """
         API endpoint for viewing poll results
         """
-        poll = get_object_or_404(Poll, pk=pk)
-        serializer = PollResultsSerializer(poll)
-        return Response(serializer.data)
+        def compute():
+            return readers.serialize_results(get_object_or_404(readers.get_results_rows(Poll.objects.all()), pk=pk))
+
+        return self.get_cached_response('results', int(pk), compute)
+
+    @action(detail=True, methods=['GET'])
+    def analytics(self, request, pk=None):
+        """
+        API endpoint for a poll's votes per minute, hour or day, for its creator
+        """
+        poll = self.get_object()
+        query = PollAnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        granularity = query.validated_data['granularity']
+
+        mark = rollups.get_mark()
+        return Response({
+            'id': poll.id,
+            'granularity': granularity,
+            'rolled_up_at': mark.updated_at if mark else None,
+            'options': [{'id': opt.id, 'text': opt.text} for opt in sorted(poll.options.all(), key=lambda opt: opt.id)],
+            'buckets': rollups.get_histogram(
+                poll, granularity, query.validated_data.get('since'), query.validated_data.get('until'),
+            ),
+        })
+
+    @action(detail=True, methods=['GET'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request, pk=None):
+        """
+        API endpoint for exporting the votes or results of a poll as CSV or NDJSON
+        """
+        poll = self.get_object()
+        return self.get_export_response(Poll.objects.filter(pk=poll.pk), f'poll-{poll.pk}')
+
+    @action(
+        detail=False, methods=['GET'], url_path='export', renderer_classes=[CSVRenderer, NDJSONRenderer],
+        pagination_class=None,
+    )
+    def bulk_export(self, request):
+        """
+        API endpoint for exporting the votes or results of every poll matching the filters, for admins
+        """
+        polls = self.filter_queryset(Poll.objects.all())
+        return self.get_export_response(polls, 'polls')
+
+    def get_export_response(self, polls, name):
+        """
+        Streams the votes (or, with ?type=results, the results) of `polls` in
+        the negotiated format, reading the rows in chunks as they're sent
+        """
+        if self.request.query_params.get('type') == 'results':
+            columns, rows, name = exports.RESULT_COLUMNS, exports.result_rows(polls), f'{name}-results'
+        else:
+            columns, rows, name = exports.VOTE_COLUMNS, exports.vote_rows(polls), f'{name}-votes'
+
+        renderer = self.request.accepted_renderer
+        if renderer.format == 'ndjson':
+            content = exports.stream_ndjson(rows)
+        else:
+            content = exports.stream_csv(columns, rows)
+        if isinstance(self.request._request, ASGIRequest):
+            # The ASGI handler would read a sync iterator to the end before sending anything
+            content = exports.aiterate(content)
+        response = StreamingHttpResponse(content, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{name}.{renderer.format}"'
+        return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def cache_stats(request):
+    """
+    API endpoint for tuning the poll results cache
+    """
+    return Response(results_cache.stats())
+
+def metrics(request):
+    """
+    Prometheus endpoint for the request and connection pool metrics of this
+    process
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404('Metrics are disabled; set METRICS_TOKEN to enable them.')
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Invalid metrics token', status=401, content_type='text/plain')
+    return HttpResponse(metrics_registry.render() + render_pool_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Streaming Views
+
+def format_event(event_id, kind, data):
+    return f'id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n'
+
+async def take_snapshot(broker, poll_id, attempts=3):
+    """
+    Returns the poll's results and the id of the last event counted in them.
+
+    Votes publish their events once committed, so one landing while the
+    results are read may or may not be counted in them; the read is retried
+    until no event is published during it.
+    """
+    for _ in range(attempts):
+        before = broker.last_event_id(poll_id)
+        results = await counters.aget_results(poll_id)
+        snapshot_id = broker.last_event_id(poll_id)
+        if snapshot_id == before:
+            break
+    return snapshot_id, results
+
+async def stream_results(poll_id, subscription, send_snapshot):
+    """
+    Yields a results snapshot, then the poll's vote events as they land
+    """
+    broker = subscription.broker
+    try:
+        # Events up to the snapshot's id are already counted in it
+        snapshot_id = 0
+        if send_snapshot:
+            snapshot_id, results = await take_snapshot(broker, poll_id)
+            yield format_event(snapshot_id, 'snapshot', {'results': results})
+
+        while True:
+            try:
+                event_id, kind, data = await asyncio.wait_for(subscription.get(), settings.RESULTS_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+
+            if event_id <= snapshot_id:
+                continue
+            if kind == pubsub.RESET:
+                snapshot_id, results = await take_snapshot(broker, poll_id)
+                yield format_event(snapshot_id, 'snapshot', {'results': results})
+            else:
+                yield format_event(event_id, kind, {'deltas': data})
+    finally:
+        subscription.close()
+
+async def results_stream(request, pk):
+    """
+    API endpoint streaming live poll results as Server-Sent Events.
+
+    Sends a `snapshot` event with every option's count, then `votes` events
+    with the votes each option gained. Clients reconnecting with a
+    Last-Event-ID header resume from that event.
+    """
+    if not isinstance(request, ASGIRequest):
+        response = {'message': 'Results streaming is only available on the ASGI server'}
+        return JsonResponse(response, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    if not await Poll.objects.filter(pk=pk).aexists():
+        raise Http404('No Poll matches the given query.')
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+
+    subscription = pubsub.get_broker().subscribe(pk, last_event_id)
+    return StreamingHttpResponse(
+        stream_results(pk, subscription, send_snapshot=last_event_id is None),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
 # Auth Views
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     """
-    Custom TokenObtainPairView to add swagger documentation
+    Custom TokenObtainPairView, with a post of its own to hang the swagger documentation on (see swagger.py)
     """
-    @swagger_auto_schema(
-        tags=['auth'],
-        operation_summary='Login',
-        operation_description='Authenticate a user and get access & refresh tokens',
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            required=['username', 'password'],
-            properties={
-                'username': openapi.Schema(type=openapi.TYPE_STRING),
-                'password': openapi.Schema(type=openapi.TYPE_STRING),
-            }
-        )
-    )
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
 class CustomTokenRefreshView(TokenRefreshView):
     """
-    Custom TokenRefreshView to add swagger documentation
+    Custom TokenRefreshView, with a post of its own to hang the swagger documentation on (see swagger.py)
     """
-    @swagger_auto_schema(
-        tags=['auth'],
-        operation_summary='Refresh Token',
-        operation_description='Get a new access token using the refresh token',
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            required=['refresh'],
-            properties={
-                'refresh': openapi.Schema(type=openapi.TYPE_STRING),
-            }
-        )
-    )
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
-@swagger_auto_schema(
-    method='post',
-    tags=['auth'],
-    operation_summary='Signup',
-    operation_description='Create a new user account',
-    request_body=openapi.Schema(
-        type=openapi.TYPE_OBJECT,
-        required=['username', 'email', 'password'],
-        properties={
-            'username': openapi.Schema(type=openapi.TYPE_STRING),
-            'email': openapi.Schema(type=openapi.TYPE_STRING),
-            'password': openapi.Schema(type=openapi.TYPE_STRING),
-        }
-    )
-)
 @api_view(['POST'])
 def signup(request):
     """
@@ -201,19 +383,6 @@ def signup(request):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@swagger_auto_schema(
-    method='post',
-    tags=['auth'],
-    operation_summary='Logout',
-    operation_description='Logs out user by blacklisting the refresh token',
-    request_body=openapi.Schema(
-        type=openapi.TYPE_OBJECT,
-        required=['refresh_token'],
-        properties={
-            'refresh_token': openapi.Schema(type=openapi.TYPE_STRING),
-        }
-    )
-)
 @api_view(['POST'])
 def logout(request):
     """
@@ -234,21 +403,6 @@ def logout(request):
         response = {'message': 'Invalid refresh token'}
         return Response(response, status=status.HTTP_400_BAD_REQUEST)
 
-@swagger_auto_schema(
-    method='post',
-    tags=['auth'],
-    operation_summary='Forgot Password',
-    operation_description='Send an email with a link to reset your password',
-    request_body=openapi.Schema(
-        type=openapi.TYPE_OBJECT,
-        required=['email', 'front_end_url'],
-        properties={
-            'email': openapi.Schema(type=openapi.TYPE_STRING),
-            'front_end_url': openapi.Schema(type=openapi.TYPE_STRING, description='Frontend URL where user will reset password'),
-            'sender_email': openapi.Schema(type=openapi.TYPE_STRING, description='Email address to send the reset link from'),
-        }
-    )
-)
 @api_view(['POST'])
 def forgot_password(request):
     """
@@ -267,6 +421,9 @@ def forgot_password(request):
     user = get_object_or_404(User, email=email)
 
     try:
+        # Only this view sends mail, so the mail backend is loaded on first use
+        from django.core.mail import send_mail
+
         token = default_token_generator.make_token(user)
 
         send_mail(
@@ -283,21 +440,6 @@ def forgot_password(request):
         response = {'message': 'An error occurred'}
         return Response(response, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@swagger_auto_schema(
-    method='post',
-    tags=['auth'],
-    operation_summary='Reset Password',
-    operation_description='Reset user password using the token sent to their email',
-    request_body=openapi.Schema(
-        type=openapi.TYPE_OBJECT,
-        required=['token', 'uid', 'password'],
-        properties={
-            'token': openapi.Schema(type=openapi.TYPE_STRING, description='Token sent to user email'),
-            'uid': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID'),
-            'password': openapi.Schema(type=openapi.TYPE_STRING, description='New password'),
-        }
-    )
-)
 @api_view(['POST'])
 def reset_password(request):
     """
@@ -0,0 +1,53 @@
+import re
+import secrets
+from django.conf import settings
+from django.core import signing
+
+SALT = 'polling_api.voters'
+TOKEN_HEADER = 'X-Voter-Token'
+SESSION_KEY_RE = re.compile(r'^[a-z0-9]{32}$')
+
+
+def get_signer():
+    return signing.TimestampSigner(salt=SALT)
+
+def get_voter_id(request):
+    """
+    Returns the anonymous voter id carried by the request's signed voter cookie
+    or X-Voter-Token header, or None if it has none or its signature is invalid
+    """
+    token = request.COOKIES.get(settings.VOTER_COOKIE_NAME) or request.headers.get(TOKEN_HEADER)
+    if not token:
+        return None
+    try:
+        return get_signer().unsign(token, max_age=settings.VOTER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+def new_voter_id(request):
+    """
+    Returns an id for a voter without a token. Voters who still have a session
+    cookie from before tokens were enabled keep their session key, so their
+    earlier votes still count against them.
+    """
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+    if SESSION_KEY_RE.match(session_key):
+        return session_key
+    return secrets.token_hex(16)
+
+def set_voter_token(response, voter_id):
+    """
+    Hands the voter a signed token for `voter_id`, as a cookie for browsers and
+    in the X-Voter-Token header for other clients
+    """
+    token = get_signer().sign(voter_id)
+    response.set_cookie(
+        settings.VOTER_COOKIE_NAME,
+        token,
+        max_age=settings.VOTER_TOKEN_MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite='Lax',
+    )
+    response[TOKEN_HEADER] = token
+    return response
@@ -0,0 +1,9 @@
+from django.conf import settings
+from django.contrib import admin
+
+# With LEAN_STARTUP the admin app doesn't import the apps' admin modules at
+# startup, so they're registered here, on the first admin request
+if settings.LEAN_STARTUP:
+    admin.autodiscover()
+
+urlpatterns = admin.site.get_urls()
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import threading
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from drf_yasg import openapi
+from drf_yasg.generators import OpenAPISchemaGenerator
+from drf_yasg.renderers import OpenAPIRenderer
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+# Attaches the swagger documentation to the API views
+from polling_api import swagger  # noqa: F401
+
+api_info = openapi.Info(
+    title="Polls API",
+    default_version='v1',
+    description="API for creating and managing polls",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="shallomkanyori@gmail.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+schema_view = get_schema_view(
+    api_info,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+)
+
+
+def generate_schema():
+    """
+    Returns the OpenAPI document of the API as JSON bytes. It's generated
+    without a request, so it leaves out `host` and clients use the host
+    serving the docs.
+    """
+    schema = OpenAPISchemaGenerator(api_info).get_schema(request=None, public=True)
+    return OpenAPIRenderer().render(schema, renderer_context={})
+
+
+class SchemaCache:
+    """
+    Holds the OpenAPI document and its ETag for the life of the process.
+    Loads it from OPENAPI_SCHEMA_FILE when the build wrote one (see the
+    generate_schema command), or generates it on first use. DEBUG always
+    generates it, so local edits show up after the dev server reloads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._content = None
+        self._etag = None
+
+    def get(self):
+        if self._content is None:
+            with self._lock:
+                if self._content is None:
+                    content = self.load()
+                    self._etag = f'"schema-{hashlib.sha256(content).hexdigest()[:32]}"'
+                    self._content = content
+        return self._content, self._etag
+
+    def load(self):
+        path = settings.OPENAPI_SCHEMA_FILE
+        if path and not settings.DEBUG and os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        return generate_schema()
+
+
+schema_cache = SchemaCache()
+
+
+def openapi_schema(request):
+    """
+    Serves the cached OpenAPI document, or a 304 if the client has it already
+    """
+    content, etag = schema_cache.get()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def docs(request, *args, **kwargs):
+    """
+    Swagger UI, answering its `?format=openapi` requests from the cache too
+    """
+    if request.GET.get('format') in ('openapi', 'json'):
+        return openapi_schema(request)
+    return docs_ui(request, *args, **kwargs)
+
+
+docs_ui = schema_view.with_ui('swagger', cache_timeout=0)
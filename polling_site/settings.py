@@ -14,6 +14,7 @@ from pathlib import Path
 import environ
 import os
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 env = environ.Env(
     DEBUG=(bool, False)
@@ -37,6 +38,15 @@ DEBUG = env('DEBUG')
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '.vercel.app']
 
 
+# Cold starts
+# Defer what a JSON API on a serverless function doesn't need at startup: the
+# admin registers its ModelAdmins on the first admin request instead (see
+# polling_site.admin_urls). The docs views are imported on their first request
+# either way.
+LEAN_STARTUP = env.bool('LEAN_STARTUP', default=False)
+# Milliseconds `manage.py profile_startup` allows a cold start to take; 0 to not check
+STARTUP_TIME_BUDGET = env.float('STARTUP_TIME_BUDGET', default=1500)
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -53,16 +63,18 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt.token_blacklist',
     'polling_api',
 ]
+if LEAN_STARTUP:
+    INSTALLED_APPS[INSTALLED_APPS.index('django.contrib.admin')] = 'django.contrib.admin.apps.SimpleAdminConfig'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'polling_api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.ScopedRateThrottle',
+        'polling_api.throttles.AnonRateThrottle',
+        'polling_api.throttles.UserRateThrottle',
+        'polling_api.throttles.ScopedRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '5/minute',
@@ -74,8 +86,15 @@ REST_FRAMEWORK = {
     },
 }
 
+# Pagination
+# Default page size of the poll and user listings
+PAGE_SIZE = env.int('PAGE_SIZE', default=20)
+# Largest page a client can request with ?page_size=
+MAX_PAGE_SIZE = env.int('MAX_PAGE_SIZE', default=100)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'TOKEN_REFRESH_SERIALIZER': 'polling_api.blacklist.TokenRefreshSerializer',
 }
 
 SWAGGER_SETTINGS = {
@@ -87,10 +106,16 @@ SWAGGER_SETTINGS = {
         }
     },
     'USE_SESSION_AUTH': False,
+    'SPEC_URL': 'schema-json',
 }
 
+# OpenAPI document written at build time by `manage.py generate_schema` and
+# served by /api/docs/openapi.json; generated on first request if missing
+OPENAPI_SCHEMA_FILE = env('OPENAPI_SCHEMA_FILE', default=os.path.join(BASE_DIR, 'polling_site', 'openapi.json'))
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'polling_api.middleware.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -118,6 +143,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'polling_site.wsgi.application'
+ASGI_APPLICATION = 'polling_site.asgi.application'
+
+# Serve the poll list, retrieve, vote and results endpoints with native async
+# views; only worth enabling behind the ASGI server
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
 
 
 # Database
@@ -127,6 +157,53 @@ DATABASES = {
     'default': env.db()
 }
 
+# Read replicas
+# Comma-separated URLs of read replicas of the default database. Safe requests
+# to the poll and user endpoints read from one of them, except from clients
+# that wrote in the last READ_YOUR_WRITES_WINDOW seconds (see
+# polling_api.replicas). Tests read the default database instead.
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), 1):
+    DATABASES[f'replica_{number}'] = {**env.db_url_config(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['polling_api.replicas.ReplicaRouter']
+READ_YOUR_WRITES_WINDOW = env.int('READ_YOUR_WRITES_WINDOW', default=10)
+READ_YOUR_WRITES_COOKIE = 'read_primary_until'
+
+# Connections
+# With DB_POOL, each process keeps a psycopg 3 pool of Postgres connections
+# per database and requests borrow one instead of connecting (TLS and auth
+# included). Without it, DB_CONN_MAX_AGE keeps a thread's connection open for
+# that many seconds; 0 closes it after every request. Health checks test a
+# reused connection before handing it out.
+DB_POOL = env.bool('DB_POOL', default=False)
+for database in DATABASES.values():
+    database['CONN_HEALTH_CHECKS'] = env.bool('DB_CONN_HEALTH_CHECKS', default=False)
+    if DB_POOL:
+        if database['ENGINE'] != 'django.db.backends.postgresql':
+            raise ImproperlyConfigured('DB_POOL requires PostgreSQL database URLs')
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+            # Seconds a request waits for a free connection before failing
+            'timeout': env.float('DB_POOL_TIMEOUT', default=10),
+            # Requests allowed to wait at once (0 for no limit)
+            'max_waiting': env.int('DB_POOL_MAX_WAITING', default=0),
+            # Seconds before idle connections above min_size are closed, and
+            # before any connection is replaced
+            'max_idle': env.float('DB_POOL_MAX_IDLE', default=300),
+            'max_lifetime': env.float('DB_POOL_MAX_LIFETIME', default=3600),
+        }
+    else:
+        database['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=database.get('CONN_MAX_AGE', 0))
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -176,4 +253,119 @@ EMAIL_PORT = env.int('EMAIL_PORT', default=587)
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
-DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
\ No newline at end of file
+DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Vote counters
+# Number of rows each option's vote count is split across
+VOTE_COUNTER_SHARDS = env.int('VOTE_COUNTER_SHARDS', default=8)
+
+# Metrics
+# Record per-request timings and query counts, served at /api/metrics
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=True)
+# Bearer token Prometheus must send to read /api/metrics; unset disables the endpoint
+METRICS_TOKEN = env('METRICS_TOKEN', default=None)
+
+# Rate limiting
+# Cache holding the throttle counters; point CACHE_URL at a shared cache
+# (e.g. Redis) so limits hold across processes
+THROTTLE_CACHE_ALIAS = 'default'
+
+# JWT user cache
+# Seconds the user behind an access token is cached instead of loaded on
+# every request; 0 disables the cache. Saving or deleting a user evicts it.
+JWT_USER_CACHE_TIMEOUT = env.int('JWT_USER_CACHE_TIMEOUT', default=0)
+# Cache holding the users; must be shared by every process (e.g. Redis) for
+# evictions to reach all of them
+JWT_USER_CACHE_ALIAS = 'default'
+
+# Refresh token blacklist
+# Cache used to tell other processes a token was just blacklisted; share it
+# between processes (e.g. Redis) so logouts take effect everywhere at once.
+# With several processes and no shared cache, refreshes query the database.
+JWT_BLACKLIST_CACHE_ALIAS = 'default'
+# Seconds between checks for tokens blacklisted without going through
+# logout, e.g. from the admin
+JWT_BLACKLIST_SYNC_INTERVAL = env.int('JWT_BLACKLIST_SYNC_INTERVAL', default=30)
+# Blacklisted tokens the in-memory filter is sized for before it's rebuilt larger
+JWT_BLACKLIST_CAPACITY = env.int('JWT_BLACKLIST_CAPACITY', default=100000)
+# Tokens remembered as not blacklisted after a false positive of the filter
+JWT_BLACKLIST_KNOWN_GOOD_SIZE = env.int('JWT_BLACKLIST_KNOWN_GOOD_SIZE', default=10000)
+# Outstanding tokens deleted per transaction by purge_expired_tokens
+JWT_PURGE_CHUNK_SIZE = env.int('JWT_PURGE_CHUNK_SIZE', default=1000)
+
+# Results cache
+RESULTS_CACHE_ALIAS = 'default'
+# Seconds a cached poll payload lives without being invalidated
+RESULTS_CACHE_TIMEOUT = env.int('RESULTS_CACHE_TIMEOUT', default=60)
+# Seconds a poll's version is kept after its last change. An expired version
+# is recreated, orphaning the payloads cached under the old one, so keep it
+# well above RESULTS_CACHE_TIMEOUT.
+RESULTS_CACHE_VERSION_TIMEOUT = env.int('RESULTS_CACHE_VERSION_TIMEOUT', default=24 * 60 * 60)
+# Number of payloads kept in each process's in-memory LRU
+RESULTS_CACHE_LOCAL_SIZE = env.int('RESULTS_CACHE_LOCAL_SIZE', default=1024)
+# Worker processes expected to serve the API. Versions must be shared
+# between them, so more than one needs a shared cache such as Redis.
+WEB_CONCURRENCY = env.int('WEB_CONCURRENCY', default=1)
+# Whether the API runs on a serverless platform, which starts as many
+# instances as the traffic needs, each its own process. Vercel sets VERCEL.
+SERVERLESS = env.bool('SERVERLESS', default=bool(os.environ.get('VERCEL')))
+
+# Anonymous voters
+# Identify anonymous voters with a signed cookie or X-Voter-Token header
+# instead of creating a database session for each of them
+ANONYMOUS_VOTER_TOKENS = env.bool('ANONYMOUS_VOTER_TOKENS', default=False)
+VOTER_COOKIE_NAME = 'voter'
+# Seconds a voter token stays valid
+VOTER_TOKEN_MAX_AGE = env.int('VOTER_TOKEN_MAX_AGE', default=365 * 24 * 60 * 60)
+
+# Closed polls
+# Seconds after expiry before a poll's results are frozen, so votes in flight
+# (e.g. in the vote buffer) still land
+RESULTS_FINALIZE_DELAY = env.int('RESULTS_FINALIZE_DELAY', default=60)
+# Seconds clients and proxies may cache the details and results of a closed poll
+CLOSED_POLL_MAX_AGE = env.int('CLOSED_POLL_MAX_AGE', default=24 * 60 * 60)
+
+# Vote archival
+# Days after expiry before a poll's raw votes are rolled up into daily
+# per-option totals and deleted
+VOTE_RETENTION_DAYS = env.int('VOTE_RETENTION_DAYS', default=90)
+# Raw votes deleted per transaction while archiving
+VOTE_ARCHIVE_CHUNK_SIZE = env.int('VOTE_ARCHIVE_CHUNK_SIZE', default=1000)
+# Rows fetched per round trip while streaming exports
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=2000)
+
+# Vote analytics
+# Processes ingesting votes count them into the per-minute, hour and day
+# rollups at most every this many seconds
+VOTE_ROLLUP_INTERVAL = env.int('VOTE_ROLLUP_INTERVAL', default=10)
+# Votes rolled up per transaction
+VOTE_ROLLUP_BATCH_SIZE = env.int('VOTE_ROLLUP_BATCH_SIZE', default=1000)
+
+# Vote ingestion
+# 'sync' saves each vote in its own transaction; 'buffered' acknowledges votes
+# and saves them in batches from a background thread
+VOTE_INGEST_MODE = env('VOTE_INGEST_MODE', default='sync')
+# Votes that can wait in the buffer before voters get a 503
+VOTE_BUFFER_SIZE = env.int('VOTE_BUFFER_SIZE', default=10000)
+# Largest batch saved in one transaction
+VOTE_BUFFER_BATCH_SIZE = env.int('VOTE_BUFFER_BATCH_SIZE', default=500)
+# Seconds the oldest buffered vote waits before a partial batch is saved
+VOTE_BUFFER_MAX_AGE = env.float('VOTE_BUFFER_MAX_AGE', default=0.5)
+# Seconds a poll's options and expiry date are cached for validating buffered votes
+VOTE_BUFFER_META_TIMEOUT = env.int('VOTE_BUFFER_META_TIMEOUT', default=5)
+# Times a batch that failed to save is retried before its votes are logged
+# and dropped, waiting VOTE_BUFFER_RETRY_DELAY seconds, doubled each time
+VOTE_BUFFER_RETRIES = env.int('VOTE_BUFFER_RETRIES', default=3)
+VOTE_BUFFER_RETRY_DELAY = env.float('VOTE_BUFFER_RETRY_DELAY', default=0.5)
+
+# Live results stream
+# Broker fanning vote events out to stream subscribers; swap in a shared
+# backend when running more than one ASGI process
+RESULTS_STREAM_BROKER = env('RESULTS_STREAM_BROKER', default='polling_api.pubsub.InProcessBroker')
+# Events kept per poll for clients resuming with Last-Event-ID
+RESULTS_STREAM_HISTORY = env.int('RESULTS_STREAM_HISTORY', default=256)
+# Polls whose event history is kept, most recently active first; polls
+# with subscribers are always kept
+RESULTS_STREAM_MAX_POLLS = env.int('RESULTS_STREAM_MAX_POLLS', default=1024)
+# Seconds between heartbeat comments on idle streams
+RESULTS_STREAM_HEARTBEAT = env.int('RESULTS_STREAM_HEARTBEAT', default=15)
\ No newline at end of file